@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+
+"""
+Local stand-in for ADS-B Exchange's REST API as queried by LiveTraffic's
+ADSBExchangeConnection::GetURL, both the ADSBEx and the RapidAPI variant:
+    /api/aircraft/json/lat/<lat>/lon/<lon>/dist/<nm>/
+
+Answers are served from recorded snapshots, either historic files
+(see ConvADSBExHist.py) or REST answers like REST/ADSBExchange.json.
+A virtual clock advances through the snapshots, each query is answered
+from the snapshot current at that virtual time by a spatial grid index.
+
+To use it, point ADSBEX_URL (or ADSBEX_RAPIDAPI_25_URL) to
+    http://localhost:8082/api/aircraft/json/lat/%f/lon/%f/dist/%d/
+
+For usage info call
+    python3 ADSBExServer.py -h
+
+
+MIT License
+
+Copyright (c) 2021 B.Hoppe
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import sys
+import os
+import io
+import re
+import json
+import time
+import argparse                     # handling command line arguments
+from functools import lru_cache
+
+_here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_here, '..'))
+sys.path.insert(0, os.path.join(_here, '..', '..', 'Resources'))
+from StandInHttp import addServerArgs, serve, VirtualClock, HTTP_OK, HTTP_NOT_FOUND, HTTP_UNAUTHORIZED, CT_JSON, CT_TEXT
+from StandInGrid import GridIndex, KM_PER_NM
+from SendTraffic import openInput
+from ConvADSBExHist import iterJsonArray, listInputs, fileTimestamp
+
+RE_QUERY = re.compile(r'/api/aircraft/json/lat/([-+0-9.]+)/lon/([-+0-9.]+)/dist/([0-9.]+)/?$')
+
+# Historic/VRS field names -> REST API field names (ADSBEX_* in LTADSBEx.h)
+_REST_NAMES = {'Icao': 'icao', 'Lat': 'lat', 'Long': 'lon', 'Alt': 'alt', 'GAlt': 'galt', 'Trak': 'trak',
+               'Gnd': 'gnd', 'PosTime': 'postime', 'Spd': 'spd', 'Vsi': 'vsi', 'Reg': 'reg', 'Cou': 'cou',
+               'Type': 'type', 'Mil': 'mil', 'OpIcao': 'opicao', 'Call': 'call', 'Sqk': 'sqk', 'Trt': 'trt',
+               'From': 'from', 'To': 'to', 'Mdl': 'mdl', 'Man': 'man'}
+
+""" === One snapshot ===
+    The REST API returns all values as strings, booleans as "1"/"0".
+    Each aircraft is rendered into its JSON text once when loading,
+    answers then only join the texts of the aircraft found.
+    The position time is left as '%d' placeholder in the text, so that
+    answers can shift it to the wall clock (LiveTraffic drops positions
+    older than its simulated time).
+"""
+def _restValue(v) -> str:
+    if isinstance(v, bool):
+        return '1' if v else '0'
+    return str(v)
+
+def restAircraft(ac: dict) -> dict:
+    if 'icao' in ac:                            # already REST format
+        return {k: _restValue(v) for k, v in ac.items() if v is not None}
+    return {_REST_NAMES[k]: _restValue(v) for k, v in ac.items() if k in _REST_NAMES and v is not None}
+
+class Snapshot:
+    def __init__(self, ts: float, acs: list):
+        self.ts = ts
+        acs = [a for a in acs if a.get('lat') and a.get('lon')]
+        self.texts = []
+        self.posTimes = []                      # per aircraft: postime [ms] or None
+        for a in acs:
+            posTime = a.get('postime')
+            text = json.dumps({k: v for k, v in a.items() if k != 'postime'}, separators=(',', ':')).replace('%', '%%')
+            if posTime is not None:
+                text = text[:-1] + ',"postime":"%d"}'
+                posTime = int(float(posTime))
+            self.texts.append(text)
+            self.posTimes.append(posTime)
+        self.grid = GridIndex([float(a['lat']) for a in acs], [float(a['lon']) for a in acs])
+
+    def query(self, lat: float, lon: float, dist_nm: float) -> list:
+        return self.grid.queryRadius(lat, lon, dist_nm * KM_PER_NM)
+
+""" === Load a snapshot file ===
+    Historic files ("acList") keep only the newest position per aircraft,
+    the snapshot's time is the file's minute or the newest position time.
+"""
+def loadSnapshot(path: str) -> Snapshot:
+    with io.TextIOWrapper(openInput(path), encoding='utf-8') as f:
+        key = 'acList' if '"acList"' in f.read(4096) else 'ac'
+    acs = {}
+    newest = 0
+    with io.TextIOWrapper(openInput(path), encoding='utf-8') as f:
+        for ac in iterJsonArray(f, key):
+            ac = restAircraft(ac)
+            icao = ac.get('icao')
+            posTime = float(ac.get('postime', 0) or 0)
+            newest = max(newest, posTime)
+            if icao and (icao not in acs or posTime > float(acs[icao].get('postime', 0) or 0)):
+                acs[icao] = ac
+    ts = fileTimestamp(path) or newest / 1000.0 or os.path.getmtime(path)
+    return Snapshot(ts, list(acs.values()))
+
+""" === Answer queries from the snapshot current at the virtual time ===
+    Timestamps are shifted by the difference between wall clock and virtual
+    time, unless keepTimes is set.
+"""
+class SnapshotServer:
+    def __init__(self, snaps: list, speed: float, apiKey: str, rateLimit: int, keepTimes: bool):
+        self.snaps = sorted(snaps, key=lambda s: s.ts)
+        self.clock = VirtualClock([s.ts for s in self.snaps], speed)
+        self.keepTimes = keepTimes
+        self.apiKey = apiKey
+        self.rateLimit = rateLimit
+        self.numReq = 0
+
+    # answers are cached per snapshot and query, LiveTraffic repeats the same query as long as the user doesn't move
+    @lru_cache(maxsize=1024)
+    def answer(self, snapIdx: int, lat: float, lon: float, dist: float) -> tuple:
+        snap = self.snaps[snapIdx]
+        idx = snap.query(lat, lon, dist)
+        posTimes = tuple(snap.posTimes[i] for i in idx if snap.posTimes[i] is not None)
+        return ','.join(snap.texts[i] for i in idx).encode('utf-8'), posTimes, len(idx)
+
+    def handle(self, path: str, query: dict, hdr: dict):
+        m = RE_QUERY.search(path)
+        if not m:
+            return HTTP_NOT_FOUND, b'', CT_TEXT
+        rapid = 'x-rapidapi-key' in hdr
+
+        # key check, answering like the real services
+        if self.apiKey:
+            if rapid and hdr['x-rapidapi-key'] != self.apiKey:
+                return HTTP_OK, b'{"message":"Key doesn\'t exists"}', CT_JSON
+            if not rapid and hdr.get('api-auth') != self.apiKey:
+                return HTTP_UNAUTHORIZED, b'{"msg":"You need a key."}', CT_JSON
+
+        self.numReq += 1
+        snapIdx, vt = self.clock.current()
+        acs, posTimes, num = self.answer(snapIdx, float(m.group(1)), float(m.group(2)), float(m.group(3)))
+        shift = 0 if self.keepTimes else int((time.time() - vt) * 1000)
+        acs %= tuple(t + shift for t in posTimes)
+        body = b'{"ac":[%s],"total":%d,"ctime":%d,"ptime":0}' % (acs, num, int(vt * 1000) + shift)
+        if rapid:
+            return HTTP_OK, body, CT_JSON, {'X-RateLimit-Requests-Limit': self.rateLimit,
+                                            'X-RateLimit-Requests-Remaining': max(self.rateLimit - self.numReq, 0)}
+        return HTTP_OK, body, CT_JSON
+
+""" === MAIN === """
+def main():
+    # --- Handling command line argumens ---
+    parser = argparse.ArgumentParser(description='ADSBExServer 1.0.0: Local stand-in for ADS-B Exchange\'s REST API (including the RapidAPI variant), '
+        'answering LiveTraffic\'s radius queries from recorded snapshots to benchmark the ADSBEx channel without network.',fromfile_prefix_chars='@')
+    parser.add_argument('inFile', help='Snapshots: historic files (yyyy-mm-dd-hhmmZ.json) or REST answers, optionally compressed, or directories thereof', nargs='+')
+    parser.add_argument('--speed', metavar='FACTOR', help='Speed of the virtual clock compared to real time, defaults to 1', type=float, default=1.0)
+    parser.add_argument('--apiKey', metavar='KEY', help='Require this key in the api-auth or X-RapidAPI-Key header')
+    parser.add_argument('--rateLimit', metavar='NUM', help='RapidAPI: reported request limit, defaults to 10000', type=int, default=10000)
+    parser.add_argument('--keepTimes', help='Answer with the recorded timestamps instead of shifting them to the current time. '
+        'LiveTraffic then drops all positions as outdated', action='store_true')
+    addServerArgs(parser, 8082)
+
+    args = parser.parse_args()
+
+    t0 = time.monotonic()
+    snaps = []
+    for path in listInputs(args.inFile):
+        snaps.append(loadSnapshot(path))
+        if args.verbose:
+            print ("{}: {} aircraft at {:.0f}".format(path, len(snaps[-1].grid), snaps[-1].ts))
+    if not snaps:
+        parser.error('No snapshots found')
+    print ("Loaded {} snapshots with {} aircraft in {:.1f}s".format(
+        len(snaps), sum(len(s.grid) for s in snaps), time.monotonic() - t0))
+
+    serve(SnapshotServer(snaps, args.speed, args.apiKey, args.rateLimit, args.keepTimes).handle, args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/python3
+
+"""
+Memory-mapped database files with a sorted key index, shared by
+AcMasterDb.py (OpenSky aircraft master data) and OGNDevDb.py (OGN devices).
+
+Such a file starts with a header beginning with an 8 byte magic, followed
+by the sorted uint32 keys (little-endian, 4-byte aligned) and the file's
+own record data. Opening a file only maps it, the keys are used right from
+the mapped file, and lookups are binary searches over them.
+
+
+MIT License
+
+Copyright (c) 2021 B.Hoppe
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import sys
+import os
+import mmap
+import time
+import random
+import bisect
+from array import array
+
+def align4(n: int) -> int:
+    return (n + 3) & ~3
+
+""" === Write a database file ===
+    Parts are written in order, all but the last padded to a multiple of
+    4 bytes, so that the key array and record arrays stay aligned. The file
+    is written under a temporary name first, so that readers never see a
+    half-written database.
+"""
+def keysToBytes(keys) -> bytes:
+    keys = array('I', keys)
+    if sys.byteorder != 'little':
+        keys.byteswap()
+    return keys.tobytes()
+
+def writeDb(dbPath: str, parts: list):
+    tmpPath = dbPath + '.tmp'
+    with open(tmpPath, 'wb') as f:
+        for p in parts[:-1]:
+            f.write(p.ljust(align4(len(p)), b'\0'))
+        f.write(parts[-1])
+    os.replace(tmpPath, dbPath)
+
+""" === Mapped database file ===
+    Checks the header's magic, subclasses unpack the rest of the header
+    from self.hdr and call mapKeys() with the position of the key array.
+"""
+class MappedIndex:
+    def __init__(self, path: str, hdr, magic: bytes, kind: str):
+        self.file = open(path, 'rb')
+        self.keys = None
+        self.numRec = 0
+        try:
+            self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:                      # empty file
+            self.file.close()
+            raise ValueError("{} is not {}".format(path, kind))
+        if len(self.mm) < hdr.size or self.mm[0:len(magic)] != magic:
+            self.close()
+            raise ValueError("{} is not {}".format(path, kind))
+        self.hdr = hdr.unpack_from(self.mm, 0)[1:]
+
+    # the keys are used right from the mapped file, unless byte order differs
+    def mapKeys(self, pos: int, numRec: int) -> int:
+        self.numRec = numRec
+        if sys.byteorder == 'little':
+            self.keys = memoryview(self.mm)[pos:pos + 4*numRec].cast('I')
+        else:
+            self.keys = array('I', self.mm[pos:pos + 4*numRec])
+            self.keys.byteswap()
+        return pos + 4*numRec
+
+    def close(self):
+        if isinstance(self.keys, memoryview):
+            self.keys.release()
+        self.mm.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.numRec
+
+    # index of the key, or -1
+    def find(self, key: int) -> int:
+        i = bisect.bisect_left(self.keys, key)
+        return i if i < self.numRec and self.keys[i] == key else -1
+
+""" === Benchmark for the --bench option ===
+    Half of the ids exist (keys masked by 'idMask'), half are random 24 bit ids.
+    Returns the ids, so that further lookup functions can be measured with them.
+"""
+def benchLookups(db: MappedIndex, num: int, lookup, tOpen: float, idMask: int = 0xFFFFFF) -> list:
+    ids = [db.keys[random.randrange(len(db))] & idMask for _ in range(num // 2)] + \
+          [random.randrange(0x1000000) for _ in range(num - num // 2)]
+    t0 = time.perf_counter()
+    hits = sum(1 for i in ids if lookup(i) is not None)
+    tLookup = time.perf_counter() - t0
+    print ("Opened in {:.3f}ms, {} records".format(tOpen * 1000, len(db)))
+    print ("Lookups: {:.0f}/s ({} hits)".format(len(ids) / tLookup, hits))
+    return ids
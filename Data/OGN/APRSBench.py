@@ -0,0 +1,234 @@
+#!/usr/bin/python3
+
+"""
+Benchmark of APRS position parsing as done by LiveTraffic's
+OpenGliderConnection::APRSProcessLine, which matches one large regular
+expression per line.
+
+Compares the regex parser (parsePos, the plugin's expression) with the
+slicing parser (parsePosFast, fixed offsets with regex fallback) of
+APRSClient.py:
+- lines/s of each parser, on single lines or in place in one buffer
+  like APRSClient does,
+- memory allocated per record (tracemalloc: bytes and blocks kept),
+- parity: both parsers must return the same record for every line.
+
+The corpus is a file of APRS lines, recorded (e.g. by APRS_Test.py, the
+running numbers in front are removed) or generated here:
+    python3 APRSBench.py --generate 2000000 corpus.txt.gz
+    python3 APRSBench.py --parity corpus.txt.gz
+
+For usage info call
+    python3 APRSBench.py -h
+
+
+MIT License
+
+Copyright (c) 2021 B.Hoppe
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import sys
+import os
+import gzip
+import time
+import random
+import argparse                     # handling command line arguments
+import tracemalloc
+
+_here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_here, '..', '..', 'Resources'))
+from SendTraffic import openInput
+from APRSClient import parsePos, parsePosFast
+from APRSServer import GliderFleet
+
+PARSERS = {'regex': parsePos, 'fast': parsePosFast}
+BLOCK_LINES = 200000
+
+""" === Generate a synthetic corpus ===
+    Gliders in all four quadrants (N/S, E/W), mixed with what else comes
+    along in the stream: receiver beacons, server comments, stealth and
+    static senders, lines without vertical speed, and near misses which
+    must not match or have to take the regex fallback.
+"""
+_CENTRES = ((49.8, 7.9), (-33.9, 151.2), (40.0, -105.2), (-34.6, -58.4))
+
+def _variant(ln: bytes, rnd: random.Random) -> bytes:
+    r = rnd.random()
+    if r < 0.03:                                            # no vertical speed
+        i = ln.index(b'fpm')
+        return ln[:ln.rindex(b' ', 0, i) + 1] + ln[ln.index(b' ', i) + 1:]
+    if r < 0.04:                                            # stealth mode
+        return ln.replace(b' id06', b' id86', 1)
+    if r < 0.05:                                            # static object
+        return ln.replace(b' id06', b' id3E', 1)
+    if r < 0.06:                                            # other symbol table, zulu time
+        return ln.replace(b'h', b'z', 1).replace(b'/', b'\\', 2).replace(b'\\', b'/', 1)
+    if r < 0.065:                                           # 8 digit id
+        return ln.replace(b'! id06', b'! id0600', 1)
+    if r < 0.07:                                            # near misses
+        return rnd.choice((ln[:rnd.randint(10, len(ln) - 1)],                       # truncated
+                           ln.replace(b'/A=', b'/A:', 1),                           # broken altitude
+                           ln.replace(b'! id06', b'! id0', 1),                      # short details
+                           ln.lower(),                                              # lower case id
+                           b'X>APRS,qAS,Y::/x ' + ln[ln.index(b':/'):],             # ':/' earlier
+                           ln.replace(b'fpm', b'fpx', 1)))                          # no fpm unit
+    return ln
+
+def generate(path: str, num: int, seed: int):
+    rnd = random.Random(seed)
+    fleets = [GliderFleet(1000, lat, lon, 200.0, seed + i) for i, (lat, lon) in enumerate(_CENTRES)]
+    now = time.time()
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'wb') as f:
+        n = 0
+        while n < num:
+            fleet = fleets[n // 1000 % len(fleets)]
+            batch = fleet.batch(n, min(1000, num - n), now + n / 1000.0)
+            out = []
+            for ln in batch.lines:
+                r = rnd.random()
+                if r < 0.05:
+                    out.append(b'EDER>APRS,TCPIP*,qAC,GLIDERN1:>%sh v0.2.8.RPI-GPU CPU:0.3 RAM:485.5/970.5MB NTP:0.4ms/-6.3ppm +44.5C\r\n' %
+                               time.strftime('%H%M%S', time.gmtime(now)).encode('ascii'))
+                elif r < 0.06:
+                    out.append(b'# aprsc 2.1.8-standin 22 Mar 2021 21:09:09 GMT GLIDERN0 127.0.0.1:14580\r\n')
+                out.append(_variant(ln.rstrip(b'\r\n'), rnd) + b'\r\n')
+            f.writelines(out)
+            n += len(batch.lines)
+    print ("Generated {} position lines plus beacons and comments into {}".format(num, path))
+
+""" === Read the corpus in blocks of lines === """
+def readBlocks(paths: list, maxLines: int):
+    num = 0
+    for path in paths:
+        with openInput(path) as f:
+            block = []
+            for ln in f:
+                ln = ln.rstrip(b'\r\n')
+                i = ln.find(b'. ')                          # APRS_Test.py output has running numbers
+                if 0 < i < 10 and ln[:i].isdigit():
+                    ln = ln[i+2:]
+                block.append(ln)
+                num += 1
+                if len(block) >= BLOCK_LINES or num == maxLines:
+                    yield block
+                    block = []
+                    if num == maxLines:
+                        return
+            if block:
+                yield block
+
+""" === Measurements === """
+def timeLines(parse, lines: list, now: float) -> float:
+    t0 = time.perf_counter()
+    for ln in lines:
+        parse(ln, 0, None, now)
+    return time.perf_counter() - t0
+
+# like APRSClient: all lines in one buffer, parsed in place
+def timeBuffer(parse, buf: bytearray, now: float) -> float:
+    t0 = time.perf_counter()
+    start = 0
+    i = buf.find(b'\n')
+    while i >= 0:
+        parse(buf, start, i, now)
+        start = i + 1
+        i = buf.find(b'\n', start)
+    return time.perf_counter() - t0
+
+# bytes and memory blocks kept for the records, not counting the
+# background thread decompressing the corpus (see SendTraffic.openInput)
+def measureAlloc(parse, lines: list, now: float) -> tuple:
+    for ln in lines[:1000]:                             # warm up caches first
+        parse(ln, 0, None, now)
+    tracemalloc.start()
+    recs = [parse(ln, 0, None, now) for ln in lines]
+    snap = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, openInput.__code__.co_filename),
+        tracemalloc.Filter(False, tracemalloc.__file__)))
+    tracemalloc.stop()
+    stats = snap.statistics('filename')
+    n = max(sum(1 for r in recs if r), 1)
+    return sum(st.size for st in stats) / n, sum(st.count for st in stats) / n, n
+
+""" === MAIN === """
+def main():
+    # --- Handling command line argumens ---
+    parser = argparse.ArgumentParser(description='APRSBench 1.0.0: Benchmarks the APRS position parsers (plugin regex vs. slicing) '
+        'for speed, allocations, and parity on a corpus of APRS lines.',fromfile_prefix_chars='@')
+    parser.add_argument('inFile', help='Corpus: file(s) of APRS lines, optionally compressed', nargs='+')
+    parser.add_argument('--generate', metavar='NUM', help='Generate a synthetic corpus of NUM position lines into the (single) inFile and exit', type=int)
+    parser.add_argument('--seed', metavar='NUM', help='Random seed for --generate', type=int, default=0)
+    parser.add_argument('--maxLines', metavar='NUM', help='Use only the first NUM lines', type=int, default=0)
+    parser.add_argument('--parser', help='Parser(s) to measure, defaults to all', choices=list(PARSERS), action='append')
+    parser.add_argument('--buffer', help='Also measure parsing in place in one buffer like APRSClient', action='store_true')
+    parser.add_argument('--alloc', metavar='NUM', help='Measure memory allocated for the records of the first NUM lines, defaults to 100000', type=int, default=100000)
+    parser.add_argument('--parity', help='Compare the results of all parsers line by line', action='store_true')
+    parser.add_argument('-v', '--verbose', help='Show lines without parity', action='store_true')
+
+    args = parser.parse_args()
+    if args.generate:
+        generate(args.inFile[0], args.generate, args.seed)
+        return
+
+    parsers = {n: PARSERS[n] for n in (args.parser or PARSERS)}
+    now = time.time()
+    tLines = dict.fromkeys(parsers, 0.0)
+    tBuf = dict.fromkeys(parsers, 0.0)
+    numLines = numPos = numDiff = 0
+    alloc = None
+    for block in readBlocks(args.inFile, args.maxLines):
+        numLines += len(block)
+        if alloc is None and args.alloc:
+            alloc = {n: measureAlloc(p, block[:args.alloc], now) for n, p in parsers.items()}
+        for n, p in parsers.items():
+            tLines[n] += timeLines(p, block, now)
+        if args.buffer:
+            buf = bytearray(b'\n'.join(block) + b'\n')
+            for n, p in parsers.items():
+                tBuf[n] += timeBuffer(p, buf, now)
+        if args.parity or len(parsers) == 1:
+            ref = list(parsers.values())[0]
+            for ln in block:
+                r = ref(ln, 0, None, now)
+                numPos += r is not None
+                for n, p in list(parsers.items())[1:]:
+                    if p(ln, 0, None, now) != r:
+                        numDiff += 1
+                        if args.verbose:
+                            print ("{}: {} <> {}: {}".format(n, p(ln, 0, None, now), r, ln))
+    if not numLines:
+        parser.error('No lines found')
+
+    print ("{} lines{}".format(numLines, ", {} positions".format(numPos) if numPos else ''))
+    for n in parsers:
+        print ("{:>6}: {:9.0f} lines/s{}".format(n, numLines / tLines[n],
+            ", in buffer {:9.0f} lines/s".format(numLines / tBuf[n]) if args.buffer else ''))
+    if alloc:
+        for n, (perRec, blocks, num) in alloc.items():
+            print ("{:>6}: {:.0f} bytes in {:.1f} blocks kept per record ({} records)".format(n, perRec, blocks, num))
+    if args.parity and len(parsers) > 1:
+        print ("Parity: {} lines differ".format(numDiff))
+        if numDiff:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
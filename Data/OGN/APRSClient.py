@@ -0,0 +1,406 @@
+#!/usr/bin/python3
+
+"""
+Asyncio client for OGN's APRS server (aprs.glidernet.org:14580), behaving
+like LiveTraffic's OpenGliderConnection::APRSMain: logs in with a range
+filter, sends a keep-alive every 10 minutes, takes the server's '#' lines
+as keep-alive and server time, and reconnects if the server stays silent.
+
+Received data goes into one fixed buffer, lines are parsed right in that
+buffer, only incomplete lines are moved to its front. Position lines are
+parsed like OpenGliderConnection::APRSProcessLine into APRSPos records,
+which are queued for the consumer. If the consumer doesn't keep up, reading
+from the socket pauses until the queue is half empty (TCP backpressure).
+
+Usage as library:
+    client = APRSClient(APRSFilter(49.8, 7.9, 100))
+    async for pos in client.positions():
+        ...
+
+For usage info of the command line call
+    python3 APRSClient.py -h
+
+
+MIT License
+
+Copyright (c) 2021 B.Hoppe
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import re
+import time
+import struct
+import asyncio
+import argparse                     # handling command line arguments
+from collections import namedtuple, deque
+
+APRS_HOST = 'aprs.glidernet.org'
+APRS_PORT = 14580
+APRS_USER = 'LiveTrffc'
+APRS_LOGIN_GOOD = b'# logresp'
+APRS_KEEP_ALIVE_S = 600.0           # we send a keep-alive every 10 minutes
+APRS_TIMEOUT_S = 60.0               # server sends one every 20s, reconnect if silent for 60s
+APRS_BUF_SIZE = 65536
+
+# The expression of OpenGliderConnection::APRSProcessLine
+RE_APRS_POS = re.compile(
+    rb':/(\d\d)(\d\d)(\d\d)[hz]'            # timestamp: h, min, sec
+    rb'(\d\d)(\d\d.\d\d)(N|S)'              # latitude: degree, minutes incl. decimals, N or S
+    rb'(?:/|\\)'                            # display symbol
+    rb'(\d\d\d)(\d\d.\d\d)(E|W)'            # longitude: degree, minutes incl. decimals, E or W
+    rb'.'                                   # display symbol
+    rb'(\d\d\d)/(\d\d\d)'                   # heading/speed
+    rb'/A=(\d{6}) '                         # altitude in feet
+    rb'!W(\d)(\d)! '                        # position precision enhancement: latitude, longitude
+    rb'id([0-9A-Z]{2})([0-9A-Z]{6,8}) '     # sender details and address
+    rb'(?:([-+]\d+)fpm)?')                  # vertical speed (optional)
+RE_SERVER_TIME = re.compile(rb'\d+ \w{3} \d{4} (\d{1,2}):(\d{2}):(\d{2}) GMT')
+
+FAT_STATIC_OBJ = 15                 # Flarm aircraft type of static objects, which are ignored
+
+""" === Position record ===
+    ts      position time (Unix epoch)
+    lat/lon degrees incl. the !Wxy! precision digit
+    alt     feet
+    hdg     degrees, spd knots, vsi feet per minute (None if not given)
+    acTy    Flarm aircraft type (FlarmAircraftTy)
+    addrTy  address type (0 random, 1 ICAO, 2 Flarm, 3 OGN)
+    devId   device id as in the line, e.g. 'DD1234'
+"""
+APRSPos = namedtuple('APRSPos', 'ts lat lon alt hdg spd vsi acTy addrTy devId')
+
+""" === Convert hh:mm:ss to a timestamp ===
+    Like mktime_utc, but picks the day which puts the time closest to 'now'.
+"""
+def tsFromHms(h: int, m: int, s: int, now: float) -> float:
+    day = now - now % 86400.0
+    ts = day + h * 3600 + m * 60 + s
+    if ts - now > 43200.0:
+        ts -= 86400.0
+    elif now - ts > 43200.0:
+        ts += 86400.0
+    return ts
+
+""" === Parse one position line ===
+    Works on bytes, bytearray, or a part of a buffer (pos/endpos).
+    Returns None for lines not matching and, like the plugin, for static
+    objects and senders not wanting to be tracked.
+"""
+def _makePos(tH, tM, tS, laD, laM, laNS, loD, loM, loEW, hdg, spd, alt, laP, loP, det, devId, vsi, now) -> APRSPos:
+    det = int(det, 16)
+    acTy = (det & 0b00111100) >> 2
+    if (det & 0b11000000) or acTy == FAT_STATIC_OBJ:
+        return None
+    lat = int(laD) + float(laM + laP) / 60.0
+    lon = int(loD) + float(loM + loP) / 60.0
+    return APRSPos(tsFromHms(int(tH), int(tM), int(tS), time.time() if now is None else now),
+                   -lat if laNS == b'S' else lat,
+                   -lon if loEW == b'W' else lon,
+                   int(alt), int(hdg), int(spd),
+                   int(vsi) if vsi else None,
+                   acTy, det & 0b11, devId.decode('ascii'))
+
+def parsePos(buf, pos: int = 0, endpos: int = None, now: float = None) -> APRSPos:
+    m = RE_APRS_POS.search(buf, pos, len(buf) if endpos is None else endpos)
+    if not m:
+        return None
+    return _makePos(*m.groups(), now)
+
+""" === Parse one position line without the regex ===
+    Unpacks the fixed-width part after ':/' in one go, checks the separators,
+    and converts all digits with one int(). Anything not looking exactly like
+    a standard OGN beacon goes to parsePos, and the numbers are computed so
+    that the result is always identical to parsePos'. This is the model for
+    replacing the std::regex in APRSProcessLine, APRSBench.py measures both
+    and checks parity. (In Python both are about equally fast, as the regex
+    runs in C, so the client sticks to parsePos.)
+      :/hhmmssh DDMM.MMN / DDDMM.MME s hhh/sss/A=aaaaaa  !Wxy! idDD<6-8 id> [+vvvfpm]
+"""
+_FIXED = struct.Struct('6sc2s2sc2scc3s2sc2scc3sc3s3s6s3scc4s2s')
+_FIXED_SEP = (b'.', b'.', b'/', b'/A=', b' !W', b'! id')
+_HZ, _NS, _EW, _SYM = (b'h', b'z'), (b'N', b'S'), (b'E', b'W'), (b'/', b'\\')
+_tupleNew = tuple.__new__
+
+def parsePosFast(buf, pos: int = 0, endpos: int = None, now: float = None) -> APRSPos:
+    if endpos is None:
+        endpos = len(buf)
+    b = buf
+    i = b.find(b':/', pos, endpos)
+    if i < 0 or i + 62 > endpos:                # can't be long enough to match
+        return None
+    (tm, hz, laD, laMi, sepA, laMd, ns, sym, loD, loMi, sepB, loMd, ew, sym2,
+     hdg, sl, spd, a, alt, w, laP, loP, idt, det) = _FIXED.unpack_from(b, i + 2)
+    sp = b.find(b' ', i + 61, min(i + 64, endpos))
+    digits = b''.join((tm, laD, laMi, laMd, laP, loD, loMi, loMd, loP, hdg, spd, alt))
+    if (sp < 0 or (sepA, sepB, sl, a, w, idt) != _FIXED_SEP or
+        hz not in _HZ or ns not in _NS or sym not in _SYM or ew not in _EW or sym2 == b'\n' or
+        not digits.isdigit() or not (det.isdigit() or (det.isalnum() and det.isupper()))):
+        return parsePos(buf, pos, endpos, now)
+    devId = b[i+55:sp]
+    if not (devId.isalnum() and (devId.isupper() or devId.isdigit())):
+        return parsePos(buf, pos, endpos, now)
+    det = int(det, 16)
+    acTy = (det & 0b00111100) >> 2
+    if (det & 0b11000000) or acTy == FAT_STATIC_OBJ:
+        return None
+    # optional vertical speed right after the id
+    vsi = None
+    k = b.find(b'fpm', sp + 3, endpos)
+    if k >= 0 and b[sp+1] in b'+-' and b[sp+2:k].isdigit():
+        vsi = int(b[sp+1:k])
+    # hhmmss DDMMmmp DDDMMmmp hhh sss aaaaaa
+    v, nAlt = divmod(int(digits), 1000000)
+    v, nSpd = divmod(v, 1000)
+    v, nHdg = divmod(v, 1000)
+    v, nLoM = divmod(v, 100000)
+    v, nLoD = divmod(v, 1000)
+    v, nLaM = divmod(v, 100000)
+    v, nLaD = divmod(v, 100)
+    # same arithmetic as tsFromHms and parsePos, minutes/1000 is float('MM.mmp')
+    if now is None:
+        now = time.time()
+    ts = now - now % 86400.0 + v // 10000 * 3600 + v // 100 % 100 * 60 + v % 100
+    if ts - now > 43200.0:
+        ts -= 86400.0
+    elif now - ts > 43200.0:
+        ts += 86400.0
+    lat = nLaD + (nLaM / 1000) / 60.0
+    lon = nLoD + (nLoM / 1000) / 60.0
+    return _tupleNew(APRSPos, (ts, -lat if ns == b'S' else lat, -lon if ew == b'W' else lon,
+                               nAlt, nHdg, nSpd, vsi, acTy, det & 0b11, devId.decode('ascii')))
+
+""" === Login filter ===
+    Range filter around a position plus the prefix exclusion LiveTraffic uses.
+"""
+class APRSFilter:
+    def __init__(self, lat: float, lon: float, dist_km: float, extra: str = '-p/oimqstunw'):
+        self.lat, self.lon, self.dist = lat, lon, dist_km
+        self.extra = extra
+
+    def __str__(self) -> str:
+        return 'r/{:.3f}/{:.3f}/{:d} {}'.format(self.lat, self.lon, int(self.dist), self.extra).rstrip()
+
+""" === Protocol: line reassembly in a fixed buffer === """
+class _APRSProtocol(asyncio.BufferedProtocol):
+    def __init__(self, client, bufSize: int):
+        self.client = client
+        self.buf = bytearray(bufSize)
+        self.mv = memoryview(self.buf)
+        self.used = 0
+        self.transport = None
+        self.lost = asyncio.get_running_loop().create_future()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        if not self.lost.done():
+            self.lost.set_result(exc)
+
+    def get_buffer(self, sizehint):
+        if self.used == len(self.buf):          # a 'line' filling the entire buffer can't be APRS
+            self.client.numOverlong += 1
+            self.used = 0
+        return self.mv[self.used:]
+
+    def buffer_updated(self, nbytes):
+        client = self.client
+        buf = self.buf
+        end = self.used + nbytes
+        start = 0
+        i = buf.find(b'\n', self.used, end)
+        while i >= 0:
+            client._line(buf, start, i)
+            start = i + 1
+            i = buf.find(b'\n', start, end)
+        # move the incomplete rest to the front
+        if start:
+            self.mv[:end - start] = self.mv[start:end]
+        self.used = end - start
+        client.numBytes += nbytes
+
+""" === Client ===
+    Connects and reconnects as long as positions() is iterated or run() is running.
+    Counters: numLines, numPos (records queued), numBytes, numConnects, numOverlong
+"""
+class APRSClient:
+    def __init__(self, filt: APRSFilter, host: str = APRS_HOST, port: int = APRS_PORT,
+                 user: str = APRS_USER, vers: str = 'APRSClient 1.0.0',
+                 maxQueue: int = 10000, bufSize: int = APRS_BUF_SIZE, onLine=None):
+        self.filt = filt
+        self.host, self.port = host, port
+        self.user, self.vers = user, vers
+        self.maxQueue = maxQueue
+        self.bufSize = bufSize
+        self.onLine = onLine                # optional callback with every complete line (bytes)
+        self.queue = deque()
+        self.avail = asyncio.Event()
+        self.proto = None
+        self.paused = False
+        self.loggedIn = False
+        self.serverName = ''
+        self.serverTimeOffset = None        # server time minus our time in seconds
+        self.lastRecv = 0.0
+        self.numLines = self.numPos = self.numBytes = self.numConnects = self.numOverlong = 0
+        self._stop = False
+
+    # called by the protocol for each line, the line is buf[start:end] incl. a trailing '\r'
+    def _line(self, buf, start: int, end: int):
+        self.numLines += 1
+        self.lastRecv = time.monotonic()
+        if self.onLine:
+            self.onLine(bytes(buf[start:end]).rstrip(b'\r'))
+        if buf[start] == 0x23:              # '#'
+            self._comment(bytes(buf[start:end]).rstrip(b'\r'))
+            return
+        pos = parsePos(buf, start, end)
+        if pos:
+            self.numPos += 1
+            self.queue.append(pos)
+            self.avail.set()
+            if len(self.queue) >= self.maxQueue and not self.paused:
+                self.paused = True
+                self.proto.transport.pause_reading()
+
+    def _comment(self, ln: bytes):
+        if b'Invalid' in ln:
+            raise ConnectionError('APRS server: ' + ln.decode('ascii', 'replace'))
+        if ln.startswith(APRS_LOGIN_GOOD):
+            self.loggedIn = True
+            self.serverName = ln.split()[-1].decode('ascii', 'replace')
+        m = RE_SERVER_TIME.search(ln)
+        if m:
+            now = time.time()
+            self.serverTimeOffset = tsFromHms(int(m.group(1)), int(m.group(2)), int(m.group(3)), now) - now
+
+    def login(self) -> bytes:
+        return 'user {} pass -1 vers {} filter {}\r\n'.format(self.user, self.vers, self.filt).encode('ascii')
+
+    def keepAlive(self) -> bytes:
+        return '# {} still alive at {}Z\r\n'.format(self.vers, time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime())).encode('ascii')
+
+    # one connection until it is lost or the server is silent for too long
+    async def _connection(self):
+        loop = asyncio.get_running_loop()
+        transport, self.proto = await loop.create_connection(lambda: _APRSProtocol(self, self.bufSize), self.host, self.port)
+        self.numConnects += 1
+        self.loggedIn = False
+        self.paused = False
+        try:
+            transport.write(self.login())
+            self.lastRecv = lastSent = time.monotonic()
+            while not self._stop:
+                done, _ = await asyncio.wait([self.proto.lost], timeout=5.0)
+                if done:
+                    exc = self.proto.lost.result()
+                    if exc:
+                        raise exc
+                    return
+                now = time.monotonic()
+                if not self.paused and now - self.lastRecv > APRS_TIMEOUT_S:
+                    raise ConnectionError('APRS server silent for {:.0f}s'.format(now - self.lastRecv))
+                if now - lastSent >= APRS_KEEP_ALIVE_S:
+                    transport.write(self.keepAlive())
+                    lastSent = now
+        finally:
+            transport.close()
+
+    async def run(self):
+        retry = 1.0
+        while not self._stop:
+            try:
+                await self._connection()
+                retry = 1.0
+            except (OSError, ConnectionError) as e:
+                print ("APRS connection to {}:{}: {}".format(self.host, self.port, e))
+            if not self._stop:
+                await asyncio.sleep(retry)
+                retry = min(retry * 2, 60.0)
+
+    def stop(self):
+        self._stop = True
+        if self.proto and self.proto.transport:
+            self.proto.transport.close()
+
+    # take the queued positions, resumes reading once the queue is half empty
+    def take(self, maxNum: int = 0) -> list:
+        q = self.queue
+        n = len(q) if not maxNum else min(maxNum, len(q))
+        ret = [q.popleft() for _ in range(n)]
+        if not q:
+            self.avail.clear()
+        if self.paused and len(q) <= self.maxQueue // 2:
+            self.paused = False
+            self.proto.transport.resume_reading()
+        return ret
+
+    async def positions(self):
+        runner = asyncio.ensure_future(self.run())
+        try:
+            while not runner.done():
+                await self.avail.wait()
+                for pos in self.take(1000):
+                    yield pos
+        finally:
+            self.stop()
+            runner.cancel()
+
+""" === MAIN === """
+async def _main(args):
+    client = APRSClient(APRSFilter(args.lat, args.lon, args.dist), args.host, args.port, user=args.user,
+                        maxQueue=args.maxQueue, onLine=print if args.lines else None)
+    t0 = last = time.monotonic()
+    lastLines = 0
+    async for pos in client.positions():
+        if args.verbose:
+            print ("{:.0f} {:9.5f} {:10.5f} {:6d}ft {:03d}° {:3d}kn {:>5}fpm type {:2d} id {}".format(*pos))
+        now = time.monotonic()
+        if now - last >= args.report:
+            print ("{:.0f} lines/s, {} lines, {} positions, {} bytes, {} connects, server {}, time offset {}".format(
+                (client.numLines - lastLines) / (now - last), client.numLines, client.numPos, client.numBytes,
+                client.numConnects, client.serverName, client.serverTimeOffset))
+            last, lastLines = now, client.numLines
+        if args.duration and now - t0 >= args.duration:
+            break
+
+def main():
+    # --- Handling command line argumens ---
+    parser = argparse.ArgumentParser(description='APRSClient 1.0.0: Connects to OGN\'s APRS server like LiveTraffic does, '
+        'parses the received positions and reports the line rate.',fromfile_prefix_chars='@')
+    parser.add_argument('lat', help='Latitude of the range filter', type=float)
+    parser.add_argument('lon', help='Longitude of the range filter', type=float)
+    parser.add_argument('dist', help='Radius of the range filter in km', type=float)
+    parser.add_argument('--host', metavar='NAME_OR_IP', help='APRS server, defaults to '+APRS_HOST, default=APRS_HOST)
+    parser.add_argument('--port', metavar='NUM', help='APRS server port, defaults to {}'.format(APRS_PORT), type=int, default=APRS_PORT)
+    parser.add_argument('--user', metavar='CALL', help='User name for login, defaults to '+APRS_USER, default=APRS_USER)
+    parser.add_argument('--maxQueue', metavar='NUM', help='Pause reading when this many positions are waiting, defaults to 10000', type=int, default=10000)
+    parser.add_argument('--report', metavar='SEC', help='Report line rate every so many seconds, defaults to 10', type=float, default=10.0)
+    parser.add_argument('--duration', metavar='SEC', help='Stop after so many seconds', type=float, default=0.0)
+    parser.add_argument('--lines', help='Print each received line', action='store_true')
+    parser.add_argument('-v', '--verbose', help='Print each parsed position', action='store_true')
+
+    args = parser.parse_args()
+    try:
+        asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,353 @@
+#!/usr/bin/python3
+
+"""
+Local stand-in for OGN's APRS server (aprs.glidernet.org:14580), which
+LiveTraffic's OpenGliderConnection::APRSMain and APRS_Test.py connect to.
+
+Clients log in like
+    user LiveTrffc pass -1 vers LiveTraffic 2.20 filter r/49.8/7.9/100 -p/oimqstunw
+and then receive the position lines within their range filter, plus the
+server's '#' comment lines every 20 seconds, which carry the server time.
+
+Position lines are either generated for a synthetic fleet of gliders or
+replayed from a file of recorded APRS lines, with the timestamp replaced
+by the current time.
+
+For usage info call
+    python3 APRSServer.py -h
+
+
+MIT License
+
+Copyright (c) 2021 B.Hoppe
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import sys
+import os
+import re
+import math
+import time
+import random
+import asyncio
+import argparse                     # handling command line arguments
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from StandInGrid import GridIndex, EARTH_R_KM
+
+SERVER_NAME = 'GLIDERN0'
+SERVER_VERS = 'aprsc 2.1.8-standin'
+KEEP_ALIVE_S = 20.0
+
+# Position in an APRS line: timestamp, latitude, longitude
+RE_POS = re.compile(rb':/(\d{6})h(\d\d)(\d\d\.\d\d)([NS]).(\d{3})(\d\d\.\d\d)([EW])')
+
+""" === Client filter ===
+    Supports the filters LiveTraffic uses: range 'r/lat/lon/dist' (km) and
+    prefix 'p/aa/bb', plus buddy 'b/call1/call2' (a trailing '*' matches any
+    rest), all also as exclusion filters with a leading '-'.
+    Like aprsc, a line is sent if it matches any of the positive filters
+    and none of the exclusion filters.
+"""
+class ClientFilter:
+    def __init__(self, spec: str):
+        self.ranges = []                # (lat, lon, dist_km)
+        self.prefixes = ()
+        self.exclPrefixes = ()
+        self.exclRanges = []
+        self.buddies = ()               # b'CALL>' or, with wildcard, b'CALL'
+        self.exclBuddies = ()
+        for f in spec.split():
+            excl = f.startswith('-')
+            parts = f.lstrip('-').split('/')
+            if parts[0] == 'r' and len(parts) == 4:
+                (self.exclRanges if excl else self.ranges).append(tuple(float(v) for v in parts[1:]))
+            elif parts[0] == 'p':
+                prefixes = tuple(p.upper().encode('ascii') for p in parts[1:] if p)
+                if excl:
+                    self.exclPrefixes += prefixes
+                else:
+                    self.prefixes += prefixes
+            elif parts[0] == 'b':
+                buddies = tuple(b.upper().rstrip('*').encode('ascii') + (b'' if b.endswith('*') else b'>')
+                                for b in parts[1:] if b)
+                if excl:
+                    self.exclBuddies += buddies
+                else:
+                    self.buddies += buddies
+
+    def __str__(self) -> str:
+        return ' '.join(['r/{}/{}/{}'.format(*r) for r in self.ranges] + ['-r/{}/{}/{}'.format(*r) for r in self.exclRanges] +
+                        ['p/' + p.decode() for p in self.prefixes] + ['-p/' + p.decode() for p in self.exclPrefixes] +
+                        ['b/' + _buddy(b) for b in self.buddies] + ['-b/' + _buddy(b) for b in self.exclBuddies])
+
+    # indexes of the batch's lines passing the filter
+    def select(self, batch) -> list:
+        lines = batch.lines
+        idx = set()
+        for lat, lon, dist in self.ranges:
+            idx.update(batch.grid.queryRadius(lat, lon, dist))
+        # prefix and buddy filters select from all lines, not only those in range
+        calls = self.prefixes + self.buddies
+        if calls:
+            idx.update(i for i, ln in enumerate(lines) if ln.startswith(calls))
+        for lat, lon, dist in self.exclRanges:
+            idx.difference_update(batch.grid.queryRadius(lat, lon, dist))
+        exclCalls = self.exclPrefixes + self.exclBuddies
+        if exclCalls:
+            idx = {i for i in idx if not lines[i].startswith(exclCalls)}
+        return sorted(idx)
+
+def _buddy(b: bytes) -> str:
+    return b[:-1].decode() if b.endswith(b'>') else b.decode() + '*'
+
+""" === A batch of lines, sent out together, indexed by position === """
+class Batch:
+    def __init__(self, lines: list, lats: list, lons: list):
+        self.lines = lines
+        self.grid = GridIndex(lats, lons)
+
+""" === Synthetic fleet of gliders ===
+    Each glider circles in a thermal, which drifts slowly with the wind,
+    climbing and sinking. Lines are formatted like real OGN beacons.
+"""
+def _aprsLat(lat: float) -> tuple:
+    m = abs(lat) * 60.0
+    m3 = int(round(m * 1000))
+    return '{:02d}{:02d}.{:02d}{}'.format(m3 // 60000, (m3 // 1000) % 60, (m3 // 10) % 100, 'N' if lat >= 0 else 'S'), m3 % 10
+
+def _aprsLon(lon: float) -> tuple:
+    m = abs(lon) * 60.0
+    m3 = int(round(m * 1000))
+    return '{:03d}{:02d}.{:02d}{}'.format(m3 // 60000, (m3 // 1000) % 60, (m3 // 10) % 100, 'E' if lon >= 0 else 'W'), m3 % 10
+
+class GliderFleet:
+    def __init__(self, num: int, lat: float, lon: float, radius_km: float, seed: int):
+        rnd = random.Random(seed)
+        self.num = num
+        self.gliders = []
+        for i in range(num):
+            d = radius_km * math.sqrt(rnd.random()) / EARTH_R_KM
+            crs = rnd.uniform(0, 2*math.pi)
+            gLat = lat + math.degrees(d * math.cos(crs))
+            gLon = lon + math.degrees(d * math.sin(crs)) / max(math.cos(math.radians(lat)), 0.01)
+            self.gliders.append((
+                'FLR{:06X}'.format(0xD00000 + i),   # call sign
+                '{:06X}'.format(0xD00000 + i),      # device id
+                gLat, gLon,                         # thermal centre
+                rnd.uniform(0.1, 0.3),              # circle radius in km
+                rnd.uniform(70, 130),               # speed in km/h
+                rnd.uniform(0, 2*math.pi),          # phase
+                rnd.uniform(600, 2500),             # mean altitude in m
+                rnd.choice((1, -1))))               # circling direction
+
+    # position of the i-th glider: lat, lon, alt (m), heading, speed (km/h), vertical speed (m/s)
+    def position(self, i: int, now: float) -> tuple:
+        _, _, cLat, cLon, r, spd, phase, alt, sense = self.gliders[i % self.num]
+        sin, cos = math.sin, math.cos
+        # angle on the circle, the circle drifts east with 15 km/h
+        w = sense * (spd / 3.6) / (r * 1000.0)
+        a = phase + w * now
+        drift = (now % 3600.0) * 15.0 / 3600.0
+        return (cLat + (r * cos(a)) / 111.2,
+                cLon + (r * sin(a) + drift) / (111.2 * max(cos(math.radians(cLat)), 0.01)),
+                alt + 300.0 * sin(now / 120.0 + phase),
+                int(math.degrees(a + sense * math.pi / 2)) % 360,
+                spd,
+                2.0 * cos(now / 120.0 + phase))
+
+    def batch(self, first: int, n: int, now: float) -> Batch:
+        hms = time.strftime('%H%M%S', time.gmtime(now))
+        lines, lats, lons = [], [], []
+        for i in range(first, first + n):
+            call, devId = self.gliders[i % self.num][:2]
+            lat, lon, alt, hdg, spd, vsi = self.position(i, now)
+            sLat, pLat = _aprsLat(lat)
+            sLon, pLon = _aprsLon(lon)
+            lines.append('{}>APRS,qAS,STANDIN:/{}h{}/{}\'{:03d}/{:03d}/A={:06d} !W{}{}! id06{} {:+04d}fpm +0.0rot 10.0dB 0e +0.0kHz gps2x3\r\n'.format(
+                call, hms, sLat, sLon, hdg, int(spd / 1.852), int(alt / 0.3048), pLat, pLon, devId, int(vsi * 196.85)).encode('ascii'))
+            lats.append(lat)
+            lons.append(lon)
+        return Batch(lines, lats, lons)
+
+""" === Recorded lines ===
+    Only position lines are kept. When replayed, the timestamp is replaced
+    by the current time, so that receivers don't discard them as outdated.
+"""
+class Recording:
+    def __init__(self, path: str):
+        self.lines, self.lats, self.lons = [], [], []
+        with open(path, 'rb') as f:
+            for ln in f:
+                ln = ln.rstrip(b'\r\n')
+                # APRS_Test.py output has a running number in front
+                i = ln.find(b'. ')
+                if 0 < i < 10 and ln[:i].isdigit():
+                    ln = ln[i+2:]
+                m = RE_POS.search(ln)
+                if not m or ln.startswith(b'#'):
+                    continue
+                lat = (int(m.group(2)) + float(m.group(3)) / 60.0) * (1 if m.group(4) == b'N' else -1)
+                lon = (int(m.group(5)) + float(m.group(6)) / 60.0) * (1 if m.group(7) == b'E' else -1)
+                self.lines.append((ln[:m.start(1)], ln[m.end(1):] + b'\r\n'))
+                self.lats.append(lat)
+                self.lons.append(lon)
+        self.num = len(self.lines)
+
+    def batch(self, first: int, n: int, now: float) -> Batch:
+        hms = time.strftime('%H%M%S', time.gmtime(now)).encode('ascii')
+        idx = [i % self.num for i in range(first, first + n)]
+        return Batch([self.lines[i][0] + hms + self.lines[i][1] for i in idx],
+                     [self.lats[i] for i in idx], [self.lons[i] for i in idx])
+
+""" === Server === """
+class APRSServer:
+    def __init__(self, source, args):
+        self.source = source
+        self.args = args
+        self.clients = {}                   # writer -> ClientFilter
+        self.numLines = 0                   # lines generated
+        self.numSent = 0                    # lines sent to clients
+        self.numDropped = 0                 # lines dropped for slow clients
+
+    @staticmethod
+    def serverComment() -> bytes:
+        return '# {} {} GMT {} 127.0.0.1:14580\r\n'.format(
+            SERVER_VERS, time.strftime('%d %b %Y %H:%M:%S', time.gmtime()), SERVER_NAME).encode('ascii')
+
+    async def client(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        try:
+            writer.write('# {}\r\n'.format(SERVER_VERS).encode('ascii'))
+            # login: 'user <call> pass <passcode> [vers <sw> <version>] [filter <filter>]'
+            try:
+                ln = await asyncio.wait_for(reader.readline(), 30.0)
+            except asyncio.TimeoutError:
+                return
+            tok = ln.decode('ascii', 'replace').split()
+            if len(tok) < 4 or tok[0] != 'user' or tok[2] != 'pass':
+                writer.write(b'# Invalid login string\r\n')
+                return
+            filt = ClientFilter(' '.join(tok[tok.index('filter')+1:]) if 'filter' in tok else '')
+            writer.write('# logresp {} unverified, server {}\r\n'.format(tok[1], SERVER_NAME).encode('ascii'))
+            self.clients[writer] = filt
+            if self.args.verbose:
+                print ("{}: {} logged in, filter {}".format(peer, tok[1], filt))
+
+            # afterwards clients only send keep-alives or filter changes
+            while True:
+                ln = await reader.readline()
+                if not ln:
+                    return
+                if ln.startswith(b'#filter '):
+                    self.clients[writer] = ClientFilter(ln[8:].decode('ascii', 'replace'))
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            self.clients.pop(writer, None)
+            writer.close()
+            if self.args.verbose:
+                print ("{}: disconnected".format(peer))
+
+    # Generate a batch every tick and send each client its part
+    async def produce(self):
+        args = self.args
+        loop = asyncio.get_running_loop()
+        due = loop.time()
+        nextLine = 0
+        owed = 0.0
+        lastKeepAlive = due
+        lastReport, lastSent = due, 0
+        while True:
+            owed += args.rate * args.tick
+            n = int(owed)
+            owed -= n
+            if n and self.clients:
+                batch = self.source.batch(nextLine, n, time.time())
+                self.numLines += n
+                for writer, filt in list(self.clients.items()):
+                    idx = filt.select(batch)
+                    if not idx:
+                        continue
+                    # backpressure: don't queue up more for clients which can't keep up
+                    if writer.transport.get_write_buffer_size() > args.maxBuffer:
+                        self.numDropped += len(idx)
+                        continue
+                    lines = batch.lines
+                    writer.write(b''.join([lines[i] for i in idx]))
+                    self.numSent += len(idx)
+            nextLine += n
+
+            now = loop.time()
+            if now - lastKeepAlive >= KEEP_ALIVE_S:
+                c = self.serverComment()
+                for writer in list(self.clients):
+                    writer.write(c)
+                lastKeepAlive = now
+            if args.verbose and now - lastReport >= 10.0:
+                print ("{} clients, {:.0f} lines/s sent, {} lines generated, {} dropped for slow clients".format(
+                    len(self.clients), (self.numSent - lastSent) / (now - lastReport), self.numLines, self.numDropped))
+                lastReport, lastSent = now, self.numSent
+
+            due += args.tick
+            await asyncio.sleep(max(due - loop.time(), 0))
+
+    async def run(self):
+        server = await asyncio.start_server(self.client, self.args.host, self.args.port, backlog=1024)
+        print ("Listening on {}".format(', '.join('{}:{}'.format(*s.getsockname()[:2]) for s in server.sockets)))
+        asyncio.ensure_future(self.produce())
+        async with server:
+            await server.serve_forever()
+
+""" === MAIN === """
+def main():
+    # --- Handling command line argumens ---
+    parser = argparse.ArgumentParser(description='APRSServer 1.0.0: Local stand-in for OGN\'s APRS server, streaming recorded or synthetic '
+        'glider positions to any number of clients according to their range filters.',fromfile_prefix_chars='@')
+    parser.add_argument('--replay', metavar='FILE', help='Replay the position lines of this file of recorded APRS lines instead of a synthetic fleet')
+    parser.add_argument('--centre', metavar='LAT,LON', help='Synthetic fleet: centre point, defaults to 49.8,7.9', default='49.8,7.9')
+    parser.add_argument('-n', '--numAc', metavar='NUM', help='Synthetic fleet: number of gliders, defaults to 5000', type=int, default=5000)
+    parser.add_argument('-r', '--radius', metavar='KM', help='Synthetic fleet: radius around centre, defaults to 300', type=float, default=300.0)
+    parser.add_argument('--seed', metavar='NUM', help='Synthetic fleet: random seed', type=int, default=0)
+    parser.add_argument('--rate', metavar='NUM', help='Lines generated per second (over all aircraft), defaults to 1000', type=float, default=1000.0)
+    parser.add_argument('--tick', metavar='SEC', help='Interval in which lines are generated and sent in batches, defaults to 0.1', type=float, default=0.1)
+    parser.add_argument('--maxBuffer', metavar='BYTES', help='Skip lines for a client with more than this many bytes still unsent, defaults to 1 MB', type=int, default=1 << 20)
+    parser.add_argument('--host', metavar='NAME_OR_IP', help='Interface to listen on, defaults to \'localhost\'', default='localhost')
+    parser.add_argument('--port', metavar='NUM', help='Port to listen on, defaults to 14580', type=int, default=14580)
+    parser.add_argument('-v', '--verbose', help='Verbose output: Informs about clients and about sent lines every 10 seconds', action='store_true')
+
+    args = parser.parse_args()
+    if args.replay:
+        source = Recording(args.replay)
+        if not source.num:
+            parser.error('No APRS position lines found in ' + args.replay)
+    else:
+        lat, lon = (float(v) for v in args.centre.split(','))
+        source = GliderFleet(args.numAc, lat, lon, args.radius, args.seed)
+
+    srv = APRSServer(source, args)
+    try:
+        asyncio.run(srv.run())
+    except KeyboardInterrupt:
+        pass
+    print ("Generated {} lines, sent {}, dropped {} for slow clients".format(srv.numLines, srv.numSent, srv.numDropped))
+
+if __name__ == '__main__':
+    main()
@@ -1,45 +1,39 @@
 #!/usr/bin/python3
 
 import sys
-import socket
+import asyncio
+from APRSClient import APRSClient, APRSFilter
 
 if len(sys.argv) < 4:
     print ("3 parameters required: lat lon dist[km]")
     exit()
 
-lat = sys.argv[1]
-lon = sys.argv[2]
-dist = sys.argv[3]
+lat = float(sys.argv[1])
+lon = float(sys.argv[2])
+dist = float(sys.argv[3])
 
-sock = socket.create_connection(('aprs.glidernet.org', 14580)) # TCP
-sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
-
-print ("Socket connected")
-
-# logon to OGN APRS network
-USER = "LiveTrffc"               # Set to your username for sending data
-PASSCODE = -1                   # Passcode = -1 is readonly, set to your passcode for useranme to send data
-login = 'user %s pass %s vers Py_Test 0.0.1 filter r/%s/%s/%s -p/oimqstunw\r\n'  % (USER, PASSCODE, lat, lon, dist)
-print (login)
-sock.send(login.encode('ascii'))
-print ("Login sent")
+# logon to OGN APRS network, print each complete line
+# (APRSClient reassembles lines split across reads, sends keep-alives, and reconnects)
+USER = "LiveTrffc"               # Set to your username
 i = 0
 
-try:
+def printLine(ln: bytes):
+    global i
+    i += 1
+    print ("{0}. {1}".format(i, ln.decode('ascii', 'replace')))
 
-    while(1):
-        r = sock.recv(1024)
-        i += 1
-        if (len(r) > 0):
-            print ("{0}. {1}".format(i, r.decode('ascii').rstrip("\r\n")))
+async def main():
+    client = APRSClient(APRSFilter(lat, lon, dist), user=USER, vers='Py_Test 0.0.1', onLine=printLine)
+    print (client.login().decode('ascii'))
+    async for _ in client.positions():
+        pass
 
-except OSError as err:
-    print ("OS Error: {0}".format(err))
+try:
+    asyncio.run(main())
 
-except:
+except KeyboardInterrupt:
     # eat the exception (like Ctrl-C interrupt)
     print ("")
 
 finally:
-    sock.close()
     print ("Socket closed")
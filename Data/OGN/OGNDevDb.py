@@ -0,0 +1,297 @@
+#!/usr/bin/python3
+
+"""
+Compiles OGN's device database (ddb.glidernet.org, see ddb.glidernet.org.txt)
+into one sorted, memory-mappable file, keyed by device type and device id,
+with the ICAO aircraft type code resolved from the model text in advance.
+
+OpenGliderConnection::LookupAcList finds a device in its sorted copy of the
+DDB and then looks up the model in model_typecode.txt, upper-cased, exactly.
+Here, the model is resolved when building, first exactly like the plugin,
+then normalized (only letters and digits, so 'ASW 28' finds 'ASW-28'), then
+with trailing words removed (so 'LS-6 18' finds 'LS-6'). How the type code
+was found is kept with each record. A lookup then is one binary search.
+
+File layout (little endian):
+    header      magic, number of records, length of string heap
+    keys        uint32 per record: device type character << 24 | device id, sorted
+    records     model, registration, CN, type code: (uint32 offset, uint8 length) each,
+                flags (1 tracked, 2 identified), type code match (see MATCH_*)
+    heap        strings (UTF-8), each distinct string stored once
+
+For usage info call
+    python3 OGNDevDb.py -h
+
+
+MIT License
+
+Copyright (c) 2021 B.Hoppe
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import sys
+import os
+import io
+import re
+import csv
+import time
+import struct
+import argparse                     # handling command line arguments
+import urllib.request
+from functools import lru_cache
+from collections import Counter
+
+_here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_here, '..'))
+from MappedIndex import MappedIndex, align4, keysToBytes, writeDb, benchLookups
+
+DEFAULT_DDB = os.path.join(_here, 'ddb.glidernet.org.txt')
+DEFAULT_TYPECODES = (os.path.join(_here, 'OGN_model_typecode.txt'),
+                     os.path.join(_here, '..', '..', 'Resources', 'model_typecode.txt'))
+
+# How the type code was found
+MATCH_NONE = 0
+MATCH_EXACT = 1                     # upper-cased model, like ModelIcaoType::getIcaoType
+MATCH_NORM = 2                      # only letters and digits compared
+MATCH_STRIP = 3                     # trailing words removed
+MATCH_NAMES = ('none', 'exact', 'normalized', 'stripped')
+
+FLAG_TRACKED = 0x01
+FLAG_IDENTIFIED = 0x02
+
+DEV_TYPES = 'FIO'                   # Flarm, ICAO, OGN: lookup order if no type is given
+
+_DB_MAGIC = b'LTOGNDB\x01'
+_DB_HDR = struct.Struct('<8sII')                # magic, number of records, length of heap
+_DB_REC = struct.Struct('<IBIBIBIBBB')          # model, reg, cn, type code (offset, length), flags, match
+_REC_FIELDS = ('model', 'reg', 'cn', 'typecode')
+
+_RE_NON_ALNUM = re.compile(r'[^0-9A-Z]')
+_RE_WORDS = re.compile(r'[\s\-/_.]+')
+
+def devKey(devType: str, devId) -> int:
+    return (ord(devType) << 24) | (int(devId, 16) if isinstance(devId, str) else devId)
+
+""" === Model to ICAO type code ===
+    Reads model_typecode files ('MODEL|TYPECODE', the last pipe separates).
+    All ways of matching are tried in the first file before going to the
+    next, so that a specific type from OGN_model_typecode.txt wins over a
+    generic one like 'GLID'. Results are cached, as the same few hundred
+    models make up most of the DDB.
+"""
+def normModel(model: str) -> str:
+    return _RE_NON_ALNUM.sub('', model.upper())
+
+class TypecodeMap:
+    def __init__(self, paths):
+        self.maps = []                          # per file: (exact, normalized)
+        for path in paths:
+            exact, norm = {}, {}
+            with open(path, encoding='utf-8', errors='replace') as f:
+                for ln in f:
+                    mdl, sep, tc = ln.strip().rpartition('|')
+                    mdl, tc = mdl.strip().upper(), tc.strip().upper()
+                    if not sep or not mdl or not tc or (mdl, tc) == ('MODEL', 'TYPECODE'):
+                        continue
+                    exact.setdefault(mdl, tc)
+                    norm.setdefault(normModel(mdl), tc)
+            self.maps.append((exact, norm))
+
+    def __len__(self) -> int:
+        return sum(len(exact) for exact, _ in self.maps)
+
+    # returns (type code, MATCH_*)
+    @lru_cache(maxsize=None)
+    def resolve(self, model: str) -> tuple:
+        mdl = model.strip().upper()
+        if not mdl:
+            return '', MATCH_NONE
+        nMdl = normModel(mdl)
+        words = _RE_WORDS.split(mdl)
+        stripped = [normModel(''.join(words[:n])) for n in range(len(words) - 1, 0, -1)]
+        for exact, norm in self.maps:
+            tc = exact.get(mdl)
+            if tc:
+                return tc, MATCH_EXACT
+            tc = norm.get(nMdl)
+            if tc:
+                return tc, MATCH_NORM
+            for s in stripped:
+                tc = norm.get(s)
+                if tc:
+                    return tc, MATCH_STRIP
+        return '', MATCH_NONE
+
+""" === Read the DDB ===
+    From a file or URL (like http://ddb.glidernet.org/download/), fields are
+    found by the header line like in OGNAcListOneLine. Yields
+    (device type, device id, model, registration, CN, flags).
+"""
+def readDdb(src: str):
+    if src.startswith(('http://', 'https://')):
+        f = io.TextIOWrapper(urllib.request.urlopen(src, timeout=60), encoding='utf-8', errors='replace')
+    else:
+        f = open(src, encoding='utf-8', errors='replace')
+    with f:
+        rdr = csv.reader(f, quotechar="'", skipinitialspace=True)
+        header = [h.lstrip('#').strip() for h in next(rdr)]
+        try:
+            cols = [header.index(h) for h in ('DEVICE_TYPE', 'DEVICE_ID', 'AIRCRAFT_MODEL', 'REGISTRATION', 'CN', 'TRACKED', 'IDENTIFIED')]
+        except ValueError as e:
+            raise ValueError("{}: {}".format(src, e))
+        maxCol = max(cols)
+        for row in rdr:
+            if len(row) <= maxCol:
+                continue
+            devType, devId, mdl, reg, cn, tracked, ident = (row[c].strip() for c in cols)
+            try:
+                devId = int(devId, 16)
+            except ValueError:
+                continue
+            if len(devType) != 1 or devId > 0xFFFFFF:
+                continue
+            yield (devType.upper(), devId, mdl, reg, cn,
+                   (FLAG_TRACKED if tracked == 'Y' else 0) | (FLAG_IDENTIFIED if ident == 'Y' else 0))
+
+""" === Build the database file ===
+    For duplicate device type + id the first row wins.
+    Returns the number of records and a Counter of type code matches.
+"""
+def buildDb(ddbSrc: str, dbPath: str, typecodes: TypecodeMap) -> tuple:
+    heap = bytearray()
+    heapIdx = {'': (0, 0)}                      # string -> (offset in heap, length)
+    def ref(s: str) -> tuple:
+        r = heapIdx.get(s)
+        if r is None:
+            b = s.encode('utf-8')[:0xFF]
+            r = heapIdx[s] = (len(heap), len(b))
+            heap.extend(b)
+        return r
+
+    recs = {}
+    matches = Counter()
+    for devType, devId, mdl, reg, cn, flags in readDdb(ddbSrc):
+        key = devKey(devType, devId)
+        if key in recs:
+            continue
+        tc, match = typecodes.resolve(mdl)
+        matches[match] += 1
+        recs[key] = (ref(mdl), ref(reg), ref(cn), ref(tc), flags, match)
+
+    keys = sorted(recs)
+    vals = bytearray(_DB_REC.size * len(keys))
+    for i, k in enumerate(keys):
+        (mOff, mLen), (rOff, rLen), (cOff, cLen), (tOff, tLen), flags, match = recs[k]
+        _DB_REC.pack_into(vals, i * _DB_REC.size, mOff, mLen, rOff, rLen, cOff, cLen, tOff, tLen, flags, match)
+
+    writeDb(dbPath, [_DB_HDR.pack(_DB_MAGIC, len(keys), len(heap)), keysToBytes(keys), vals, heap])
+    return len(keys), matches
+
+""" === Lookups in a database file ===
+    Device ids can be passed as int or as hex string. Without device type
+    the types are tried in the order of DEV_TYPES. Records are returned as
+    dict with model, reg, cn, typecode (empty values left out), devType,
+    tracked, identified, and match.
+"""
+class OGNDevDb(MappedIndex):
+    def __init__(self, path: str):
+        super().__init__(path, _DB_HDR, _DB_MAGIC, 'an OGN device database file')
+        numRec, lenHeap = self.hdr
+        self.recPos = self.mapKeys(_DB_HDR.size, numRec)
+        self.heapPos = self.recPos + align4(_DB_REC.size * numRec)
+
+    def _record(self, i: int) -> dict:
+        mm, heapPos = self.mm, self.heapPos
+        v = _DB_REC.unpack_from(mm, self.recPos + i * _DB_REC.size)
+        rec = {fld: mm[heapPos + off:heapPos + off + ln].decode('utf-8', 'replace')
+               for fld, off, ln in zip(_REC_FIELDS, v[0:8:2], v[1:8:2]) if ln}
+        rec['devType'] = chr(self.keys[i] >> 24)
+        rec['tracked'] = bool(v[8] & FLAG_TRACKED)
+        rec['identified'] = bool(v[8] & FLAG_IDENTIFIED)
+        rec['match'] = MATCH_NAMES[v[9]] if v[9] < len(MATCH_NAMES) else v[9]
+        return rec
+
+    def lookup(self, devId, devType: str = None):
+        for t in (devType,) if devType else DEV_TYPES:
+            i = self.find(devKey(t, devId))
+            if i >= 0:
+                return self._record(i)
+        return None
+
+    # all records in key order: (device id as hex string, record)
+    def records(self):
+        for i in range(self.numRec):
+            yield '{:06X}'.format(self.keys[i] & 0xFFFFFF), self._record(i)
+
+""" === MAIN === """
+def main():
+    # --- Handling command line argumens ---
+    parser = argparse.ArgumentParser(description='OGNDevDb 1.0.0: Compiles OGN\'s device database with pre-resolved ICAO type codes '
+        'into an indexed file and looks up devices by type and id.',fromfile_prefix_chars='@')
+    parser.add_argument('dbFile', help='Compiled database file')
+    parser.add_argument('devId', help='Device ids to look up, optionally with device type like F:DD1234', nargs='*')
+    parser.add_argument('--build', metavar='DDB', help='(Re)build the database file from this DDB file or URL first, '
+        'without value from ' + os.path.basename(DEFAULT_DDB), nargs='?', const=DEFAULT_DDB)
+    parser.add_argument('--typecodes', metavar='FILE', help='Model to type code files, first has precedence, '
+        'defaults to OGN_model_typecode.txt and Resources/model_typecode.txt', action='append')
+    parser.add_argument('--model', metavar='TEXT', help='Resolve this model text to a type code', action='append')
+    parser.add_argument('--bench', metavar='NUM', help='Measure opening the file plus NUM random lookups', type=int)
+    parser.add_argument('-v', '--verbose', help='When building list the models without type code', action='store_true')
+
+    args = parser.parse_intermixed_args()
+
+    typecodes = None
+    if args.build or args.model:
+        typecodes = TypecodeMap(args.typecodes or DEFAULT_TYPECODES)
+    for mdl in args.model or ():
+        tc, match = typecodes.resolve(mdl)
+        print ("{}: {} ({})".format(mdl, tc or '-', MATCH_NAMES[match]))
+
+    if args.build:
+        t0 = time.monotonic()
+        n, matches = buildDb(args.build, args.dbFile, typecodes)
+        print ("Built {} with {} records ({:.0f} kB) in {:.2f}s, type codes: {}".format(
+            args.dbFile, n, os.path.getsize(args.dbFile) / 1e3, time.monotonic() - t0,
+            ', '.join('{} {}'.format(MATCH_NAMES[m], matches[m]) for m in sorted(matches))))
+        if args.verbose:
+            missing = Counter(r[2] for r in readDdb(args.build) if not typecodes.resolve(r[2])[0])
+            for mdl, cnt in missing.most_common():
+                print ("{:5d} {}".format(cnt, mdl))
+
+    if not args.devId and not args.bench:
+        return
+
+    t0 = time.perf_counter()
+    with OGNDevDb(args.dbFile) as db:
+        tOpen = time.perf_counter() - t0
+        for d in args.devId:
+            devType, _, devId = d.rpartition(':')
+            try:
+                if len(devType) > 1 or int(devId, 16) > 0xFFFFFF:
+                    raise ValueError
+                print ("{}: {}".format(d, db.lookup(devId, devType.upper() or None)))
+            except ValueError:
+                print ("{}: invalid device id".format(d))
+
+        if args.bench:
+            benchLookups(db, args.bench, db.lookup, tOpen)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+#!/usr/bin/python3
+
+"""
+Local stand-in for live.glidernet.org's marker query, which LiveTraffic's
+OpenGliderConnection uses when configured for request/reply instead of APRS:
+    /lxml.php?a=0&b=<lat max>&c=<lat min>&d=<lon max>&e=<lon min>
+
+The answer lists one marker per aircraft in the box:
+    <m a="lat,lon,CN,reg,alt m,hh:mm:ss,age s,track,km/h,m/s,acft type,receiver,device id,OGN reg id"/>
+
+Aircraft are a generated fleet of gliders (moving like in APRSServer.py,
+with registrations and CNs from OGNDevDb.py if given), or recorded lxml.php
+answers. Markers are rendered and put into a spatial grid once per update
+interval (generated) or snapshot (recorded), answers are cached per box.
+
+To use it, point OPGLIDER_URL to
+    http://localhost:8084/lxml.php?a=0&b=%.3f&c=%.3f&d=%.3f&e=%.3f
+
+For usage info call
+    python3 OGNLiveServer.py -h
+
+
+MIT License
+
+Copyright (c) 2021 B.Hoppe
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import sys
+import os
+import re
+import time
+import random
+import argparse                     # handling command line arguments
+from functools import lru_cache
+
+_here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_here, '..'))
+sys.path.insert(0, os.path.join(_here, '..', '..', 'Resources'))
+from StandInHttp import addServerArgs, serve, VirtualClock, HTTP_OK, HTTP_NOT_FOUND, CT_XML, CT_TEXT
+from StandInGrid import GridIndex
+from APRSServer import GliderFleet
+from OGNDevDb import OGNDevDb
+
+LXML_PATH = '/lxml.php'
+RE_MARKER = re.compile(rb'<m a="([^"]*)"/>')
+RECEIVERS = ('EDER', 'LFMX', 'EDBJ', 'Voelklesh', 'EDDHEast', 'LSZF', 'LOWZ', 'EPBC', 'YTOC', 'KBDU')
+
+# Flarm aircraft types in the generated fleet and their share
+FLEET_AC_TYPES = ((1, 0.80), (2, 0.08), (7, 0.06), (3, 0.03), (15, 0.03))
+
+""" === Markers at one point in time === """
+class Snapshot:
+    def __init__(self, ts: float, markers: list, lats: list, lons: list):
+        self.ts = ts
+        self.markers = markers              # rendered '<m a="..."/>\n'
+        self.grid = GridIndex(lats, lons)
+
+    def __len__(self) -> int:
+        return len(self.markers)
+
+    # the plugin's box: b lat max, c lat min, d lon max, e lon min
+    def query(self, lamax: float, lamin: float, lomax: float, lomin: float) -> bytes:
+        markers = self.markers
+        return b''.join([markers[i] for i in self.grid.queryBox(lamin, lomin, lamax, lomax)])
+
+""" === Generated fleet ===
+    Static data per glider is drawn once. Each glider's last beacon is
+    'age' seconds old, its position is the one at that time.
+"""
+class FleetSource:
+    def __init__(self, fleet: GliderFleet, update: float, devDb: str, seed: int):
+        self.fleet = fleet
+        self.update = update
+        rnd = random.Random(seed)
+        devs = []
+        if devDb:
+            with OGNDevDb(devDb) as db:
+                devs = [(devId, rec) for devId, rec in db.records() if rec['tracked'] and rec['identified']]
+            rnd.shuffle(devs)
+        types, weights = zip(*FLEET_AC_TYPES)
+        self.static = []
+        for i, g in enumerate(fleet.gliders):
+            devId, rec = devs[i] if i < len(devs) else (g[1], {})
+            ognId = '{:08x}'.format(rnd.getrandbits(32))
+            self.static.append((rec.get('cn') or '_' + devId[-2:].lower(),
+                                rec.get('reg') or ognId,
+                                rnd.choices(types, weights)[0],
+                                rnd.choice(RECEIVERS),
+                                devId, ognId,
+                                rnd.randint(0, 30)))            # age of last beacon
+        self.snap = None
+
+    # a new snapshot per update interval, the key identifies it for caching
+    def current(self) -> tuple:
+        key = int(time.time() / self.update)
+        if self.snap is None or self.snapKey != key:
+            self.snap = self.render(key * self.update)
+            self.snapKey = key
+        return self.snapKey, self.snap
+
+    def render(self, now: float) -> Snapshot:
+        markers, lats, lons = [], [], []
+        fmt = '<m a="{:.6f},{:.6f},{},{},{:.0f},{},{},{},{:.0f},{:.1f},{},{},{},{}"/>\n'.format
+        for i, (cn, reg, acTy, rcv, devId, ognId, age) in enumerate(self.static):
+            lat, lon, alt, hdg, spd, vsi = self.fleet.position(i, now - age)
+            markers.append(fmt(lat, lon, cn, reg, alt, time.strftime('%H:%M:%S', time.gmtime(now - age)), age,
+                               hdg, spd, vsi, acTy, rcv, devId, ognId).encode('utf-8'))
+            lats.append(lat)
+            lons.append(lon)
+        return Snapshot(now, markers, lats, lons)
+
+""" === Recorded lxml.php answers ===
+    One snapshot per file, a virtual clock advances through them by file time.
+"""
+def loadMarkers(path: str) -> Snapshot:
+    markers, lats, lons = [], [], []
+    with open(path, 'rb') as f:
+        for m in RE_MARKER.finditer(f.read()):
+            tok = m.group(1).split(b',')
+            try:
+                lat, lon = float(tok[0]), float(tok[1])
+            except (ValueError, IndexError):
+                continue
+            markers.append(m.group(0) + b'\n')
+            lats.append(lat)
+            lons.append(lon)
+    return Snapshot(os.path.getmtime(path), markers, lats, lons)
+
+def listAnswers(inputs: list) -> list:
+    paths = []
+    for i in inputs:
+        if os.path.isdir(i):
+            paths += sorted(os.path.join(d, f) for d, _, files in os.walk(i) for f in files)
+        else:
+            paths.append(i)
+    return paths
+
+class RecordedSource:
+    def __init__(self, snaps: list, speed: float):
+        self.snaps = sorted(snaps, key=lambda s: s.ts)
+        self.clock = VirtualClock([s.ts for s in self.snaps], speed)
+
+    def current(self) -> tuple:
+        idx, _ = self.clock.current()
+        return idx, self.snaps[idx]
+
+""" === Answer queries, cached per snapshot and box === """
+class LiveServer:
+    def __init__(self, source):
+        self.source = source
+        self.snaps = {}                     # snapshot key -> snapshot, for answer()
+
+    # LiveTraffic repeats the same box as long as the user doesn't move
+    @lru_cache(maxsize=1024)
+    def answer(self, snapKey, box: tuple) -> bytes:
+        return b'<markers>\n' + self.snaps[snapKey].query(*box) + b'</markers>\n'
+
+    def handle(self, path: str, query: dict, hdr: dict):
+        if path != LXML_PATH:
+            return HTTP_NOT_FOUND, b'', CT_TEXT
+        box = tuple(float(query[k]) for k in ('b', 'c', 'd', 'e'))
+        # fetch the snapshot once, so that cache key and answer always match
+        snapKey, snap = self.source.current()
+        self.snaps = {snapKey: snap}
+        return HTTP_OK, self.answer(snapKey, box), CT_XML
+
+""" === MAIN === """
+def main():
+    # --- Handling command line argumens ---
+    parser = argparse.ArgumentParser(description='OGNLiveServer 1.0.0: Local stand-in for live.glidernet.org\'s lxml.php, '
+        'answering LiveTraffic\'s bounding box queries with markers of a generated fleet or from recorded answers.',fromfile_prefix_chars='@')
+    parser.add_argument('inFile', help='Recorded lxml.php answers, or directories thereof, instead of a generated fleet', nargs='*')
+    parser.add_argument('--speed', metavar='FACTOR', help='Recorded: speed of the virtual clock compared to real time, defaults to 1', type=float, default=1.0)
+    parser.add_argument('--centre', metavar='LAT,LON', help='Generated fleet: centre point, defaults to 49.8,7.9', default='49.8,7.9')
+    parser.add_argument('-n', '--numAc', metavar='NUM', help='Generated fleet: number of aircraft, defaults to 5000', type=int, default=5000)
+    parser.add_argument('-r', '--radius', metavar='KM', help='Generated fleet: radius around centre, defaults to 300', type=float, default=300.0)
+    parser.add_argument('--seed', metavar='NUM', help='Generated fleet: random seed', type=int, default=0)
+    parser.add_argument('--update', metavar='SEC', help='Generated fleet: interval in which positions are recalculated, defaults to 1', type=float, default=1.0)
+    parser.add_argument('--devDb', metavar='FILE', help='Generated fleet: take device ids, registrations, and CNs from this compiled OGNDevDb.py file')
+    addServerArgs(parser, 8084)
+
+    args = parser.parse_args()
+
+    t0 = time.monotonic()
+    if args.inFile:
+        snaps = [loadMarkers(path) for path in listAnswers(args.inFile)]
+        if not snaps:
+            parser.error('No recorded answers found')
+        source = RecordedSource(snaps, args.speed)
+        print ("Loaded {} snapshots with {} markers in {:.1f}s".format(
+            len(snaps), sum(len(s) for s in snaps), time.monotonic() - t0))
+    else:
+        lat, lon = (float(v) for v in args.centre.split(','))
+        source = FleetSource(GliderFleet(args.numAc, lat, lon, args.radius, args.seed), args.update, args.devDb, args.seed)
+        source.current()
+        print ("Generated fleet of {} aircraft in {:.1f}s".format(args.numAc, time.monotonic() - t0))
+
+    serve(LiveServer(source).handle, args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/python3
+
+"""
+Compiles OpenSky's aircraft database (aircraftDatabase.csv) into a compact
+binary file, which is memory-mapped for lookups by transponder hex id.
+
+The file consists of
+    - a header with the number of records and the names of the fields,
+    - the sorted transponder hex ids (uint32 each),
+    - per record and field the offset and length of the value,
+    - a heap of strings, each distinct value is stored only once.
+Opening the file costs next to nothing, a lookup is a binary search
+over the hex ids plus one small struct unpack.
+
+For usage info call
+    python3 AcMasterDb.py -h
+
+
+MIT License
+
+Copyright (c) 2021 B.Hoppe
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import sys
+import os
+import csv
+import time
+import struct
+import bisect
+import argparse                     # handling command line arguments
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from MappedIndex import MappedIndex, align4, keysToBytes, writeDb, benchLookups
+
+# Fields taken over from aircraftDatabase.csv by default, names as in the csv header
+DEFAULT_FIELDS = ('registration', 'typecode', 'manufacturername', 'model',
+                  'operator', 'operatoricao', 'operatorcallsign', 'owner', 'categoryDescription')
+
+_DB_MAGIC = b'LTACMDB\x01'
+_DB_HDR = struct.Struct('<8sIII')               # magic, number of records, number of fields, length of field names
+_DB_VAL = struct.Struct('<IH')                  # offset into heap, length
+
+""" === Build the database file ===
+    Rows without a valid hex id are skipped, for duplicate hex ids the first row wins.
+    Returns the number of records written.
+"""
+def buildDb(csvPath: str, dbPath: str, fields=DEFAULT_FIELDS) -> int:
+    heap = bytearray()
+    heapIdx = {'': (0, 0)}                      # value -> (offset in heap, length)
+    rows = {}                                   # hexId -> tuple of (offset, length)
+
+    with open(csvPath, newline='', encoding='utf-8', errors='replace') as f:
+        rdr = csv.reader(f)
+        header = next(rdr)
+        try:
+            colHex = header.index('icao24')
+            cols = [header.index(fld) for fld in fields]
+        except ValueError as e:
+            raise ValueError("{}: {}".format(csvPath, e))
+        for row in rdr:
+            try:
+                hexId = int(row[colHex], 16)
+            except (ValueError, IndexError):
+                continue
+            if hexId in rows or hexId > 0xFFFFFF:
+                continue
+            vals = []
+            for c in cols:
+                v = row[c].strip() if c < len(row) else ''
+                ref = heapIdx.get(v)
+                if ref is None:
+                    b = v.encode('utf-8')[:0xFFFF]
+                    ref = heapIdx[v] = (len(heap), len(b))
+                    heap += b
+                vals.append(ref)
+            rows[hexId] = vals
+
+    keys = sorted(rows)
+    names = '\0'.join(fields).encode('utf-8')
+    vals = bytearray(_DB_VAL.size * len(fields) * len(keys))
+    pos = 0
+    for k in keys:
+        for off, ln in rows[k]:
+            _DB_VAL.pack_into(vals, pos, off, ln)
+            pos += _DB_VAL.size
+
+    writeDb(dbPath, [_DB_HDR.pack(_DB_MAGIC, len(keys), len(fields), len(names)), names, keysToBytes(keys), vals, heap])
+    return len(keys)
+
+""" === Lookups in a database file ===
+    Hex ids can be passed as int or as hex string.
+    lookup() returns a dict field -> value, empty values are left out.
+    lookupMany() returns hex id (int) -> tuple of values in the order of fields.
+"""
+class AcMasterDb(MappedIndex):
+    def __init__(self, path: str):
+        super().__init__(path, _DB_HDR, _DB_MAGIC, 'an aircraft master data file')
+        numRec, numFields, lenNames = self.hdr
+        pos = _DB_HDR.size
+        self.fields = tuple(self.mm[pos:pos+lenNames].decode('utf-8').split('\0'))
+        self.valPos = self.mapKeys(pos + align4(lenNames), numRec)
+        self.recVal = struct.Struct('<' + 'IH' * numFields)
+        self.heapPos = self.valPos + align4(self.recVal.size * numRec)
+
+    @staticmethod
+    def _hexId(hexId) -> int:
+        return int(hexId, 16) if isinstance(hexId, str) else hexId
+
+    # values of the i-th record
+    def _record(self, i: int) -> dict:
+        mm, heapPos = self.mm, self.heapPos
+        v = self.recVal.unpack_from(mm, self.valPos + i * self.recVal.size)
+        return {fld: mm[heapPos + off:heapPos + off + ln].decode('utf-8', 'replace')
+                for fld, off, ln in zip(self.fields, v[0::2], v[1::2]) if ln}
+
+    def lookup(self, hexId):
+        i = self.find(self._hexId(hexId))
+        return self._record(i) if i >= 0 else None
+
+    # sorted ids, so that one pass over the key index finds all of them
+    def lookupMany(self, hexIds) -> dict:
+        keys, numRec = self.keys, self.numRec
+        mm, heapPos, valPos = self.mm, self.heapPos, self.valPos
+        unpack, size = self.recVal.unpack_from, self.recVal.size
+        res = {}
+        i = 0
+        for hexId in sorted({int(h, 16) if isinstance(h, str) else h for h in hexIds}):
+            i = bisect.bisect_left(keys, hexId, i)
+            if i == numRec:
+                break
+            if keys[i] == hexId:
+                v = unpack(mm, valPos + i * size)
+                res[hexId] = tuple([str(mm[heapPos + off:heapPos + off + ln], 'utf-8', 'replace') if ln else ''
+                                    for off, ln in zip(v[0::2], v[1::2])])
+        return res
+
+""" === MAIN === """
+def main():
+    # --- Handling command line argumens ---
+    parser = argparse.ArgumentParser(description='AcMasterDb 1.0.0: Compiles OpenSky\'s aircraftDatabase.csv into a memory-mappable, indexed file '
+        'and looks up aircraft by transponder hex id.',fromfile_prefix_chars='@')
+    parser.add_argument('dbFile', help='Compiled database file')
+    parser.add_argument('hexId', help='Transponder hex ids to look up', nargs='*')
+    parser.add_argument('--build', metavar='CSV', help='(Re)build the database file from this aircraftDatabase.csv first')
+    parser.add_argument('--fields', metavar='NAME,...', help='Fields to take over when building, defaults to ' + ','.join(DEFAULT_FIELDS))
+    parser.add_argument('--bench', metavar='NUM', help='Measure opening the file plus NUM random lookups', type=int)
+
+    args = parser.parse_intermixed_args()
+
+    if args.build:
+        t0 = time.monotonic()
+        n = buildDb(args.build, args.dbFile, tuple(args.fields.split(',')) if args.fields else DEFAULT_FIELDS)
+        print ("Built {} with {} records ({:.1f} MB) in {:.1f}s".format(
+            args.dbFile, n, os.path.getsize(args.dbFile) / 1e6, time.monotonic() - t0))
+
+    t0 = time.perf_counter()
+    with AcMasterDb(args.dbFile) as db:
+        tOpen = time.perf_counter() - t0
+        for h in args.hexId:
+            try:
+                print ("{}: {}".format(h, db.lookup(h)))
+            except ValueError:
+                print ("{}: invalid hex id".format(h))
+
+        if args.bench:
+            ids = benchLookups(db, args.bench, db.lookup, tOpen)
+            t0 = time.perf_counter()
+            hitsMany = len(db.lookupMany(ids))
+            tMany = time.perf_counter() - t0
+            print ("lookupMany: {:.0f}/s ({} hits)".format(len(ids) / tMany, hitsMany))
+
+if __name__ == '__main__':
+    main()
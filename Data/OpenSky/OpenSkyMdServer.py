@@ -0,0 +1,159 @@
+#!/usr/bin/python3
+
+"""
+Local stand-in for OpenSky's master data endpoints, which LiveTraffic's
+OpenSkyAcMasterdata channel queries for every new aircraft:
+    /api/metadata/aircraft/icao/<hex>       (OPSKY_MD_URL)
+    /api/routes?callsign=<call>             (OPSKY_ROUTE_URL)
+
+Aircraft data is served from aircraftDatabase.csv, compiled by
+AcMasterDb.py, routes from OpenSky_Routes.json-style files.
+Answers are rendered once per aircraft/call sign and then cached.
+
+To use it, point OPSKY_MD_URL and OPSKY_ROUTE_URL to
+    http://localhost:8081/api/...
+
+For usage info call
+    python3 OpenSkyMdServer.py -h
+
+
+MIT License
+
+Copyright (c) 2021 B.Hoppe
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import sys
+import os
+import json
+import time
+import zlib
+import argparse                     # handling command line arguments
+from functools import lru_cache
+
+from AcMasterDb import AcMasterDb, buildDb
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from StandInHttp import addServerArgs, serve, HTTP_OK, HTTP_NOT_FOUND, HTTP_BAD_REQUEST, CT_JSON, CT_TEXT
+
+MD_PATH = '/api/metadata/aircraft/icao/'
+ROUTE_PATH = '/api/routes'
+
+# Field names in aircraftDatabase.csv differ from those in the API's answer
+_API_NAMES = {'manufacturername': 'manufacturerName', 'manufacturericao': 'manufacturerIcao',
+              'operatoricao': 'operatorIcao', 'operatoriata': 'operatorIata', 'operatorcallsign': 'operatorCallsign',
+              'serialnumber': 'serialNumber', 'linenumber': 'lineNumber', 'icaoaircrafttype': 'icaoAircraftClass'}
+
+# Airports for synthetic routes
+_AIRPORTS = ['EDDF', 'EDDM', 'EGLL', 'LFPG', 'EHAM', 'LEMD', 'LIRF', 'LSZH', 'LOWW', 'EKCH',
+             'KJFK', 'KLAX', 'KORD', 'KATL', 'OMDB', 'WSSS', 'RJTT', 'YSSY', 'SBGR', 'CYYZ']
+
+""" === Master data and routes === """
+class MasterData:
+    def __init__(self, db: AcMasterDb, routes: dict, synthRoutes: bool):
+        self.db = db
+        self.routes = routes                # call sign -> route object
+        self.synthRoutes = synthRoutes
+        self.timestamp = int(time.time()) * 1000
+
+    # rendered answers are cached, the plugin asks for the same aircraft again and again when restarted
+    @lru_cache(maxsize=100000)
+    def aircraft(self, hexId: str):
+        try:
+            rec = self.db.lookup(hexId)
+        except ValueError:
+            return None
+        if rec is None:
+            return None
+        ac = {_API_NAMES.get(k, k): v for k, v in rec.items()}
+        ac['icao24'] = hexId
+        ac['timestamp'] = self.timestamp
+        return json.dumps(ac).encode('utf-8')
+
+    @lru_cache(maxsize=100000)
+    def route(self, call: str):
+        r = self.routes.get(call)
+        if r is None and self.synthRoutes and len(call) > 3 and call[:3].isalpha():
+            # stable, but arbitrary: derived from a checksum of the call sign
+            h = zlib.crc32(call.encode('ascii', 'replace'))
+            dep = _AIRPORTS[h % len(_AIRPORTS)]
+            arr = _AIRPORTS[(h // len(_AIRPORTS) + 1 + h % len(_AIRPORTS)) % len(_AIRPORTS)]
+            r = {'callsign': call, 'route': [dep, arr], 'updateTime': self.timestamp,
+                 'operatorIata': call[:2], 'flightNumber': h % 9000 + 100}
+        return json.dumps(r).encode('utf-8') if r else None
+
+    def handle(self, path: str, query: dict, hdr: dict):
+        if path.startswith(MD_PATH):
+            body = self.aircraft(path[len(MD_PATH):].strip('/').lower())
+        elif path.rstrip('/') == ROUTE_PATH:
+            call = query.get('callsign', '').strip().upper()
+            if not call:
+                return HTTP_BAD_REQUEST, b'', CT_TEXT
+            body = self.route(call)
+        else:
+            return HTTP_NOT_FOUND, b'', CT_TEXT
+        return (HTTP_OK, body, CT_JSON) if body else (HTTP_NOT_FOUND, b'', CT_TEXT)
+
+""" === Load routes ===
+    A file may contain a single route object, a list of them, or one object per line.
+"""
+def loadRoutes(paths: list) -> dict:
+    routes = {}
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            txt = f.read()
+        try:
+            docs = json.loads(txt)
+            docs = docs if isinstance(docs, list) else [docs]
+        except json.JSONDecodeError:
+            docs = [json.loads(ln) for ln in txt.splitlines() if ln.strip()]
+        for r in docs:
+            if isinstance(r, dict) and r.get('callsign'):
+                routes[r['callsign'].strip().upper()] = r
+    return routes
+
+""" === MAIN === """
+def main():
+    # --- Handling command line argumens ---
+    parser = argparse.ArgumentParser(description='OpenSkyMdServer 1.0.0: Local stand-in for OpenSky\'s aircraft metadata and routes API '
+        'to stress-test LiveTraffic\'s master data requests offline.',fromfile_prefix_chars='@')
+    parser.add_argument('masterData', help='Master data: aircraftDatabase.csv or a file compiled from it by AcMasterDb.py. '
+        'A csv file is compiled to <csv>.db first, unless that is up to date already')
+    parser.add_argument('--routes', metavar='FILE', help='Routes in OpenSky_Routes.json format, can be given multiple times', action='append', default=[])
+    parser.add_argument('--synthRoutes', help='Answer route requests of unknown airline call signs with a synthetic route instead of 404', action='store_true')
+    addServerArgs(parser, 8081)
+
+    args = parser.parse_args()
+
+    # compile the csv file if needed
+    dbPath = args.masterData
+    if dbPath.lower().endswith('.csv'):
+        dbPath = args.masterData + '.db'
+        if not os.path.exists(dbPath) or os.path.getmtime(dbPath) < os.path.getmtime(args.masterData):
+            print ("Compiling {}...".format(args.masterData))
+            buildDb(args.masterData, dbPath)
+
+    with AcMasterDb(dbPath) as db:
+        md = MasterData(db, loadRoutes(args.routes), args.synthRoutes)
+        print ("{} aircraft, {} routes".format(len(db), len(md.routes)))
+        serve(md.handle, args)
+
+if __name__ == '__main__':
+    main()
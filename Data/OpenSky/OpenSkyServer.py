@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+
+"""
+Local stand-in for OpenSky's states API as queried by LiveTraffic's
+OpenSkyConnection::GetURL:
+    /api/states/all?lamin=<lat>&lomin=<lon>&lamax=<lat>&lomax=<lon>
+
+Answers are served from recorded snapshots (see OpenSky_20180420_1955_UTC.json),
+a single snapshot per file or one snapshot per line (see ConvOpenSky.py).
+A virtual clock advances through the snapshots, each query is answered
+from the snapshot current at that virtual time by a spatial grid index.
+
+To use it, point OPSKY_URL_ALL to
+    http://localhost:8083/api/states/all?lamin=%.3f&lomin=%.3f&lamax=%.3f&lomax=%.3f
+
+For usage info call
+    python3 OpenSkyServer.py -h
+
+
+MIT License
+
+Copyright (c) 2021 B.Hoppe
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import sys
+import os
+import json
+import time
+import argparse                     # handling command line arguments
+from functools import lru_cache
+
+_here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_here, '..'))
+sys.path.insert(0, os.path.join(_here, '..', '..', 'Resources'))
+from StandInHttp import addServerArgs, serve, VirtualClock, HTTP_OK, HTTP_NOT_FOUND, CT_JSON, CT_TEXT
+from StandInGrid import GridIndex
+from ConvADSBExHist import listInputs
+from ConvOpenSky import iterSnapshots, OPSKY_TRANSP_ICAO, OPSKY_POS_TIME, OPSKY_LAT, OPSKY_LON
+
+STATES_PATH = '/api/states/all'
+OPSKY_LAST_CONTACT = 4
+_TIME_MARK = '\0'                  # renders as "\u0000", replaced by '%d'
+
+""" === One snapshot ===
+    Each state vector is rendered into its JSON text once when loading,
+    answers then only join the texts of the states found.
+    States without position are never part of a bounding box answer.
+    time_position and last_contact are left as '%d' placeholders in the
+    text, so that answers can shift them to the wall clock (LiveTraffic
+    drops positions older than its simulated time).
+"""
+class Snapshot:
+    def __init__(self, ts: float, states: list):
+        self.ts = ts
+        states = [s for s in states if s[OPSKY_LAT] is not None and s[OPSKY_LON] is not None]
+        self.icaos = [s[OPSKY_TRANSP_ICAO] for s in states]
+        self.texts = []
+        self.times = []                             # per state: tuple of recorded times
+        for s in states:
+            s = list(s)
+            times = []
+            for i in (OPSKY_POS_TIME, OPSKY_LAST_CONTACT):
+                if len(s) > i and s[i] is not None:
+                    times.append(s[i])
+                    s[i] = _TIME_MARK
+            self.texts.append(json.dumps(s, separators=(',', ':')).replace('%', '%%').replace('"\\u0000"', '%d'))
+            self.times.append(tuple(times))
+        self.grid = GridIndex([s[OPSKY_LAT] for s in states], [s[OPSKY_LON] for s in states])
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def query(self, box) -> list:
+        if box is None:
+            return range(len(self.texts))
+        return self.grid.queryBox(*box)
+
+""" === Answer queries from the snapshot current at the virtual time ===
+    Timestamps are shifted by the difference between wall clock and virtual
+    time (in full seconds), unless keepTimes is set.
+"""
+class StatesServer:
+    def __init__(self, snaps: list, speed: float, keepTimes: bool):
+        self.snaps = sorted(snaps, key=lambda s: s.ts)
+        self.clock = VirtualClock([s.ts for s in self.snaps], speed)
+        self.keepTimes = keepTimes
+
+    # answers are cached per snapshot and box, LiveTraffic repeats the same box as long as the user doesn't move
+    @lru_cache(maxsize=1024)
+    def answer(self, snapIdx: int, box, icao24) -> tuple:
+        snap = self.snaps[snapIdx]
+        idx = snap.query(box)
+        if icao24:
+            idx = [i for i in idx if snap.icaos[i] in icao24]
+        states = ','.join(snap.texts[i] for i in idx)
+        times = tuple(t for i in idx for t in snap.times[i])
+        # like the real API: 'null' instead of an empty array
+        return ('[' + states + ']').encode('utf-8') if states else b'null', times
+
+    def handle(self, path: str, query: dict, hdr: dict):
+        if path.rstrip('/') != STATES_PATH:
+            return HTTP_NOT_FOUND, b'', CT_TEXT
+        box = None
+        if any(k in query for k in ('lamin', 'lomin', 'lamax', 'lomax')):
+            box = (float(query.get('lamin', -90)), float(query.get('lomin', -180)),
+                   float(query.get('lamax', 90)), float(query.get('lomax', 180)))
+        icao24 = frozenset(query['icao24'].lower().split(',')) if 'icao24' in query else None
+        snapIdx, vt = self.clock.current()
+        states, times = self.answer(snapIdx, box, icao24)
+        shift = 0 if self.keepTimes else round(time.time() - vt)
+        if times:
+            states %= tuple(t + shift for t in times)
+        return HTTP_OK, b'{"time":%d,"states":%s}' % (int(self.snaps[snapIdx].ts) + shift, states), CT_JSON
+
+""" === MAIN === """
+def main():
+    # --- Handling command line argumens ---
+    parser = argparse.ArgumentParser(description='OpenSkyServer 1.0.0: Local stand-in for OpenSky\'s states API, '
+        'answering LiveTraffic\'s bounding box queries from recorded snapshots to profile the OpenSky channel with large answers.',fromfile_prefix_chars='@')
+    parser.add_argument('inFile', help='Snapshots: OpenSky states/all answers, one per file or one per line, optionally compressed, or directories thereof', nargs='+')
+    parser.add_argument('--speed', metavar='FACTOR', help='Speed of the virtual clock compared to real time, 0 stays at the first snapshot, defaults to 1', type=float, default=1.0)
+    parser.add_argument('--keepTimes', help='Answer with the recorded timestamps instead of shifting them to the current time. '
+        'LiveTraffic then drops all positions as outdated', action='store_true')
+    addServerArgs(parser, 8083)
+
+    args = parser.parse_args()
+
+    t0 = time.monotonic()
+    snaps = []
+    for path in listInputs(args.inFile):
+        for doc in iterSnapshots(path):
+            snaps.append(Snapshot(doc.get('time') or 0, doc.get('states') or []))
+            if args.verbose:
+                print ("{}: {} states at {:.0f}".format(path, len(snaps[-1]), snaps[-1].ts))
+    if not snaps:
+        parser.error('No snapshots found')
+    print ("Loaded {} snapshots with {} states in {:.1f}s".format(
+        len(snaps), sum(len(s) for s in snaps), time.monotonic() - t0))
+
+    serve(StatesServer(snaps, args.speed, args.keepTimes).handle, args)
+
+if __name__ == '__main__':
+    main()
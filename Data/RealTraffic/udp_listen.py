@@ -1,26 +1,400 @@
 #!/usr/bin/python3
 
+"""
+Listens on a UDP port and prints or captures all datagrams received, e.g. what
+LiveTraffic's ForeFlightSender or SendTraffic.py send.
+
+Built to keep up with high rates: a large socket receive buffer, batched
+receiving (recvmmsg() on Linux), kernel timestamps per datagram, and a
+writer thread for the capture file. Datagrams the kernel dropped because the
+receive buffer was full are counted (SO_RXQ_OVFL), datagrams larger than
+--maxSize are counted as truncated.
+
+Capture file format, little endian:
+    header  8s magic 'LTUDPCAP', H version, H port listened on
+    record  q timestamp [ns since epoch], I length, 16s source address
+            (IPv4 mapped into IPv6), H source port, then the datagram
+
+Examples:
+    python3 udp_listen.py 49003
+    python3 udp_listen.py 49002 -o foreflight.cap
+    python3 udp_listen.py --dump foreflight.cap
+
+For usage info call
+    python3 udp_listen.py -h
+
+
+MIT License
+
+Copyright (c) 2021 B.Hoppe
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os
 import sys
 import socket
+import struct
 import time
+import errno
+import queue
+import threading
+import ctypes
+import ctypes.util
+import argparse                     # handling command line arguments
+
+_here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_here, '..', '..', 'Resources'))
+from SendTraffic import IOVec, MsgHdr, MMsgHdr          # same structs as for sendmmsg()
+
+# Linux socket options, not all exported by the socket module
+SO_RCVBUFFORCE = 33
+SO_TIMESTAMPNS = 35                 # also the cmsg type: SCM_TIMESTAMPNS
+SO_RXQ_OVFL = 40
+MSG_WAITFORONE = 0x10000
+
+CAP_MAGIC = b'LTUDPCAP'
+CAP_VERSION = 1
+CAP_HDR = struct.Struct('<8sHH')
+REC_HDR = struct.Struct('<qI16sH')
+REC_TS_LEN = struct.Struct('<qI')
+
+""" === Source address: packed for the capture file, and as text === """
+_V4_MAPPED = bytes(10) + b'\xff\xff'
+
+def srcInfo(family: int, ip: str, port: int) -> tuple:
+    if family == socket.AF_INET:
+        addr = _V4_MAPPED + socket.inet_pton(socket.AF_INET, ip)
+    else:
+        addr = socket.inet_pton(socket.AF_INET6, ip)
+    return addr + struct.pack('<H', port), '{}:{}'.format(ip, port)
+
+def srcText(addr: bytes, port: int) -> str:
+    if addr.startswith(_V4_MAPPED):
+        return '{}:{}'.format(socket.inet_ntop(socket.AF_INET, addr[12:]), port)
+    return '[{}]:{}'.format(socket.inet_ntop(socket.AF_INET6, addr), port)
+
+""" === Socket setup ===
+    Linux doubles the requested buffer size and caps it at net.core.rmem_max,
+    SO_RCVBUFFORCE ignores that cap if permitted (CAP_NET_ADMIN).
+"""
+def openSocket(host: str, port: int, rcvBuf: int) -> socket.socket:
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if sys.platform != "win32":
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvBuf)
+    if sys.platform.startswith('linux'):
+        if sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) < rcvBuf:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, SO_RCVBUFFORCE, rcvBuf)
+            except OSError:
+                pass
+        sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+        sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+    # wake up once a second even without traffic for reports and Ctrl-C
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, struct.pack('@ll', 1, 0))
+    sock.bind((host, port))
+    return sock
+
+""" === Batched UDP receiving ===
+    Receives up to maxBatch datagrams with a single recvmmsg() system call on
+    Linux, into buffers allocated once. Message headers are read back with one
+    struct per message instead of ctypes attribute access. Elsewhere (or with
+    --noBatch) falls back to one recvmsg() per datagram.
+    receive() returns (timestamp ns, source, data) with data being a memoryview
+    into the receive buffer, only valid until the next call.
+"""
+class BatchReceiver:
+    NAME_SIZE = 28                                          # sizeof(struct sockaddr_in6)
+    CTRL_TS = socket.CMSG_SPACE(16)                         # timestamp first, then drop counter
+    CTRL_SIZE = CTRL_TS + socket.CMSG_SPACE(4)
+    CMSG_TS = struct.Struct('@Niill')                       # cmsghdr + struct timespec
+    CMSG_U32 = struct.Struct('@NiiI')                       # cmsghdr + uint32
+
+    def __init__(self, sock: socket.socket, batch: bool, maxBatch: int, maxSize: int):
+        self.sock = sock
+        self.maxSize = maxSize
+        self.numSyscalls = 0
+        self.numDatagrams = 0
+        self.numBytes = 0
+        self.numTruncated = 0
+        self.kernelDrops = 0
+        self._src = {}
+        self._recvmmsg = None
+        if batch and sys.platform.startswith('linux'):
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            self._recvmmsg = getattr(libc, 'recvmmsg', None)
+        if not self._recvmmsg:
+            return
+
+        self._recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(MMsgHdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+        self._recvmmsg.restype = ctypes.c_int
+        self.maxBatch = maxBatch
+        self._data = ctypes.create_string_buffer(maxBatch * maxSize)
+        self._names = ctypes.create_string_buffer(maxBatch * self.NAME_SIZE)
+        self._ctrl = ctypes.create_string_buffer(maxBatch * self.CTRL_SIZE)
+        self._iov = (IOVec * maxBatch)()
+        self._msgs = (MMsgHdr * maxBatch)()
+        for i in range(maxBatch):
+            self._iov[i].iov_base = ctypes.addressof(self._data) + i * maxSize
+            self._iov[i].iov_len = maxSize
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(self._names) + i * self.NAME_SIZE
+            hdr.msg_namelen = self.NAME_SIZE
+            hdr.msg_iov = ctypes.pointer(self._iov[i])
+            hdr.msg_iovlen = 1
+            hdr.msg_control = ctypes.addressof(self._ctrl) + i * self.CTRL_SIZE
+            hdr.msg_controllen = self.CTRL_SIZE
+        # the kernel overwrites name and control lengths, restored from this copy
+        self._pristine = bytes(self._msgs)
+        # msg_namelen, msg_controllen, msg_flags, msg_len of one message at their offsets
+        fmt, pos = '=', 0
+        for off, size, code in ((MsgHdr.msg_namelen.offset, 4, 'I'),
+                                (MsgHdr.msg_controllen.offset, MsgHdr.msg_controllen.size, 'I' if MsgHdr.msg_controllen.size == 4 else 'Q'),
+                                (MsgHdr.msg_flags.offset, 4, 'i'),
+                                (MMsgHdr.msg_len.offset - MMsgHdr.msg_hdr.offset, 4, 'I')):
+            fmt += '{}x{}'.format(off - pos, code) if off > pos else code
+            pos = off + size
+        self._hdr = struct.Struct(fmt)
+        self._mvData = memoryview(self._data).cast('B')
+        self._mvNames = memoryview(self._names).cast('B')
+        self._mvCtrl = memoryview(self._ctrl).cast('B')
+        self._mvMsgs = memoryview(self._msgs).cast('B')
+
+    @property
+    def batched(self) -> bool:
+        return self._recvmmsg is not None
+
+    def _source(self, name: bytes) -> tuple:
+        src = self._src.get(name)
+        if src is None:
+            family = struct.unpack_from('=H', name)[0]
+            port = struct.unpack_from('!H', name, 2)[0]
+            if family == socket.AF_INET:
+                ip = socket.inet_ntop(family, name[4:8])
+            else:
+                ip = socket.inet_ntop(family, name[8:24])
+            src = self._src[name] = srcInfo(family, ip, port)
+        return src
+
+    def _drops(self, val: int):
+        self.kernelDrops = max(self.kernelDrops, val)
+
+    def receive(self) -> list:
+        if not self._recvmmsg:
+            return self._receiveSingle()
+
+        n = self._recvmmsg(self.sock.fileno(), self._msgs, self.maxBatch, MSG_WAITFORONE, None)
+        self.numSyscalls += 1
+        if n < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return []
+            raise OSError(err, os.strerror(err))
+
+        now = time.time_ns()
+        recs = []
+        hdr = self._hdr
+        msgSize = ctypes.sizeof(MMsgHdr)
+        maxSize, nameSize, ctrlSize = self.maxSize, self.NAME_SIZE, self.CTRL_SIZE
+        for i in range(n):
+            nameLen, ctrlLen, flags, ln = hdr.unpack_from(self._mvMsgs, i * msgSize)
+            if flags & socket.MSG_TRUNC:
+                self.numTruncated += 1
+                ln = min(ln, maxSize)
+            ts = now
+            ctrl = i * ctrlSize
+            if ctrlLen >= self.CMSG_TS.size:
+                _, level, typ, sec, nsec = self.CMSG_TS.unpack_from(self._mvCtrl, ctrl)
+                if level == socket.SOL_SOCKET and typ == SO_TIMESTAMPNS:
+                    ts = sec * 1000000000 + nsec
+                    ctrl += self.CTRL_TS
+                if ctrlLen >= ctrl - i * ctrlSize + self.CMSG_U32.size:
+                    _, level, typ, val = self.CMSG_U32.unpack_from(self._mvCtrl, ctrl)
+                    if level == socket.SOL_SOCKET and typ == SO_RXQ_OVFL:
+                        self._drops(val)
+            name = self._mvNames[i * nameSize:i * nameSize + nameLen].tobytes()
+            recs.append((ts, self._source(name), self._mvData[i * maxSize:i * maxSize + ln]))
+            self.numBytes += ln
+        self.numDatagrams += n
+        ctypes.memmove(self._msgs, self._pristine, n * msgSize)
+        return recs
+
+    def _receiveSingle(self) -> list:
+        try:
+            data, anc, flags, addr = self.sock.recvmsg(self.maxSize, self.CTRL_SIZE)
+        except (BlockingIOError, InterruptedError, socket.timeout):
+            return []
+        self.numSyscalls += 1
+        ts = time.time_ns()
+        for level, typ, val in anc:
+            if level == socket.SOL_SOCKET and typ == SO_TIMESTAMPNS and len(val) >= 16:
+                sec, nsec = struct.unpack_from('@ll', val)
+                ts = sec * 1000000000 + nsec
+            elif level == socket.SOL_SOCKET and typ == SO_RXQ_OVFL and len(val) >= 4:
+                self._drops(struct.unpack_from('@I', val)[0])
+        if flags & socket.MSG_TRUNC:
+            self.numTruncated += 1
+        src = self._src.get(addr)
+        if src is None:
+            src = self._src[addr] = srcInfo(self.sock.family, addr[0], addr[1])
+        self.numDatagrams += 1
+        self.numBytes += len(data)
+        return [(ts, src, memoryview(data))]
+
+""" === Capture file writer ===
+    The receive loop hands over one joined chunk per batch, a thread writes
+    them through a large file buffer. If the writer falls behind the queue
+    fills up and blocks receiving, then the kernel drops (and counts) datagrams.
+"""
+class CaptureWriter:
+    def __init__(self, path: str, port: int, maxQueue: int):
+        self.f = open(path, 'wb', buffering=1 << 20)
+        self.f.write(CAP_HDR.pack(CAP_MAGIC, CAP_VERSION, port))
+        self.q = queue.Queue(maxQueue)
+        self.maxQueued = 0
+        self.numBytes = CAP_HDR.size
+        self.thread = threading.Thread(target=self._write, name='CaptureWriter', daemon=True)
+        self.thread.start()
+
+    def _write(self):
+        while True:
+            chunk = self.q.get()
+            if chunk is None:
+                break
+            self.f.write(chunk)
+        self.f.close()
+
+    def write(self, recs: list):
+        parts = []
+        for ts, (src, _), data in recs:
+            parts += (REC_TS_LEN.pack(ts, len(data)), src, data)
+        chunk = b''.join(parts)
+        self.numBytes += len(chunk)
+        self.q.put(chunk)
+        self.maxQueued = max(self.maxQueued, self.q.qsize())
+
+    def close(self):
+        self.q.put(None)
+        self.thread.join()
+
+""" === Read a capture file: (timestamp ns, source text, data) === """
+def readCapture(path: str):
+    with open(path, 'rb') as f:
+        magic, version, port = CAP_HDR.unpack(f.read(CAP_HDR.size))
+        if magic != CAP_MAGIC or version != CAP_VERSION:
+            raise ValueError('{} is not a capture file of version {}'.format(path, CAP_VERSION))
+        while True:
+            hdr = f.read(REC_HDR.size)
+            if len(hdr) < REC_HDR.size:
+                return
+            ts, ln, addr, srcPort = REC_HDR.unpack(hdr)
+            yield ts, srcText(addr, srcPort), f.read(ln)
+
+def fmtTs(ts: int) -> str:
+    return '{}.{:09d}'.format(time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts // 1000000000)), ts % 1000000000)
+
+""" === MAIN === """
+def main():
+    # --- Handling command line argumens ---
+    parser = argparse.ArgumentParser(description='udp_listen 1.1.0: Receives UDP datagrams, e.g. from LiveTraffic\'s ForeFlight sender or SendTraffic.py, '
+        'and prints them or writes them to a binary capture file with nanosecond timestamps and source addresses. '
+        'Reports rates and datagrams dropped by the kernel.',fromfile_prefix_chars='@')
+    parser.add_argument('port', help='UDP port to listen on, defaults to 49003', type=int, nargs='?', default=49003)
+    parser.add_argument('--host', metavar='NAME_OR_IP', help='Local address to listen on, defaults to all IPv4 addresses', default='')
+    parser.add_argument('-o', '--outFile', metavar='FILE', help='Capture file to write, otherwise datagrams are printed')
+    parser.add_argument('--dump', metavar='FILE', help='Print the contents of a capture file and exit')
+    parser.add_argument('--rcvBuf', metavar='MB', help='Socket receive buffer size, defaults to 32', type=float, default=32.0)
+    parser.add_argument('--maxSize', metavar='BYTES', help='Maximum datagram size, larger ones are truncated and counted, defaults to 9000', type=int, default=9000)
+    parser.add_argument('--batch', metavar='NUM', help='Maximum number of datagrams per receive call, defaults to 1024', type=int, default=1024)
+    parser.add_argument('--noBatch', help='Receive one datagram per system call', action='store_true')
+    parser.add_argument('--maxQueue', metavar='NUM', help='Maximum number of batches queued for the capture file writer, defaults to 4096', type=int, default=4096)
+    parser.add_argument('--report', metavar='SEC', help='Report statistics every SEC seconds, 0 for no reports, defaults to 5', type=float, default=5.0)
+    parser.add_argument('--duration', metavar='SEC', help='Stop after SEC seconds', type=float)
+    parser.add_argument('-n', '--count', metavar='NUM', help='Stop after NUM datagrams', type=int)
+    parser.add_argument('-q', '--quiet', help='Neither print nor capture datagrams, only count them', action='store_true')
+    parser.add_argument('-v', '--verbose', help='Print timestamp and source with each datagram', action='store_true')
+
+    args = parser.parse_args()
+
+    if args.dump:
+        for ts, src, data in readCapture(args.dump):
+            print ("{} {} {}".format(fmtTs(ts), src, data.decode('ascii', 'replace')))
+        return
+
+    #---socket creation and bind
+    try:
+        sock = openSocket(args.host, args.port, int(args.rcvBuf * 1024 * 1024))
+    except OSError as e:
+        print ("Could not listen on port {}: {}".format(args.port, e))
+        sys.exit(1)
+    rcv = BatchReceiver(sock, not args.noBatch, args.batch, args.maxSize)
+    writer = CaptureWriter(args.outFile, args.port, args.maxQueue) if args.outFile and not args.quiet else None
+    rcvBuf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+    print ("Listening on {}:{}, receive buffer {:.1f} MB, {}".format(
+        args.host or '*', args.port, rcvBuf / 1024 / 1024,
+        "batches of up to {}".format(args.batch) if rcv.batched else "one datagram per call"), file=sys.stderr)
+    if rcvBuf < args.rcvBuf * 1024 * 1024:
+        print ("Receive buffer limited by net.core.rmem_max, raise it for high rates", file=sys.stderr)
+
+    def report(elapsed: float, last: tuple) -> tuple:
+        num, numBytes, calls = rcv.numDatagrams - last[0], rcv.numBytes - last[1], rcv.numSyscalls - last[2]
+        print ("{:.0f}s: {} datagrams, {:.0f}/s, {:.2f} MB/s, {:.1f} per call, kernel drops {}, truncated {}{}".format(
+            time.monotonic() - tStart, rcv.numDatagrams, num / elapsed, numBytes / elapsed / 1024 / 1024,
+            num / calls if calls else 0.0, rcv.kernelDrops, rcv.numTruncated,
+            ", writer queue max {}".format(writer.maxQueued) if writer else ''), file=sys.stderr)
+        return rcv.numDatagrams, rcv.numBytes, rcv.numSyscalls
+
+    #---receive and print or capture data
+    tStart = tReport = time.monotonic()
+    last = (0, 0, 0)
+    try:
+        while True:
+            recs = rcv.receive()
+            if recs and not args.quiet:
+                if writer:
+                    writer.write(recs)
+                else:
+                    for ts, (_, src), data in recs:
+                        text = bytes(data).decode('ascii', 'replace')
+                        print ("{} {} {}".format(fmtTs(ts), src, text) if args.verbose else text)
+            now = time.monotonic()
+            if args.report and now - tReport >= args.report:
+                last = report(now - tReport, last)
+                tReport = now
+            if (args.duration and now - tStart >= args.duration) or \
+               (args.count and rcv.numDatagrams >= args.count):
+                break
+
+    except KeyboardInterrupt:
+        # eat the exception (like Ctrl-C interrupt)
+        print ("", file=sys.stderr)
+
+    finally:
+        elapsed = max(time.monotonic() - tStart, 1e-9)
+        report(elapsed, (0, 0, 0))
+        if writer:
+            writer.close()
+            print ("Wrote {} bytes to {}".format(writer.numBytes, args.outFile), file=sys.stderr)
+        sock.close()
 
-#---socket creation
-connexion = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-connexion.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-if sys.platform != "win32":
-	connexion.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-
-#---Bind
-try:
-    connexion.bind(('', int(sys.argv[1])))
-except socket.error:
-    print ("connexion failed")
-    connexion.close()
-    sys.exit()
-
-#---wait for and print data
-while 1:
-    data, addr = connexion.recvfrom(1024)
-#    print "messages : ",addr , data
-#    print (time.time(), ":", data)
-    print(data)
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+
+"""
+Spatial grid index shared by the local stand-ins for LiveTraffic's
+online channels: answers radius and bounding box queries over a fixed
+set of positions without looking at positions far off.
+
+Positions are put into cells of 'cellDeg' degrees. A query only looks
+at the cells overlapping the search area, and then checks the exact
+distance or box for the positions in these cells.
+
+
+MIT License
+
+Copyright (c) 2021 B.Hoppe
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import math
+from array import array
+
+EARTH_R_KM = 6371.0
+KM_PER_NM = 1.852
+
+def distKm(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2-lat1)/2)**2 + math.cos(lat1)*math.cos(lat2)*math.sin((lon2-lon1)/2)**2
+    return 2 * EARTH_R_KM * math.asin(min(1.0, math.sqrt(a)))
+
+""" === Grid index over a list of positions ===
+    Queries return the indexes into the lists passed to the constructor.
+"""
+class GridIndex:
+    def __init__(self, lats: list, lons: list, cellDeg: float = 1.0):
+        self.lats = lats
+        self.lons = lons
+        self.cellDeg = cellDeg
+        self.numLon = max(int(round(360.0 / cellDeg)), 1)
+        self.cells = {}                             # (lat idx, lon idx) -> array of indexes
+        for i, (lat, lon) in enumerate(zip(lats, lons)):
+            key = self._cell(lat, lon)
+            c = self.cells.get(key)
+            if c is None:
+                c = self.cells[key] = array('I')
+            c.append(i)
+
+    def __len__(self) -> int:
+        return len(self.lats)
+
+    def _cell(self, lat: float, lon: float) -> tuple:
+        return (math.floor(lat / self.cellDeg), math.floor(lon / self.cellDeg) % self.numLon)
+
+    # candidates of all cells overlapping the box, the box may cross the antimeridian (lomin > lomax)
+    def _candidates(self, lamin: float, lomin: float, lamax: float, lomax: float):
+        d = self.cellDeg
+        if lomax < lomin:
+            lomax += 360.0
+        lonIdx = range(math.floor(lomin / d), math.floor(lomax / d) + 1)
+        if len(lonIdx) > self.numLon:
+            lonIdx = range(self.numLon)
+        cells = self.cells
+        for la in range(math.floor(max(lamin, -90.0) / d), math.floor(min(lamax, 90.0) / d) + 1):
+            for lo in lonIdx:
+                c = cells.get((la, lo % self.numLon))
+                if c:
+                    yield from c
+
+    def queryBox(self, lamin: float, lomin: float, lamax: float, lomax: float) -> list:
+        lats, lons = self.lats, self.lons
+        wrap = lomax < lomin
+        return [i for i in self._candidates(lamin, lomin, lamax, lomax)
+                if lamin <= lats[i] <= lamax and
+                   ((lons[i] >= lomin or lons[i] <= lomax) if wrap else lomin <= lons[i] <= lomax)]
+
+    def queryRadius(self, lat: float, lon: float, dist_km: float) -> list:
+        dLat = math.degrees(dist_km / EARTH_R_KM)
+        cosLat = math.cos(math.radians(lat))
+        if abs(lat) + dLat >= 90.0 or cosLat < 0.01:
+            lomin, lomax = -180.0, 180.0            # close to a pole: all longitudes
+        else:
+            dLon = min(dLat / cosLat, 180.0)
+            lomin, lomax = lon - dLon, lon + dLon
+        lats, lons = self.lats, self.lons
+        return [i for i in self._candidates(lat - dLat, lomin, lat + dLat, lomax)
+                if distKm(lat, lon, lats[i], lons[i]) <= dist_km]
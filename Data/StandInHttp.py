@@ -0,0 +1,198 @@
+#!/usr/bin/python3
+
+"""
+Minimal asyncio HTTP/1.1 server shared by the local stand-ins for
+LiveTraffic's online channels (OpenSky, ADS-B Exchange, OGN).
+
+Only what the channels need is implemented: GET requests, keep-alive,
+fixed-length responses. On top of that responses can be delayed and
+errors injected, so that a channel's behaviour under a slow or failing
+service can be tested.
+
+A stand-in adds the common options with addServerArgs() and passes
+a handler to serve(). The handler is called with the path, the parsed
+query parameters, and the request headers (lower-case names) and returns
+(HTTP status, body, content type) or, if additional response headers
+are needed, (HTTP status, body, content type, dict of headers).
+
+
+MIT License
+
+Copyright (c) 2021 B.Hoppe
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import time
+import random
+import bisect
+import asyncio
+from collections import Counter
+from urllib.parse import urlsplit, parse_qs, unquote
+
+try:
+    import uvloop                   # optional: faster event loop
+except ImportError:
+    uvloop = None
+
+HTTP_OK = 200
+HTTP_BAD_REQUEST = 400
+HTTP_UNAUTHORIZED = 401
+HTTP_NOT_FOUND = 404
+
+_REASON = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 403: 'Forbidden', 404: 'Not Found',
+           405: 'Method Not Allowed', 429: 'Too Many Requests', 500: 'Internal Server Error',
+           502: 'Bad Gateway', 503: 'Service Unavailable', 504: 'Gateway Timeout'}
+
+CT_JSON = 'application/json'
+CT_XML = 'text/xml'
+CT_TEXT = 'text/plain'
+
+""" === Common command line options === """
+def addServerArgs(parser, port: int):
+    parser.add_argument('--host', metavar='NAME_OR_IP', help='Interface to listen on, defaults to \'localhost\'', default='localhost')
+    parser.add_argument('--port', metavar='NUM', help='Port to listen on, defaults to {}'.format(port), type=int, default=port)
+    parser.add_argument('--latency', metavar='MS', help='Delay each response by this many milliseconds', type=float, default=0.0)
+    parser.add_argument('--jitter', metavar='MS', help='Add a random delay of up to this many milliseconds', type=float, default=0.0)
+    parser.add_argument('--errorRate', metavar='FRACTION', help='Answer this fraction of requests with an error, see --errorCodes', type=float, default=0.0)
+    parser.add_argument('--errorCodes', metavar='CODE,...', help='HTTP status codes used for injected errors, picked randomly, defaults to 503', default='503')
+    parser.add_argument('--dropRate', metavar='FRACTION', help='Close the connection without answer for this fraction of requests', type=float, default=0.0)
+    parser.add_argument('-v', '--verbose', help='Verbose output: Informs about request rate and status codes every 10 seconds, and about each request if given twice', action='count', default=0)
+
+""" === Server with latency and error injection === """
+class StandInServer:
+    def __init__(self, handler, args):
+        self.handler = handler
+        self.args = args
+        self.errorCodes = [int(c) for c in args.errorCodes.split(',')]
+        self.numReq = 0
+        self.numConn = 0
+        self.status = Counter()
+
+    def response(self, status: int, body: bytes, contentType: str, keepAlive: bool, extraHdr: dict = None) -> bytes:
+        return b''.join((
+            'HTTP/1.1 {} {}\r\nContent-Type: {}; charset=utf-8\r\nContent-Length: {}\r\nConnection: {}\r\n{}\r\n'.format(
+                status, _REASON.get(status, 'Unknown'), contentType, len(body), 'keep-alive' if keepAlive else 'close',
+                ''.join('{}: {}\r\n'.format(k, v) for k, v in extraHdr.items()) if extraHdr else '').encode('ascii'),
+            body))
+
+    async def client(self, reader, writer):
+        args = self.args
+        self.numConn += 1
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    return
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ', 2)
+                except ValueError:
+                    writer.write(self.response(HTTP_BAD_REQUEST, b'', CT_TEXT, False))
+                    return
+                hdr = {k.strip().lower(): v.strip() for k, _, v in (ln.partition(':') for ln in lines[1:] if ln)}
+                conn = hdr.get('connection', '').lower()
+                keepAlive = conn == 'keep-alive' or (version == 'HTTP/1.1' and conn != 'close')
+                self.numReq += 1
+
+                # injected delay, errors, and dropped connections
+                if args.latency or args.jitter:
+                    await asyncio.sleep((args.latency + random.uniform(0, args.jitter)) / 1000.0)
+                if args.dropRate and random.random() < args.dropRate:
+                    self.status['drop'] += 1
+                    return
+                extraHdr = None
+                if args.errorRate and random.random() < args.errorRate:
+                    status, body, ct = random.choice(self.errorCodes), b'', CT_TEXT
+                elif method != 'GET':
+                    status, body, ct = 405, b'', CT_TEXT
+                else:
+                    url = urlsplit(target)
+                    query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                    try:
+                        res = self.handler(unquote(url.path), query, hdr)
+                        status, body, ct = res[:3]
+                        if len(res) > 3:
+                            extraHdr = res[3]
+                    except (ValueError, KeyError):
+                        status, body, ct = HTTP_BAD_REQUEST, b'', CT_TEXT
+                self.status[status] += 1
+                if args.verbose >= 2:
+                    print ("{} {} -> {} ({} bytes)".format(method, target, status, len(body)))
+                writer.write(self.response(status, body, ct, keepAlive, extraHdr))
+                await writer.drain()
+                if not keepAlive:
+                    return
+        finally:
+            writer.close()
+
+    async def report(self):
+        last, lastNum = time.monotonic(), 0
+        while True:
+            await asyncio.sleep(10.0)
+            now = time.monotonic()
+            print ("{:.0f} requests/s, {} connections, {} requests in total, status: {}".format(
+                (self.numReq - lastNum) / (now - last), self.numConn, self.numReq,
+                ', '.join('{}: {}'.format(k, v) for k, v in sorted(self.status.items(), key=str))))
+            last, lastNum = now, self.numReq
+
+    async def run(self):
+        server = await asyncio.start_server(self.client, self.args.host, self.args.port, backlog=1024)
+        print ("Listening on {}".format(', '.join('{}:{}'.format(*s.getsockname()[:2]) for s in server.sockets)))
+        if self.args.verbose:
+            asyncio.ensure_future(self.report())
+        async with server:
+            await server.serve_forever()
+
+""" === Virtual clock over recorded snapshots ===
+    Starts at the first snapshot's time when created and advances 'speed'
+    times faster than real time, wrapping around at the end. Speed 0 stays
+    at the first snapshot. The last snapshot is served as long as the
+    interval before it, so that it isn't skipped when wrapping around.
+    Without a positive span (one snapshot, or all at the same time) it wraps
+    around after 60s.
+"""
+class VirtualClock:
+    def __init__(self, times: list, speed: float):
+        self.times = times
+        self.speed = speed
+        self.start = time.time()
+        self.span = times[-1] - times[0] + (times[-1] - times[-2] if len(times) > 1 else 0.0)
+        if self.span <= 0.0:
+            self.span = 60.0
+
+    def now(self) -> float:
+        return self.times[0] + ((time.time() - self.start) * self.speed) % self.span
+
+    # index of the current snapshot and virtual time
+    def current(self) -> tuple:
+        vt = self.now()
+        return max(bisect.bisect_right(self.times, vt) - 1, 0), vt
+
+""" === Run a stand-in server until interrupted === """
+def serve(handler, args):
+    srv = StandInServer(handler, args)
+    if uvloop:
+        uvloop.install()
+    try:
+        asyncio.run(srv.run())
+    except KeyboardInterrupt:
+        pass
+    print ("Served {} requests on {} connections".format(srv.numReq, srv.numConn))
@@ -0,0 +1,251 @@
+#!/usr/bin/python3
+
+"""
+Decodes an ADS-B Exchange TCP feed (port 32001, see Data/ADSB/TCP Feed)
+into AITFC records, which SendTraffic.py can replay to LiveTraffic's
+RealTraffic channel.
+
+The feed is a sequence of {"acList":[...]} documents without any delimiter.
+Each document lists all aircraft, but only with the fields which changed
+since the previous document. Fields are merged per aircraft, and a record
+is only written if the aircraft's position changed.
+
+Reads from a (capture) file or from a live TCP connection.
+
+For usage info call
+    python3 ConvADSBExFeed.py -h
+
+
+MIT License
+
+Copyright (c) 2021 B.Hoppe
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import sys
+import re
+import json
+import time
+import socket
+import argparse                     # handling command line arguments
+
+from SendTraffic import openInput
+from ConvADSBExHist import AcFilter, OrderedWriter, acRecords, makeFilter
+
+""" === Split a byte stream into JSON documents ===
+    Bytes are fed as they arrive, complete top-level documents are returned.
+    Scanning resumes where it stopped the last time, so that every byte
+    is looked at only once, no matter in how many pieces a document arrives.
+    Only strings (which may contain braces) and braces are matched.
+    If a document grows beyond 'maxSize' it is dropped and the splitter
+    resynchronizes at the next document start.
+"""
+class DocSplitter:
+    RE_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|"|[{}]')
+    DOC_START = b'{"acList"'
+
+    def __init__(self, maxSize: int):
+        self.maxSize = maxSize
+        self.buf = bytearray()
+        self.scan = 0                   # position to resume scanning at
+        self.start = -1                 # start of current document, -1 if outside one
+        self.depth = 0
+        self.resync = False             # after a drop: skip everything up to the next document start
+        self.numDropped = 0
+
+    def feed(self, data: bytes) -> list:
+        buf = self.buf
+        buf += data
+        docs = []
+        if self.resync:
+            i = buf.find(self.DOC_START)
+            if i < 0:
+                del buf[:max(len(buf) - len(self.DOC_START), 0)]
+                return docs
+            del buf[:i]
+            self.resync = False
+        depth, start, pos = self.depth, self.start, self.scan
+        for m in self.RE_TOKEN.finditer(buf, pos):
+            tok = m.group()
+            if tok == b'"':                     # incomplete string at the end: wait for more
+                pos = m.start()
+                break
+            pos = m.end()
+            if tok == b'{':
+                if depth == 0:
+                    start = m.start()
+                depth += 1
+            elif tok == b'}':
+                if depth == 0:                  # stray closing brace, ignore
+                    continue
+                depth -= 1
+                if depth == 0:
+                    docs.append(bytes(buf[start:pos]))
+                    start = -1
+        else:
+            pos = len(buf)
+
+        # throw away what is consumed
+        keep = start if start >= 0 else pos
+        if keep:
+            del buf[:keep]
+            pos -= keep
+            start = 0 if start >= 0 else -1
+
+        # document too large: drop it and resync at the next document start
+        if len(buf) > self.maxSize:
+            self.numDropped += 1
+            buf.clear()
+            depth, start, pos = 0, -1, 0
+            self.resync = True
+        self.depth, self.start, self.scan = depth, start, pos
+        return docs
+
+""" === Merge delta documents into aircraft states ===
+    Returns the records of aircraft, whose position changed.
+"""
+_POS_KEYS = ('Lat', 'Long', 'Alt', 'Gnd')
+
+class FeedState:
+    def __init__(self, filt: AcFilter, maxAge: float):
+        self.filt = filt
+        self.maxAge = maxAge
+        self.acs = {}                   # Icao -> merged aircraft fields
+        self.lastSeen = {}              # Icao -> timestamp
+        self.lastPurge = 0.0
+
+    def update(self, doc: dict, ts: float) -> list:
+        acs, lastSeen = self.acs, self.lastSeen
+        recs = []
+        for delta in doc.get('acList') or []:
+            icao = delta.get('Icao')
+            if not icao:
+                continue
+            ac = acs.get(icao)
+            if ac is None:
+                ac = acs[icao] = {}
+            ac.update(delta)
+            lastSeen[icao] = ts
+            if 'Lat' in ac and ('Alt' in ac or ac.get('Gnd')) and any(k in delta for k in _POS_KEYS):
+                ac['PosTime'] = ts * 1000.0
+                recs.extend(acRecords(ac, self.filt, False))
+
+        # forget aircraft not seen for a while
+        if ts - self.lastPurge > self.maxAge:
+            for icao in [i for i, t in lastSeen.items() if ts - t > self.maxAge]:
+                del acs[icao]
+                del lastSeen[icao]
+            self.lastPurge = ts
+        return recs
+
+""" === Input: file or live TCP connection, read in chunks === """
+def readChunks(args):
+    if args.connect:
+        host, _, port = args.connect.rpartition(':')
+        with socket.create_connection((host or 'localhost', int(port))) as sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+            while True:
+                data = sock.recv(args.chunkSize)
+                if not data:
+                    return
+                yield data
+    else:
+        with openInput(args.inFile) as f:
+            while True:
+                data = f.read(args.chunkSize)
+                if not data:
+                    return
+                yield data
+
+""" === MAIN === """
+def main():
+    # --- Handling command line argumens ---
+    parser = argparse.ArgumentParser(description='ConvADSBExFeed 1.0.0: Decodes an ADS-B Exchange TCP feed (concatenated acList documents with changed fields only) '
+        'into AITFC records, which SendTraffic.py can replay to LiveTraffic\'s RealTraffic channel. Records are only written for aircraft with a changed position.',fromfile_prefix_chars='@')
+    parser.add_argument('inFile', help='Captured feed, optionally compressed, \'-\' for stdin', nargs='?', default='-')
+    parser.add_argument('--connect', metavar='HOST:PORT', help='Read from a live TCP feed instead of a file, like localhost:32001')
+    parser.add_argument('-o', '--outFile', metavar='FILE', help='Output file for the AITFC records, <stdout> by default')
+    parser.add_argument('--box', metavar='LAT_MIN,LON_MIN,LAT_MAX,LON_MAX', help='Only aircraft inside this bounding box')
+    parser.add_argument('--centre', metavar='LAT,LON', help='Only aircraft around this centre point, see --dist')
+    parser.add_argument('--dist', metavar='KM', help='Distance around --centre in kilometers, defaults to 100', type=float, default=100.0)
+    parser.add_argument('--minAlt', metavar='FT', help='Only aircraft at or above this altitude', type=float)
+    parser.add_argument('--maxAlt', metavar='FT', help='Only aircraft at or below this altitude', type=float)
+    parser.add_argument('--maxAge', metavar='SEC', help='Forget aircraft not listed for this many seconds, defaults to 120', type=float, default=120.0)
+    parser.add_argument('--startTs', metavar='TS', help='File input: Timestamp of the first document, defaults to now', type=float)
+    parser.add_argument('--interval', metavar='SEC', help='File input: Seconds between two documents, defaults to 1', type=float, default=1.0)
+    parser.add_argument('--chunkSize', metavar='BYTES', help='Bytes read at once, defaults to 65536', type=int, default=65536)
+    parser.add_argument('--maxDoc', metavar='MB', help='Maximum size of one document, larger ones are dropped, defaults to 64', type=float, default=64.0)
+    parser.add_argument('-v', '--verbose', help='Verbose output: Informs about throughput every 10 seconds and about each document', action='store_true')
+
+    args = parser.parse_args()
+    filt = makeFilter(parser, args)
+    filt.maxAge = None                          # positions carry no timestamp, see --maxAge for aircraft
+    splitter = DocSplitter(int(args.maxDoc * 1024 * 1024))
+    state = FeedState(filt, args.maxAge)
+    fileTs = args.startTs if args.startTs is not None else time.time()
+
+    out = open(args.outFile, 'w', encoding='ascii', errors='replace', newline='\n') if args.outFile else sys.stdout
+    writer = OrderedWriter(out, 0)
+    numDocs = numAc = numBytes = numErr = 0
+    start = lastReport = time.monotonic()
+    lastDocs = lastAc = 0
+    try:
+        for data in readChunks(args):
+            numBytes += len(data)
+            for raw in splitter.feed(data):
+                try:
+                    doc = json.loads(raw)
+                except ValueError:
+                    numErr += 1
+                    continue
+                # live: time of receipt, file: as configured
+                if args.connect:
+                    ts = doc['stm'] / 1000.0 if isinstance(doc.get('stm'), (int, float)) else round(time.time(), 3)
+                else:
+                    ts = fileTs + numDocs * args.interval
+                recs = state.update(doc, ts)
+                writer.add(recs)
+                writer.flush()
+                numDocs += 1
+                numAc += len(doc.get('acList') or [])
+                if args.verbose and not args.connect:
+                    print ("Document {}: {} aircraft, {} records".format(numDocs, len(doc.get('acList') or []), len(recs)), file=sys.stderr)
+
+            # throughput
+            now = time.monotonic()
+            if args.verbose and now - lastReport >= 10.0:
+                print ("{:.1f} documents/s, {:.0f} aircraft/s".format(
+                    (numDocs - lastDocs) / (now - lastReport), (numAc - lastAc) / (now - lastReport)), file=sys.stderr)
+                lastReport, lastDocs, lastAc = now, numDocs, numAc
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.flush()
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.monotonic() - start
+    print ("Decoded {} documents ({:.1f} MB) with {} aircraft entries into {} records in {:.1f}s: {:.1f} documents/s, {:.0f} aircraft/s{}".format(
+        numDocs, numBytes / 1e6, numAc, writer.numWritten, elapsed,
+        numDocs / elapsed if elapsed else 0, numAc / elapsed if elapsed else 0,
+        ", dropped {} oversized and {} invalid documents".format(splitter.numDropped, numErr) if splitter.numDropped or numErr else ""), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
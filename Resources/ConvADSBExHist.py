@@ -0,0 +1,455 @@
+#!/usr/bin/python3
+
+"""
+Converts ADS-B Exchange historical data files (one JSON file per minute,
+as read by LiveTraffic's "ADS-B Exchange Historic" channel) into
+time-ordered AITFC records, which SendTraffic.py can replay
+to LiveTraffic's RealTraffic channel.
+
+The files are parsed incrementally, one aircraft object at a time,
+so memory use does not depend on file size.
+
+For usage info call
+    python3 ConvADSBExHist.py -h
+
+
+MIT License
+
+Copyright (c) 2021 B.Hoppe
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os
+import sys
+import time
+import io
+import re
+import json
+import math
+import heapq
+import calendar
+import multiprocessing
+import argparse                     # handling command line arguments
+from pathlib import Path
+
+from SendTraffic import openInput
+
+KM_PER_DEG_LAT = 111.2              # rough km per degree latitude, good enough for a bounding box
+
+# File name of a historic file, see ADSBEX_HIST_FILE_NAME
+RE_HIST_FILE = re.compile(r'(\d{4})-(\d\d)-(\d\d)-(\d\d)(\d\d)Z')
+
+""" === Stream JSON objects out of a JSON array ===
+    Reads the text stream in chunks and decodes one array element after the other
+    from the buffer with json.JSONDecoder.raw_decode. Consumed text is dropped,
+    so the buffer holds at most one chunk plus one element.
+    Yields all elements of the array following the key 'arrKey', e.g. "acList",
+    with 'raw' as tuples of the element and its original JSON text.
+"""
+def iterJsonArray(f, arrKey: str, chunkSize: int = 1 << 20, raw: bool = False):
+    dec = json.JSONDecoder()
+    buf = ''
+    pos = 0
+
+    def more() -> bool:
+        nonlocal buf, pos
+        data = f.read(chunkSize)
+        if not data:
+            return False
+        buf = buf[pos:] + data
+        pos = 0
+        return True
+
+    # find the start of the array
+    key = '"' + arrKey + '"'
+    while True:
+        i = buf.find(key, pos)
+        if i >= 0:
+            j = buf.find('[', i + len(key))
+            if j >= 0:
+                pos = j + 1
+                break
+        else:
+            pos = max(pos, len(buf) - len(key))
+        if not more():
+            return
+
+    # decode array elements
+    while True:
+        # skip whitespace and separating commas
+        while pos < len(buf) and buf[pos] in ' \t\r\n,':
+            pos += 1
+        if pos >= len(buf):
+            if not more():
+                return
+            continue
+        if buf[pos] == ']':
+            return
+        try:
+            obj, end = dec.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            # element incomplete: read more and try again
+            if not more():
+                raise
+            continue
+        yield (obj, buf[pos:end]) if raw else obj
+        pos = end
+
+""" === Bounding box, altitude, and freshness filter === """
+class AcFilter:
+    def __init__(self, box=None, minAlt=None, maxAlt=None, maxAge=None):
+        self.box = box                      # (lat_min, lon_min, lat_max, lon_max) or None
+        self.minAlt = minAlt                # feet
+        self.maxAlt = maxAlt
+        self.maxAge = maxAge                # seconds
+
+    # box around a centre point, like LiveTraffic's boundingBoxTy
+    @staticmethod
+    def boxAround(lat: float, lon: float, dist_km: float) -> tuple:
+        dLat = dist_km / KM_PER_DEG_LAT
+        dLon = dist_km / (KM_PER_DEG_LAT * max(math.cos(math.radians(lat)), 0.01))
+        return (max(lat - dLat, -90.0), (lon - dLon + 540.0) % 360.0 - 180.0,
+                min(lat + dLat, 90.0), (lon + dLon + 540.0) % 360.0 - 180.0)
+
+    def inBox(self, lat, lon) -> bool:
+        if lat is None or lon is None:
+            return False
+        if not self.box:
+            return True
+        latMin, lonMin, latMax, lonMax = self.box
+        if not latMin <= lat <= latMax:
+            return False
+        if lonMin <= lonMax:
+            return lonMin <= lon <= lonMax
+        return lon >= lonMin or lon <= lonMax        # box crosses the antimeridian
+
+    def altOK(self, alt) -> bool:
+        if self.minAlt is not None and (alt is None or alt < self.minAlt):
+            return False
+        if self.maxAlt is not None and (alt is None or alt > self.maxAlt):
+            return False
+        return True
+
+""" === Convert one aircraft object into AITFC records ===
+    Returns a list of tuples (timestamp, hexId, line without timestamp).
+    With 'trails' the positions of the short trail ("Cos") are added, too.
+"""
+def _txt(ac: dict, key: str) -> str:
+    v = ac.get(key)
+    return str(v).replace(',', ' ').strip() if v is not None else ''
+
+def _num(v) -> float:
+    return v if isinstance(v, (int, float)) and not isinstance(v, bool) else 0.0
+
+def _course(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    return math.degrees(math.atan2(math.sin(lon2-lon1)*math.cos(lat2),
+                                   math.cos(lat1)*math.sin(lat2) - math.sin(lat1)*math.cos(lat2)*math.cos(lon2-lon1))) % 360.0
+
+def acRecords(ac: dict, filt: AcFilter, trails: bool) -> list:
+    try:
+        hexId = int(ac['Icao'], 16)
+    except (KeyError, ValueError, TypeError):
+        return []
+    gnd = bool(ac.get('Gnd'))
+    hdg, spd, vsi = _num(ac.get('Trak')), _num(ac.get('Spd')), _num(ac.get('Vsi'))
+    # origin/destination come as "EDDL Düsseldorf, Germany", we only want the code
+    static = ','.join((_txt(ac, 'Call'), _txt(ac, 'Type'), _txt(ac, 'Reg'),
+                       _txt(ac, 'From').split(' ')[0], _txt(ac, 'To').split(' ')[0]))
+    recs = []
+
+    # trail positions: quadruples of lat, lon, time, alt
+    if trails:
+        cos = ac.get('Cos') or []
+        pts = [cos[i:i+4] for i in range(0, len(cos) - 3, 4)]
+        for i, (lat, lon, ms, alt) in enumerate(pts):
+            if not filt.inBox(lat, lon) or ms is None or not filt.altOK(alt):
+                continue
+            # heading: towards next trail point, if there is one
+            trk = _course(lat, lon, pts[i+1][0], pts[i+1][1]) if i+1 < len(pts) and pts[i+1][0] is not None else hdg
+            recs.append((ms / 1000.0, hexId, 'AITFC,{},{:.6f},{:.6f},{:.0f},{:.0f},{},{:.0f},{:.0f},{}'.format(
+                hexId, lat, lon, 0 if gnd else _num(alt), vsi, 0 if gnd else 1, trk, spd, static)))
+
+    # main position
+    lat, lon, ms = ac.get('Lat'), ac.get('Long'), ac.get('PosTime')
+    alt = 0 if gnd else ac.get('Alt')
+    if filt.inBox(lat, lon) and ms is not None and filt.altOK(alt):
+        recs.append((ms / 1000.0, hexId, 'AITFC,{},{:.6f},{:.6f},{:.0f},{:.0f},{},{:.0f},{:.0f},{}'.format(
+            hexId, lat, lon, _num(alt), vsi, 0 if gnd else 1, hdg, spd, static)))
+    return recs
+
+""" === Convert one historic file ===
+    Like ADSBExchangeHistorical::ProcessFetchedData, only one line per aircraft is used:
+    the one with the best quality (signal level plus number of trail points).
+    Returns (file timestamp, list of records).
+"""
+def fileTimestamp(path: str):
+    m = RE_HIST_FILE.search(Path(path).name)
+    return calendar.timegm(tuple(int(g) for g in m.groups()) + (0,)) if m else None
+
+def convertFile(path: str, filt: AcFilter, trails: bool) -> tuple:
+    best = {}                                   # Icao -> (quality, position time, records)
+    newest = 0
+    with io.TextIOWrapper(openInput(path), encoding='utf-8') as f:
+        for ac in iterJsonArray(f, 'acList'):
+            # quick position check: Lat/Long or first trail point
+            lat, lon = ac.get('Lat'), ac.get('Long')
+            if lat is None or lon is None:
+                cos = ac.get('Cos')
+                if not cos or len(cos) < 2:
+                    continue
+                lat, lon = cos[0], cos[1]
+            if not filt.inBox(lat, lon):
+                continue
+            posTime = _num(ac.get('PosTime')) / 1000.0
+            newest = max(newest, posTime)
+            icao = ac.get('Icao')
+            qual = _num(ac.get('Sig')) + len(ac.get('Cos') or []) // 4
+            # only the converted records are kept, not the (large) aircraft object
+            if icao not in best or qual > best[icao][0]:
+                best[icao] = (qual, posTime, acRecords(ac, filt, trails))
+
+    # freshness is relative to the file's minute, or the newest position in the file
+    fileTs = fileTimestamp(path) or newest
+    recs = []
+    for _, posTime, acRecs in best.values():
+        if filt.maxAge is None or fileTs - posTime <= filt.maxAge:
+            recs.extend(acRecs)
+    return fileTs, recs
+
+""" === Time-ordered output ===
+    Records of consecutive files overlap in time (trails, stale positions),
+    so records are kept in a heap and only written once they are older than
+    the current file's time minus 'window'. Per aircraft, only records newer
+    than the last written one are output.
+"""
+class OrderedWriter:
+    def __init__(self, out, window: float):
+        self.out = out
+        self.window = window
+        self.heap = []
+        self.lastTs = {}                        # hexId -> last written timestamp
+        self.numWritten = 0
+        self.numSkipped = 0
+
+    def add(self, recs: list):
+        for r in recs:
+            heapq.heappush(self.heap, r)
+
+    def flush(self, before: float = math.inf):
+        heap, lastTs = self.heap, self.lastTs
+        while heap and heap[0][0] < before:
+            ts, hexId, ln = heapq.heappop(heap)
+            if ts <= lastTs.get(hexId, 0.0):
+                self.numSkipped += 1
+                continue
+            lastTs[hexId] = ts
+            self.out.write('{},{}\n'.format(ln, int(ts) if ts.is_integer() else '{:.3f}'.format(ts)))
+            self.numWritten += 1
+
+""" === Batch conversion with a process pool ===
+    Each input file is converted by a worker process into a sorted run file in the work directory.
+    Run files are written under a temporary name and renamed when complete, so after an
+    interruption existing runs are reused ('resume'). Runs are only reused if the filter
+    and --trails options, stored in the work directory, are the same as before.
+    Finally, all runs are k-way merged into one time-ordered stream,
+    in several passes if there are more runs than --fanIn.
+"""
+RUN_OPTIONS = 'options.json'
+# same order as the records in convertToRun and OrderedWriter: timestamp, hex id, record
+def _runKey(ln: str) -> tuple:
+    rec, _, ts = ln.rpartition(',')
+    return float(ts), int(rec.split(',', 2)[1]), rec
+
+def convertToRun(task: tuple) -> tuple:
+    path, runPath, filt, trails = task
+    _, recs = convertFile(path, filt, trails)
+    recs.sort()
+    tmpPath = runPath + '.tmp'
+    with open(tmpPath, 'w', encoding='ascii', errors='replace', newline='\n') as f:
+        for ts, _, ln in recs:
+            f.write('{},{}\n'.format(ln, int(ts) if ts.is_integer() else '{:.3f}'.format(ts)))
+    os.replace(tmpPath, runPath)
+    return path, len(recs)
+
+def mergeRuns(runs: list, out, fanIn: int, workDir: Path) -> tuple:
+    # too many runs to open at once? Merge groups into intermediate runs first
+    level = 0
+    while len(runs) > fanIn:
+        merged = []
+        for i in range(0, len(runs), fanIn):
+            mPath = str(workDir / 'merge{}_{:05d}.run'.format(level, i // fanIn))
+            with open(mPath, 'w', encoding='ascii', newline='\n') as f:
+                mergeRuns(runs[i:i+fanIn], f, fanIn, workDir)
+            merged.append(mPath)
+        runs = merged
+        level += 1
+
+    # k-way merge, per aircraft only records newer than the last written one
+    files = [open(r, 'r', encoding='ascii') for r in runs]
+    lastTs = {}
+    numWritten = numSkipped = 0
+    try:
+        for ln in heapq.merge(*files, key=_runKey):
+            ts, hexId, _ = _runKey(ln)
+            if ts <= lastTs.get(hexId, 0.0):
+                numSkipped += 1
+                continue
+            lastTs[hexId] = ts
+            out.write(ln)
+            numWritten += 1
+    finally:
+        for f in files:
+            f.close()
+    return numWritten, numSkipped
+
+def convertBatch(paths: list, filt: AcFilter, args, out):
+    workDir = Path(args.workDir or ((args.outFile or 'ConvADSBExHist') + '.runs'))
+    workDir.mkdir(parents=True, exist_ok=True)
+    runs = [str(workDir / (Path(p).name + '.run')) for p in paths]
+
+    # runs converted with other options can't be reused
+    options = {'box': list(filt.box) if filt.box else None, 'minAlt': filt.minAlt, 'maxAlt': filt.maxAlt,
+               'maxAge': filt.maxAge, 'trails': args.trails}
+    optPath = workDir / RUN_OPTIONS
+    try:
+        with open(optPath) as f:
+            prevOptions = json.load(f)
+    except (OSError, ValueError):
+        prevOptions = None
+    if prevOptions != options:
+        stale = list(workDir.glob('*.run'))
+        if stale:
+            print ("Options differ from the runs in {}, converting all files again".format(workDir), file=sys.stderr)
+            for r in stale:
+                r.unlink()
+        with open(optPath, 'w') as f:
+            json.dump(options, f)
+
+    # convert what's not yet converted
+    tasks = [(p, r, filt, args.trails) for p, r in zip(paths, runs) if not os.path.exists(r)]
+    numDone = len(paths) - len(tasks)
+    if numDone:
+        print ("Resuming: {} of {} files already converted in {}".format(numDone, len(paths), workDir), file=sys.stderr)
+    start = time.monotonic()
+    with multiprocessing.Pool(args.jobs or None) as pool:
+        for n, (path, numRecs) in enumerate(pool.imap_unordered(convertToRun, tasks), 1):
+            elapsed = time.monotonic() - start
+            eta = elapsed / n * (len(tasks) - n)
+            print ("\r{}/{} files converted, {:.1f} files/s, ETA {:.0f}s   ".format(
+                numDone + n, len(paths), n / elapsed, eta), end='', file=sys.stderr)
+            if args.verbose:
+                print ("\n{}: {} records".format(path, numRecs), end='', file=sys.stderr)
+    if tasks:
+        print ("", file=sys.stderr)
+
+    # merge all runs into the output
+    print ("Merging {} runs...".format(len(runs)), file=sys.stderr)
+    numWritten, numSkipped = mergeRuns(runs, out, args.fanIn, workDir)
+    print ("Wrote {} records, skipped {} duplicate records".format(numWritten, numSkipped), file=sys.stderr)
+
+    # cleanup
+    if not args.keepRuns:
+        for r in workDir.glob('*.run'):
+            r.unlink()
+        optPath.unlink()
+        try:
+            workDir.rmdir()
+        except OSError:
+            pass
+
+""" === List input files: files as given, directories in name order === """
+def listInputs(inputs: list) -> list:
+    paths = []
+    for i in inputs:
+        p = Path(i)
+        if p.is_dir():
+            paths += sorted(str(f) for f in p.rglob('*.json*'))
+        else:
+            paths.append(i)
+    return paths
+
+""" === Command line parser, shared with batch mode === """
+def makeParser(description: str) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description, fromfile_prefix_chars='@')
+    parser.add_argument('inFile', help='ADS-B Exchange historic files (yyyy-mm-dd-hhmmZ.json), optionally compressed, or directories thereof, in chronological order', nargs='+')
+    parser.add_argument('-o', '--outFile', metavar='FILE', help='Output file for the AITFC records, <stdout> by default')
+    parser.add_argument('--box', metavar='LAT_MIN,LON_MIN,LAT_MAX,LON_MAX', help='Only aircraft inside this bounding box')
+    parser.add_argument('--centre', metavar='LAT,LON', help='Only aircraft around this centre point, see --dist')
+    parser.add_argument('--dist', metavar='KM', help='Distance around --centre in kilometers, defaults to 100', type=float, default=100.0)
+    parser.add_argument('--minAlt', metavar='FT', help='Only aircraft at or above this altitude', type=float)
+    parser.add_argument('--maxAlt', metavar='FT', help='Only aircraft at or below this altitude', type=float)
+    parser.add_argument('--maxAge', metavar='SEC', help='Skip positions older than this many seconds compared to the file\'s minute, defaults to 120', type=float, default=120.0)
+    parser.add_argument('--trails', help='Also output the positions of the short trails ("Cos"), gives denser tracks', action='store_true')
+    parser.add_argument('--window', metavar='SEC', help='Records of consecutive files can overlap by this many seconds, defaults to 180', type=float, default=180.0)
+    parser.add_argument('-j', '--jobs', metavar='NUM', help='Batch mode: convert files in parallel with NUM worker processes (0: one per CPU) into sorted runs, then merge them', type=int)
+    parser.add_argument('--workDir', metavar='DIR', help='Batch mode: directory for the sorted runs, defaults to <outFile>.runs. Converting again with the same directory resumes an interrupted conversion')
+    parser.add_argument('--fanIn', metavar='NUM', help='Batch mode: maximum number of runs merged at once, defaults to 200', type=int, default=200)
+    parser.add_argument('--keepRuns', help='Batch mode: keep the run files after merging', action='store_true')
+    parser.add_argument('-v', '--verbose', help='Verbose output: Informs about each processed file', action='store_true')
+    return parser
+
+def makeFilter(parser, args) -> AcFilter:
+    box = None
+    try:
+        if args.box:
+            box = tuple(float(v) for v in args.box.split(','))
+            if len(box) != 4:
+                raise ValueError
+        elif args.centre:
+            lat, lon = (float(v) for v in args.centre.split(','))
+            box = AcFilter.boxAround(lat, lon, args.dist)
+    except ValueError:
+        parser.error('Invalid --box or --centre value')
+    return AcFilter(box, args.minAlt, args.maxAlt, args.maxAge)
+
+""" === MAIN === """
+def main():
+    # --- Handling command line argumens ---
+    parser = makeParser('ConvADSBExHist 1.0.0: Converts ADS-B Exchange historic data files into time-ordered AITFC records, '
+        'which SendTraffic.py can replay to LiveTraffic\'s RealTraffic channel. Files are parsed incrementally with bounding box, altitude, and freshness filter applied. '
+        'For a full day of files use batch mode (--jobs), which converts files in parallel and can resume after an interruption.')
+    args = parser.parse_args()
+    filt = makeFilter(parser, args)
+
+    out = open(args.outFile, 'w', encoding='ascii', errors='replace', newline='\n') if args.outFile else sys.stdout
+    writer = OrderedWriter(out, args.window)
+    try:
+        # batch mode with a process pool
+        if args.jobs is not None or args.workDir:
+            convertBatch(listInputs(args.inFile), filt, args, out)
+            return
+
+        # sequential conversion
+        for path in listInputs(args.inFile):
+            fileTs, recs = convertFile(path, filt, args.trails)
+            writer.add(recs)
+            writer.flush(fileTs - args.window)
+            if args.verbose:
+                print ("{}: {} records".format(path, len(recs)), file=sys.stderr)
+        writer.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if args.verbose:
+        print ("Wrote {} records, skipped {} duplicate or out-of-order records".format(writer.numWritten, writer.numSkipped), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
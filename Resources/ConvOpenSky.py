@@ -0,0 +1,213 @@
+#!/usr/bin/python3
+
+"""
+Converts OpenSky Network state snapshots, as returned by
+    https://opensky-network.org/api/states/all
+(see Data/OpenSky/OpenSky_20180420_1955_UTC.json), into time-ordered AITFC records,
+which SendTraffic.py can replay to LiveTraffic's RealTraffic channel.
+
+Input files can be a single (pretty-printed) snapshot or any number of
+snapshots, one JSON document per line, optionally compressed.
+
+For usage info call
+    python3 ConvOpenSky.py -h
+
+
+MIT License
+
+Copyright (c) 2021 B.Hoppe
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import sys
+import io
+import json
+import math
+import argparse                     # handling command line arguments
+from itertools import compress
+
+from SendTraffic import openInput
+from ConvADSBExHist import AcFilter, OrderedWriter, listInputs, makeFilter, KM_PER_DEG_LAT
+
+# Indexes into a state vector, same as in LTOpenSky.h
+OPSKY_TRANSP_ICAO   = 0
+OPSKY_CALL          = 1
+OPSKY_POS_TIME      = 3
+OPSKY_LON           = 5
+OPSKY_LAT           = 6
+OPSKY_BARO_ALT      = 7
+OPSKY_GND           = 8
+OPSKY_SPD           = 9
+OPSKY_HEADING       = 10
+OPSKY_VSI           = 11
+OPSKY_GEO_ALT       = 13
+
+FT_PER_M = 3.28084
+KN_PER_MPS = 1.94384
+FPM_PER_MPS = 196.85
+
+""" === Read snapshots ===
+    Yields one snapshot document at a time, so that memory use is bound
+    by the size of a single snapshot, not by the size of the archive.
+"""
+def iterSnapshots(path: str):
+    with io.TextIOWrapper(openInput(path), encoding='utf-8') as f:
+        first = f.readline()
+        try:
+            doc = json.loads(first)
+        except json.JSONDecodeError:
+            # not one snapshot per line, but a single pretty-printed snapshot
+            yield json.loads(first + f.read())
+            return
+        yield doc
+        for ln in f:
+            if ln.strip():
+                yield json.loads(ln)
+
+""" === Convert one snapshot ===
+    The states array is processed column-wise: it is transposed once,
+    then each column is converted and filtered as a whole.
+    'last' keeps the last converted state per aircraft between snapshots,
+    states with a position time not newer than that are unchanged and skipped.
+    With 'extrapolate' > 0 gaps up to that many seconds since an aircraft's
+    previous state are filled with one dead-reckoned record per second.
+    Returns a list of tuples (timestamp, hexId, line without timestamp).
+"""
+_fmtAITFC = 'AITFC,{},{:.6f},{:.6f},{:.0f},{:.0f},{},{:.0f},{:.0f},{}'.format
+
+def _nz(col) -> list:
+    return [v if v is not None else 0.0 for v in col]
+
+# empty or malformed icao24 values give -1, so that the state is skipped
+def _hexId(h) -> int:
+    try:
+        return int(h, 16)
+    except (ValueError, TypeError):
+        return -1
+
+def _alt(gnd, baro, geo):
+    if gnd:
+        return 0.0
+    alt = baro if baro is not None else geo
+    return alt * FT_PER_M if alt is not None else None
+
+def convertSnapshot(states: list, filt: AcFilter, last: dict, extrapolate: int, cutOff: float) -> list:
+    if not states:
+        return []
+    cols = list(zip(*states))
+
+    # aircraft with a new position inside the filter
+    hexIds = list(map(_hexId, cols[OPSKY_TRANSP_ICAO]))
+    posTimes, lats, lons, gnds = cols[OPSKY_POS_TIME], cols[OPSKY_LAT], cols[OPSKY_LON], cols[OPSKY_GND]
+    alts = list(map(_alt, gnds, cols[OPSKY_BARO_ALT], cols[OPSKY_GEO_ALT]))
+    lastGet = last.get
+    keep = [h >= 0 and t is not None and t > cutOff and t > lastGet(h, (0.0,))[0] and
+            la is not None and lo is not None and al is not None and
+            filt.inBox(la, lo) and filt.altOK(al)
+            for h, t, la, lo, al in zip(hexIds, posTimes, lats, lons, alts)]
+    if not any(keep):
+        return []
+
+    # convert the remaining columns to AITFC units
+    sel = lambda col: list(compress(col, keep))
+    hexIds, posTimes, lats, lons, alts, gnds = sel(hexIds), sel(posTimes), sel(lats), sel(lons), sel(alts), sel(gnds)
+    hdgs = [h % 360.0 for h in _nz(sel(cols[OPSKY_HEADING]))]
+    spds = [s * KN_PER_MPS for s in _nz(sel(cols[OPSKY_SPD]))]
+    vsis = [0.0 if g else v * FPM_PER_MPS for g, v in zip(gnds, _nz(sel(cols[OPSKY_VSI])))]
+    airb = [0 if g else 1 for g in gnds]
+    statics = [(c or '').strip().replace(',', ' ') + ',,,,' for c in sel(cols[OPSKY_CALL])]
+
+    recs = []
+    for hexId, st in zip(hexIds, zip(posTimes, lats, lons, alts, vsis, airb, hdgs, spds, statics)):
+        # fill the gap since the previous state by dead reckoning
+        prev = lastGet(hexId)
+        if extrapolate and prev:
+            recs.extend(extrapolateState(hexId, prev, min(st[0], prev[0] + extrapolate + 1)))
+        last[hexId] = st
+        recs.append((float(st[0]), hexId, _fmtAITFC(hexId, *st[1:])))
+    return recs
+
+""" === Dead reckoning ===
+    One record per full second after the state's position time up to (excluding) 'until',
+    moving on with the state's heading, speed, and vertical speed.
+"""
+def extrapolateState(hexId: int, st: tuple, until: float) -> list:
+    t0, lat0, lon0, alt0, vsi, airb, hdg, spd, static = st
+    dist_km = spd / KN_PER_MPS / 1000.0                 # km per second
+    dLat = dist_km * math.cos(math.radians(hdg)) / KM_PER_DEG_LAT
+    dLon = dist_km * math.sin(math.radians(hdg)) / (KM_PER_DEG_LAT * max(math.cos(math.radians(lat0)), 0.01))
+    dAlt = vsi / 60.0
+    recs = []
+    dt = 1
+    while t0 + dt < until:
+        recs.append((float(t0 + dt), hexId, _fmtAITFC(hexId, lat0 + dLat*dt, (lon0 + dLon*dt + 540.0) % 360.0 - 180.0,
+                                                       max(alt0 + dAlt*dt, 0.0), vsi, airb, hdg, spd, static)))
+        dt += 1
+    return recs
+
+""" === MAIN === """
+def main():
+    # --- Handling command line argumens ---
+    parser = argparse.ArgumentParser(description='ConvOpenSky 1.0.0: Converts OpenSky Network state snapshots (api/states/all responses) into time-ordered AITFC records, '
+        'which SendTraffic.py can replay to LiveTraffic\'s RealTraffic channel. Unchanged states are skipped, gaps between states can be filled by extrapolation.',fromfile_prefix_chars='@')
+    parser.add_argument('inFile', help='OpenSky snapshot files, a single snapshot or one snapshot per line, optionally compressed, or directories thereof, in chronological order', nargs='+')
+    parser.add_argument('-o', '--outFile', metavar='FILE', help='Output file for the AITFC records, <stdout> by default')
+    parser.add_argument('--box', metavar='LAT_MIN,LON_MIN,LAT_MAX,LON_MAX', help='Only aircraft inside this bounding box')
+    parser.add_argument('--centre', metavar='LAT,LON', help='Only aircraft around this centre point, see --dist')
+    parser.add_argument('--dist', metavar='KM', help='Distance around --centre in kilometers, defaults to 100', type=float, default=100.0)
+    parser.add_argument('--minAlt', metavar='FT', help='Only aircraft at or above this altitude', type=float)
+    parser.add_argument('--maxAlt', metavar='FT', help='Only aircraft at or below this altitude', type=float)
+    parser.add_argument('--maxAge', metavar='SEC', help='Skip positions older than this many seconds compared to the snapshot\'s time, defaults to 120', type=float, default=120.0)
+    parser.add_argument('--extrapolate', metavar='SEC', help='Fill gaps between an aircraft\'s states with one extrapolated record per second, for up to SEC seconds', type=int, default=0)
+    parser.add_argument('--window', metavar='SEC', help='Records of consecutive snapshots can overlap by this many seconds, defaults to 180', type=float, default=180.0)
+    parser.add_argument('-v', '--verbose', help='Verbose output: Informs about each processed snapshot', action='store_true')
+
+    args = parser.parse_args()
+    filt = makeFilter(parser, args)
+    if args.window <= args.maxAge:
+        parser.error('--window must be larger than --maxAge')
+
+    out = open(args.outFile, 'w', encoding='ascii', errors='replace', newline='\n') if args.outFile else sys.stdout
+    writer = OrderedWriter(out, args.window)
+    last = {}                                   # hexId -> last converted state
+    numSnap = numStates = 0
+    try:
+        for path in listInputs(args.inFile):
+            for snap in iterSnapshots(path):
+                snapTs = snap.get('time') or 0
+                states = snap.get('states') or []
+                recs = convertSnapshot(states, filt, last, args.extrapolate,
+                                       snapTs - args.maxAge if args.maxAge is not None else 0)
+                writer.add(recs)
+                writer.flush(snapTs - args.window)
+                numSnap += 1
+                numStates += len(states)
+                if args.verbose:
+                    print ("{}: snapshot {}: {} states, {} records".format(path, snapTs, len(states), len(recs)), file=sys.stderr)
+        writer.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if args.verbose:
+        print ("Converted {} states of {} snapshots into {} records, skipped {} out-of-order records".format(
+            numStates, numSnap, writer.numWritten, writer.numSkipped), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+#!/usr/bin/python3
+
+"""
+Generates a large synthetic fleet of aircraft flying great-circle routes
+around a centre point and sends their positions via UDP in RealTraffic's
+AITFC format, so that LiveTraffic's RealTraffic channel can be load-tested
+with far more traffic than any recording contains.
+
+For usage info call
+    python3 GenTraffic.py -h
+
+
+MIT License
+
+Copyright (c) 2021 B.Hoppe
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import math
+import random
+import socket
+import time
+import argparse                     # handling command line arguments
+from array import array
+
+from SendTraffic import BatchSender
+
+EARTH_R_M = 6371000.0               # mean earth radius in meters
+M_PER_NM = 1852.0
+M_PER_FT = 0.3048
+
+# Some plausible static data to pick from
+_TYPES = ['A320', 'A20N', 'A321', 'A319', 'B738', 'B38M', 'B77W', 'B789', 'A359', 'E190', 'CRJ9', 'DH8D', 'AT76', 'C172', 'PC12']
+_AIRPORTS = ['FRA', 'MUC', 'LHR', 'CDG', 'AMS', 'JFK', 'LAX', 'ORD', 'ATL', 'DXB', 'SIN', 'HND', 'SYD', 'GRU', 'YYZ']
+_AIRLINES = ['DLH', 'BAW', 'AFR', 'KLM', 'UAL', 'DAL', 'AAL', 'UAE', 'SIA', 'QFA', 'EZY', 'RYR']
+
+""" === Fleet of synthetic aircraft ===
+    Each aircraft flies back and forth on a great-circle route between two
+    random points within 'radius' of the centre. All per-aircraft values are
+    kept in compact arrays (angles in radians), positions are computed
+    batch-wise for just the aircraft due for sending.
+"""
+class Fleet:
+    def __init__(self, num: int, lat: float, lon: float, radius_m: float, seed: int):
+        rnd = random.Random(seed)
+        self.num = num
+        self.lat1 = array('d')                      # route start
+        self.lon1 = array('d')
+        self.crs = array('d')                       # initial course at route start
+        self.len = array('d')                       # route length (angular distance)
+        self.spd = array('d')                       # speed (angular distance per second)
+        self.phase = array('d')                     # random start offset on route (angular distance)
+        self.alt = array('d')                       # altitude in feet
+        self.static = []                            # call, type, reg, from, to
+        for i in range(num):
+            lat1, lon1 = self.randomPoint(rnd, lat, lon, radius_m)
+            lat2, lon2 = self.randomPoint(rnd, lat, lon, radius_m)
+            d = self.angDist(lat1, lon1, lat2, lon2)
+            acType = rnd.choice(_TYPES)
+            light = acType in ('C172', 'PC12')
+            spd_kn = rnd.uniform(90, 180) if light else rnd.uniform(250, 480)
+            self.lat1.append(lat1)
+            self.lon1.append(lon1)
+            self.crs.append(self.course(lat1, lon1, lat2, lon2))
+            self.len.append(max(d, 1e-6))
+            self.spd.append(spd_kn * M_PER_NM / 3600.0 / EARTH_R_M)
+            self.phase.append(rnd.uniform(0, 2*d))
+            self.alt.append(round(rnd.uniform(2000, 12000) if light else rnd.uniform(8000, 41000), -2))
+            self.static.append('{}{},{},{}{:05X},{},{}'.format(
+                rnd.choice(_AIRLINES), 100 + i % 9900, acType, 'N' if i % 2 else 'D-', i,
+                rnd.choice(_AIRPORTS), rnd.choice(_AIRPORTS)))
+
+    # Random point within radius around centre, returned in radians
+    @staticmethod
+    def randomPoint(rnd, lat: float, lon: float, radius_m: float):
+        d = radius_m * math.sqrt(rnd.random()) / EARTH_R_M
+        return Fleet.destination(math.radians(lat), math.radians(lon), rnd.uniform(0, 2*math.pi), d)
+
+    # Point reached from (lat, lon) on initial course crs after angular distance d
+    @staticmethod
+    def destination(lat: float, lon: float, crs: float, d: float):
+        lat2 = math.asin(math.sin(lat)*math.cos(d) + math.cos(lat)*math.sin(d)*math.cos(crs))
+        lon2 = lon + math.atan2(math.sin(crs)*math.sin(d)*math.cos(lat),
+                                math.cos(d) - math.sin(lat)*math.sin(lat2))
+        return lat2, lon2
+
+    # Angular distance between two points (haversine)
+    @staticmethod
+    def angDist(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+        a = math.sin((lat2-lat1)/2)**2 + math.cos(lat1)*math.cos(lat2)*math.sin((lon2-lon1)/2)**2
+        return 2 * math.asin(min(1.0, math.sqrt(a)))
+
+    # Initial course from point 1 to point 2
+    @staticmethod
+    def course(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+        return math.atan2(math.sin(lon2-lon1)*math.cos(lat2),
+                          math.cos(lat1)*math.sin(lat2) - math.sin(lat1)*math.cos(lat2)*math.cos(lon2-lon1))
+
+    """ === Compute AITFC datagrams for aircraft [first, first+n) at time t === """
+    def datagrams(self, first: int, n: int, t: float, ts: float, hexBase: int) -> list:
+        sin, cos, asin, atan2, degrees = math.sin, math.cos, math.asin, math.atan2, math.degrees
+        lat1s, lon1s, crss, lens, spds, phases, alts, statics = \
+            self.lat1, self.lon1, self.crs, self.len, self.spd, self.phase, self.alt, self.static
+        ts_s = str(int(ts))
+        out = []
+        for i in range(first, first+n):
+            i %= self.num
+            lat1 = lat1s[i]
+            crs = crss[i]
+            # distance along the route, flying back and forth
+            length = lens[i]
+            d = (phases[i] + spds[i]*t) % (2*length)
+            outbound = d <= length
+            if not outbound:
+                d = 2*length - d
+            # great-circle position
+            sinLat1, cosLat1, sinD, cosD = sin(lat1), cos(lat1), sin(d), cos(d)
+            sinLat = sinLat1*cosD + cosLat1*sinD*cos(crs)
+            lat = asin(sinLat)
+            dLon = atan2(sin(crs)*sinD*cosLat1, cosD - sinLat1*sinLat)
+            # track: bearing back to route start, reversed if flying outbound
+            cosLat = cos(lat)
+            back = atan2(sin(-dLon)*cosLat1, cosLat*sinLat1 - sinLat*cosLat1*cos(-dLon))
+            hdg = (degrees(back) + (180.0 if outbound else 0.0)) % 360.0
+            out.append('AITFC,{},{:.6f},{:.6f},{:.0f},0,1,{:.0f},{:.0f},{},{}'.format(
+                hexBase + i, degrees(lat), (degrees(lon1s[i] + dLon) + 540.0) % 360.0 - 180.0,
+                alts[i], hdg, spds[i] * EARTH_R_M * 3600.0 / M_PER_NM, statics[i], ts_s).encode('ascii'))
+        return out
+
+""" === MAIN === """
+def main():
+    # --- Handling command line argumens ---
+    parser = argparse.ArgumentParser(description='GenTraffic 1.0.0: Generates a synthetic fleet of aircraft on great-circle routes around a centre point '
+        'and sends their positions in AITFC format via UDP for LiveTraffic to receive them on the RealTraffic channel. '
+        'Meant for load-testing: position computation is batched so that the generator is not the limiting factor.',fromfile_prefix_chars='@')
+    parser.add_argument('lat', help='Latitude of the centre point', type=float)
+    parser.add_argument('lon', help='Longitude of the centre point', type=float)
+    parser.add_argument('-n', '--numAc', metavar='NUM', help='Number of aircraft to generate, defaults to 10000', type=int, default=10000)
+    parser.add_argument('-r', '--radius', metavar='NM', help='Radius around centre point in nautical miles, defaults to 50', type=float, default=50.0)
+    parser.add_argument('--rate', metavar='NUM', help='Aggregate rate of datagrams per second, defaults to one position per aircraft every 10 seconds', type=float)
+    parser.add_argument('--tick', metavar='SEC', help='Interval in which a batch of datagrams is computed and sent, defaults to 0.05', type=float, default=0.05)
+    parser.add_argument('--duration', metavar='SEC', help='Stop after this many seconds, runs endlessly by default', type=float, default=0)
+    parser.add_argument('--hexBase', metavar='HEX', help='First transponder hex id to use, defaults to 100000', default='100000')
+    parser.add_argument('--seed', metavar='NUM', help='Random seed, so that the same fleet can be generated again', type=int, default=0)
+    parser.add_argument('--historic', metavar='NUM', help='Send historic data, ie. reduce included timestamp by this many seconds', type=int, default=0)
+    parser.add_argument('--host', metavar='NAME_OR_IP', help='UDP target host or ip to send the data to, defaults to \'localhost\'', default='localhost')
+    parser.add_argument('--port', metavar='NUM', help='UDP port to send traffic data to, defaults to 49003', type=int, default=49003)
+    parser.add_argument('--noBatch', help='Send each datagram with an individual system call instead of batching with sendmmsg (Linux only)', action='store_true')
+    parser.add_argument('-v', '--verbose', help='Verbose output: Informs about achieved rates every 10 seconds', action='store_true')
+
+    args = parser.parse_args()
+    rate = args.rate if args.rate else args.numAc / 10.0
+    hexBase = int(args.hexBase, 16)
+    # a batch must not contain the same aircraft twice with the same timestamp
+    if rate * args.tick > args.numAc:
+        parser.error('--rate {:.0f} sends more than --numAc {} datagrams per --tick of {}s, use a shorter --tick'.format(
+            rate, args.numAc, args.tick))
+
+    # --- create the fleet ---
+    t0 = time.monotonic()
+    fleet = Fleet(args.numAc, args.lat, args.lon, args.radius * M_PER_NM, args.seed)
+    if args.verbose:
+        print ("Generated {} aircraft in {:.1f}s, sending {:.0f} datagrams/s".format(args.numAc, time.monotonic()-t0, rate))
+
+    # --- open the UDP socket ---
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender = BatchSender(sock, args.host, args.port, not args.noBatch)
+
+    # --- send loop: every tick send the aircraft which are due, round-robin ---
+    start = time.monotonic()
+    due = start
+    nextAc = 0
+    owed = 0.0                          # fractional number of datagrams carried over to next tick
+    lastReport = start
+    lastReportNum = 0
+    try:
+        while not args.duration or due - start < args.duration:
+            owed += rate * args.tick
+            n = int(owed)
+            owed -= n
+            if n:
+                t = due - start
+                sender.send(fleet.datagrams(nextAc, n, t, time.time() - args.historic, hexBase))
+                nextAc = (nextAc + n) % fleet.num
+
+            # report achieved rate
+            now = time.monotonic()
+            if args.verbose and now - lastReport >= 10.0:
+                print ("{:.0f} datagrams/s, {} sent in total".format(
+                    (sender.numDatagrams - lastReportNum) / (now - lastReport), sender.numDatagrams))
+                lastReport = now
+                lastReportNum = sender.numDatagrams
+
+            # wait for next tick (absolute deadline, so no drift)
+            due += args.tick
+            if due > now:
+                time.sleep(due - now)
+    except KeyboardInterrupt:
+        pass
+
+    # --- Cleanup ---
+    sock.close()
+    elapsed = time.monotonic() - start
+    print ("Sent {} datagrams in {:.1f}s ({:.0f}/s) with {} system calls".format(
+        sender.numDatagrams, elapsed, sender.numDatagrams / elapsed if elapsed else 0, sender.numSyscalls))
+
+if __name__ == '__main__':
+    main()
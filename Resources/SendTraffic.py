@@ -34,131 +34,913 @@ SOFTWARE.
 import os
 import sys
 import socket
+import struct
+import mmap
 import time
+import math
+import heapq
+import io
+import zlib
+import lzma
+import bz2
+import queue
+import threading
+import tempfile
+import bisect
+import json
+import ctypes
+import ctypes.util
+from array import array
 import argparse                     # handling command line arguments
+try:
+    import zstandard                # optional, only needed for zstd-compressed input
+except ImportError:
+    zstandard = None
+
+_tsDiff = None                      # offset from record timestamp to current wall clock time
+_monoDiff = 0.0                     # offset from record timestamp to monotonic deadline
+_monoStart = 0.0                    # monotonic time the replay started
+_ts0 = 0.0                          # timestamp of first record, reference for --speed
+_stats = None                       # Telemetry of the replay
+
+""" === Compiled binary replay format ===
+    A tracking data file can be compiled once (option --compile) into a binary file,
+    which is replayed directly from a memory map without any text parsing:
+      header:   magic, number of records, offset of string table, number of strings
+      records:  fixed-size records with typed columns, see _BIN_REC
+      strings:  offset table (uint32, one more than strings) followed by the utf-8 heap
+    Call sign, type, registration, origin, and destination are interned in the string table.
+    Weather lines are kept as records of kind _KIND_WEATHER with the full line as 'call'.
+"""
+_BIN_MAGIC = b'LTRPLY\x00\x01'
+_BIN_HDR = struct.Struct('<8sQQI4x')            # magic, num records, string table offset, num strings
+_BIN_REC = struct.Struct('<dQddffff5IBB2x')     # ts, hexId, lat, lon, alt, vsi, hdg, spd, call, type, reg, from, to, kind, airborne
+_BIN_OFFS = struct.Struct('<I')
+_KIND_TRAFFIC = 0
+_KIND_WEATHER = 1
+
+# Output format of an AITFC record, without the trailing timestamp, matching LTFlightData::ExportFD
+_AITFC_HEAD = 'AITFC,{},{:.6f},{:.6f},{:.0f},{:.0f},{},{:.0f},{:.0f},{},{},{},{},{}'
+
+""" === Read records from a CSV file ===
+    Yields tuples (timestamp, hexId, head):
+    - for traffic data, head is the datagram without the trailing timestamp field
+    - for weather data, hexId is None and head is the complete line
+    Only records with start <= timestamp <= end are returned.
+"""
+def readCsv(f, start: float = None, end: float = None):
+    ts = 0.0
+    inWindow = start is None
+    for ln in f:
+        # remove any whitespace at both ends
+        ln = ln.strip().decode('ascii', errors='replace')
+        if not ln:
+            continue
 
-_tsDiff = 0
-
-""" === Compute and wait for timestamp """
-def compWaitTS(ts_s: str) -> str:
-    global _tsDiff
-
-    # current time and convert timestamp
-    now = int(time.time())
-    ts = int(ts_s)
-
-    # First time called? -> compute initial timestamp difference
-    if not _tsDiff:
-        _tsDiff = now - ts - args.bufPeriod
-        if args.verbose:
-            print ("Timestamp difference: {}".format(_tsDiff))
-
-    # What's the required timestamp to wait for and then return?
-    ts += _tsDiff
-
-    # if that's in the future then wait
-    if (ts > now):
-        if args.verbose:
-            print ("Waiting for {} seconds...".format(ts-now), end='\r')
-        time.sleep (ts-now)
+        # Can be traffic or weather data
+        if ln.startswith('AITFC'):
+            # should have found 15 fields!
+            numFields = ln.count(',') + 1
+            if numFields != 15:
+                print ("Found {} fields, expected 15, in line {}".format(numFields, ln))
+                continue
+            head, _, ts_s = ln.rpartition(',')
+            try:
+                ts = float(ts_s)
+                # within the requested time window?
+                if end is not None and ts > end:
+                    break
+                inWindow = start is None or ts >= start
+                if inWindow:
+                    yield (ts, int(ln.split(',', 2)[1]), head)
+            except ValueError:
+                print ("Invalid id or timestamp in line {}".format(ln))
+        elif inWindow:
+            yield (ts, None, ln)
+
+""" === Read records from a compiled binary file ==="""
+def readCompiled(f, start: float = None, end: float = None):
+    if f.seekable():
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield from readCompiledBuf(mm, start, end)
+    else:
+        # pipes and compressed streams can't be mapped, so read into memory
+        yield from readCompiledBuf(f.read(), start, end)
+
+def readCompiledBuf(buf, start: float = None, end: float = None):
+    _, numRec, strOffs, numStr = _BIN_HDR.unpack_from(buf, 0)
+    # decode the string table once
+    offs = [o for (o,) in _BIN_OFFS.iter_unpack(buf[strOffs:strOffs + (numStr+1)*_BIN_OFFS.size])]
+    heapStart = strOffs + (numStr+1)*_BIN_OFFS.size
+    heap = buf[heapStart:heapStart + offs[-1]].decode('utf-8')
+    strs = [heap[offs[i]:offs[i+1]] for i in range(numStr)] if heap.isascii() else \
+           [buf[heapStart+offs[i]:heapStart+offs[i+1]].decode('utf-8') for i in range(numStr)]
+    del heap
+
+    # binary search for the first record of the requested time window
+    recStart = _BIN_HDR.size
+    if start is not None:
+        lo, hi = 0, numRec
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _BIN_REC.unpack_from(buf, recStart + mid*_BIN_REC.size)[0] < start:
+                lo = mid + 1
+            else:
+                hi = mid
+        recStart += lo * _BIN_REC.size
+        numRec -= lo
+
+    # stream the records straight from the memory map
+    recView = memoryview(buf)[recStart:recStart + numRec*_BIN_REC.size]
+    try:
+        for (ts, hexId, lat, lon, alt, vsi, hdg, spd,
+             call, typ, reg, frm, to, kind, airborne) in _BIN_REC.iter_unpack(recView):
+            if end is not None and ts > end:
+                break
+            if kind == _KIND_TRAFFIC:
+                yield (ts, hexId, _AITFC_HEAD.format(hexId, lat, lon, alt, vsi, airborne, hdg, spd,
+                                                      strs[call], strs[typ], strs[reg], strs[frm], strs[to]))
+            else:
+                yield (ts, None, strs[call])
+    finally:
+        recView.release()
+
+""" === Timestamp seek index for CSV files ===
+    A sidecar file '<inFile>.idx' stores per minute of timestamps the byte offset
+    from which on all records of that minute and later follow,
+    so that a replay can seek straight to a requested start time.
+    The index is built on first use and rebuilt when the CSV file changes.
+      header:   magic, CSV file size, CSV modification time (ns), first timestamp, first minute, number of minutes
+      offsets:  uint64 byte offset per minute
+"""
+_IDX_MAGIC = b'LTIDX\x00\x00\x01'
+_IDX_HDR = struct.Struct('<8sQqdqQ')
+
+def buildIndex(f) -> tuple:
+    firstOff = {}                               # minute -> offset of its first record
+    firstTs = None
+    off = 0
+    for ln in f:
+        if ln.startswith(b'AITFC'):
+            try:
+                ts = float(ln.rpartition(b',')[2])
+                m = int(ts // 60)
+                if m not in firstOff:
+                    firstOff[m] = off
+                if firstTs is None or ts < firstTs:
+                    firstTs = ts
+            except ValueError:
+                pass
+        off += len(ln)
+    if not firstOff:
+        return (0.0, 0, array('Q'))
+
+    # offset per minute is the minimum offset of this and all later minutes
+    firstMin = min(firstOff)
+    offsets = array('Q', [off]) * (max(firstOff) - firstMin + 1)
+    minOff = off
+    for i in range(len(offsets)-1, -1, -1):
+        minOff = min(minOff, firstOff.get(firstMin + i, minOff))
+        offsets[i] = minOff
+    return (firstTs, firstMin, offsets)
+
+def loadIndex(path: str, f) -> tuple:
+    st = os.fstat(f.fileno())
+    idxPath = path + '.idx'
+    # try reading an existing, up-to-date index
+    try:
+        with open(idxPath, 'rb') as fIdx:
+            magic, size, mtime, firstTs, firstMin, numMin = _IDX_HDR.unpack(fIdx.read(_IDX_HDR.size))
+            if magic == _IDX_MAGIC and size == st.st_size and mtime == st.st_mtime_ns:
+                offsets = array('Q')
+                offsets.fromfile(fIdx, numMin)
+                return (firstTs, firstMin, offsets)
+    except (OSError, struct.error, EOFError):
+        pass
+
+    # build a new index and try to save it
+    if args.verbose:
+        print ("Building timestamp index for {}...".format(path))
+    pos = f.tell()
+    f.seek(0, os.SEEK_SET)
+    idx = buildIndex(f)
+    f.seek(pos, os.SEEK_SET)
+    try:
+        with open(idxPath, 'wb') as fIdx:
+            fIdx.write(_IDX_HDR.pack(_IDX_MAGIC, st.st_size, st.st_mtime_ns, idx[0], idx[1], len(idx[2])))
+            idx[2].tofile(fIdx)
+    except OSError as e:
+        print ("Could not save index {}: {}".format(idxPath, e.strerror))
+    return idx
+
+def seekIndex(f, idx: tuple, start: float):
+    firstTs, firstMin, offsets = idx
+    m = int(start // 60) - firstMin
+    if m > 0 and offsets:
+        f.seek(offsets[min(m, len(offsets)-1)], os.SEEK_SET)
+
+""" === Transparent decompression of compressed input ===
+    gzip, xz, bzip2, and zstd (if module 'zstandard' is installed) input is detected by its magic bytes.
+    A background thread reads and decompresses the file into a bounded queue of chunks,
+    so that parsing doesn't wait for decompression. Nothing is written to disk:
+    looping just decompresses the file again. Such a stream is not seekable,
+    so --start skips records instead of using the index.
+"""
+_COMPRESSION = [
+    (b'\x1f\x8b',                  'gzip',  lambda: zlib.decompressobj(zlib.MAX_WBITS | 16)),
+    (b'\xfd7zXZ\x00',              'xz',    lzma.LZMADecompressor),
+    (b'BZh',                        'bzip2', bz2.BZ2Decompressor),
+    (b'\x28\xb5\x2f\xfd',          'zstd',  zstandard and (lambda: zstandard.ZstdDecompressor().decompressobj())),
+]
+_MAX_MAGIC = max(len(m) for m, _, _ in _COMPRESSION)
+
+class DecompressStream(io.RawIOBase):
+    CHUNK = 1 << 20                         # size of compressed chunks read from file
+    QUEUE_LEN = 16                          # max number of decompressed chunks waiting for the parser
+
+    def __init__(self, f, newDecompressor, closeFile: bool):
+        self._f = f
+        self._closeFile = closeFile
+        self._newDecompressor = newDecompressor
+        self._q = queue.Queue(self.QUEUE_LEN)
+        self._stop = threading.Event()
+        self._buf = memoryview(b'')
+        self._eof = False
+        self._thread = threading.Thread(target=self._decompress, daemon=True)
+        self._thread.start()
+
+    # queue a chunk, giving up if the stream got closed
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    # thread main function: read, decompress, queue
+    def _decompress(self):
+        try:
+            d = self._newDecompressor()
+            while not self._stop.is_set():
+                data = self._f.read(self.CHUNK)
+                if not data:
+                    break
+                while data:
+                    out = d.decompress(data)
+                    if out and not self._put(out):
+                        return
+                    data = b''
+                    # end of a compressed stream: there could be another one concatenated (like in multi-member gzip)
+                    if getattr(d, 'eof', False):
+                        data = d.unused_data
+                        d = self._newDecompressor()
+            self._put(b'')                  # signals end of data
+        except Exception as e:
+            self._put(e)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if not self._buf:
+            if self._eof:
+                return 0
+            item = self._q.get()
+            if isinstance(item, Exception):
+                raise item
+            if not item:
+                self._eof = True
+                return 0
+            self._buf = memoryview(item)
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            if self._closeFile:
+                self._f.close()
+        super().close()
+
+""" === Open a tracking data file and read its records, CSV or compiled ===
+    For CSV files, a time window is found with the help of the sidecar index,
+    for compiled files by binary search. <stdin> is just read up to the window.
+"""
+def openInput(path: str):
+    f = sys.stdin.buffer if path == '-' else open(path, 'rb')
+    # compressed? Then decompress in a background thread
+    magic = f.peek(_MAX_MAGIC)[:_MAX_MAGIC]
+    for m, name, newDecompressor in _COMPRESSION:
+        if magic.startswith(m):
+            if newDecompressor is None:
+                f.close()
+                raise OSError("{} is {}-compressed, but Python module 'zstandard' is not installed".format(path, name))
+            return io.BufferedReader(DecompressStream(f, newDecompressor, f is not sys.stdin.buffer), DecompressStream.CHUNK)
+    return f
+
+def isCompiled(f) -> bool:
+    return f.peek(len(_BIN_MAGIC))[:len(_BIN_MAGIC)] == _BIN_MAGIC
+
+def readRecords(path: str, start: float = None, end: float = None):
+    f = openInput(path)
+    try:
+        if isCompiled(f):
+            yield from readCompiled(f, start, end)
+        else:
+            # redirected stdin may be seekable, but there's no path for its index
+            if start is not None and path != '-' and f.seekable():
+                seekIndex(f, loadIndex(path, f), start)
+            yield from readCsv(f, start, end)
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+
+""" === Timestamp of the first record in a file ==="""
+def firstTimestamp(path: str) -> float:
+    with openInput(path) as f:
+        if isCompiled(f):
+            numRec = _BIN_HDR.unpack(f.read(_BIN_HDR.size))[1]
+            # weather records before the first traffic record carry no timestamp
+            for _ in range(numRec):
+                rec = _BIN_REC.unpack(f.read(_BIN_REC.size))
+                if rec[13] == _KIND_TRAFFIC:
+                    return rec[0]
+            return 0.0
+        if path != '-' and f.seekable():
+            return loadIndex(path, f)[0]
+        # compressed input can't be indexed, so read up to the first traffic record
+        return next((ts for ts, hexId, _ in readCsv(f) if hexId is not None), 0.0)
+
+""" === Read and merge records from several tracking data files ===
+    Each file needs to be ordered by timestamp already (as LiveTraffic's exports are).
+    The files are merged in a streaming way, so memory depends on the number of files only.
+    Each file's timestamps can be shifted by an individual offset.
+"""
+def readShifted(path: str, offset: float, start: float, end: float):
+    for ts, hexId, head in readRecords(path,
+                                       None if start is None else start - offset,
+                                       None if end is None else end - offset):
+        yield (ts + offset, hexId, head)
+
+def mergeRecords(paths: list, offsets: list, start: float = None, end: float = None):
+    # a single file without offset needs no merging
+    if len(paths) == 1 and not offsets:
+        return readRecords(paths[0], start, end)
+    offsets = offsets + [0.0] * (len(paths) - len(offsets))
+    return heapq.merge(*[readShifted(p, o, start, end) for p, o in zip(paths, offsets)],
+                       key=lambda rec: rec[0])
+
+""" === Convert a --start/--end value into a timestamp ===
+    Either an absolute timestamp, or relative to the first record if prefixed with '+',
+    given in seconds or as H:MM[:SS]
+"""
+def parseTime(val: str, firstTs) -> float:
+    if not val.startswith('+'):
+        return float(val)
+    secs = 0.0
+    parts = val[1:].split(':')
+    for p in parts:
+        secs = secs * 60 + float(p)
+    if len(parts) == 2:                 # H:MM
+        secs *= 60
+    return firstTs() + secs
+
+""" === Cache of records for looping ===
+    Caches the records of the first pass compactly: timestamps and ids in arrays,
+    the datagram texts concatenated in one buffer. If the buffer exceeds the memory limit,
+    it moves into a temporary file, which is memory-mapped for the following passes.
+    This way, looping works with any input (including <stdin>), and later passes don't read or parse any input.
+"""
+class ReplayCache:
+    def __init__(self, memLimit: int):
+        self.memLimit = memLimit                    # 0 means unlimited
+        self.complete = False
+        self.ts = array('d')
+        self.hexId = array('q')                     # -1 for weather data
+        self.ends = array('Q')                      # end offset of each text in the buffer
+        self.heads = bytearray()
+        self.size = 0
+        self.file = None
+        self.map = None
+
+    def _append(self, b: bytes):
+        # exceeding the memory limit? Move to a temporary file
+        if not self.file and self.memLimit and self.size + len(b) > self.memLimit:
+            self.file = tempfile.TemporaryFile()
+            self.file.write(self.heads)
+            self.heads = bytearray()
+        if self.file:
+            self.file.write(b)
+        else:
+            self.heads += b
+        self.size += len(b)
+        self.ends.append(self.size)
+
+    # pass records through, caching them
+    def record(self, records):
+        for rec in records:
+            self.ts.append(rec[0])
+            self.hexId.append(-1 if rec[1] is None else rec[1])
+            self._append(rec[2].encode('utf-8'))
+            yield rec
+        self.complete = True
+        if self.file and self.size:
+            self.file.flush()
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # replay the cached records
+    def replay(self):
+        buf = self.map if self.file else self.heads
+        start = 0
+        for ts, hexId, end in zip(self.ts, self.hexId, self.ends):
+            yield (ts, None if hexId < 0 else hexId, str(buf[start:end], 'utf-8'))
+            start = end
+
+    def info(self) -> str:
+        return "Cached {} records, {:.1f} MB {}".format(
+            len(self.ts), self.size / (1024*1024), "in temporary file" if self.file else "in memory")
+
+""" === Compile a CSV tracking data file into the binary replay format ==="""
+def compileFile(inPath: str, outPath: str) -> int:
+    strIdx = {}                                 # interned strings: string -> index
+    def intern(s: str) -> int:
+        i = strIdx.get(s)
+        if i is None:
+            i = strIdx[s] = len(strIdx)
+        return i
+
+    numRec = 0
+    with open(outPath, 'wb') as out:
+        out.write(bytes(_BIN_HDR.size))         # placeholder, header is written last
+        for ts, hexId, head in readRecords(inPath):
+            if hexId is None:
+                rec = _BIN_REC.pack(ts, 0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,
+                                    intern(head), 0, 0, 0, 0, _KIND_WEATHER, 0)
+            else:
+                try:
+                    fields = head.split(',')
+                    rec = _BIN_REC.pack(ts, hexId, float(fields[2]), float(fields[3]),
+                                        float(fields[4] or 0), float(fields[5] or 0),
+                                        float(fields[7] or 0), float(fields[8] or 0),
+                                        intern(fields[9]), intern(fields[10]), intern(fields[11]),
+                                        intern(fields[12]), intern(fields[13]),
+                                        _KIND_TRAFFIC, int(fields[6] or 1))
+                except ValueError:
+                    print ("Invalid number in line {}".format(head))
+                    continue
+            out.write(rec)
+            numRec += 1
+
+        # string table: offsets, then the heap
+        strOffs = out.tell()
+        heap = [s.encode('utf-8') for s in strIdx]
+        o = 0
+        for s in heap:
+            out.write(_BIN_OFFS.pack(o))
+            o += len(s)
+        out.write(_BIN_OFFS.pack(o))
+        out.write(b''.join(heap))
+
+        # finally the header
+        out.seek(0, os.SEEK_SET)
+        out.write(_BIN_HDR.pack(_BIN_MAGIC, numRec, strOffs, len(heap)))
 
-    # Adjust returned timestamp value for historic timestamp
-    ts -= args.historic
+    if args.verbose:
+        print ("Compiled {} records with {} distinct strings into {}".format(numRec, len(heap), outPath))
+    return numRec
 
-    return str(ts)
+""" === Replay time base ===
+    Record timestamps are mapped to absolute deadlines on the monotonic clock,
+    so that waiting never accumulates drift over long replays.
+    The time base is defined by the first record: it becomes due 'bufPeriod' seconds in the past.
+"""
+def initTimeBase(ts: float):
+    global _tsDiff, _monoDiff, _monoStart, _ts0
+
+    # wall clock offset (full seconds, so that integer timestamps stay integer)
+    wallNow = time.time()
+    monoNow = time.monotonic()
+    _tsDiff = math.floor(wallNow - ts - args.bufPeriod)
+    # same offset, but on the monotonic clock
+    _monoDiff = monoNow - wallNow + _tsDiff
+    _monoStart = monoNow
+    _ts0 = ts
+    if args.verbose:
+        print ("Timestamp difference: {}".format(_tsDiff))
+
+""" === Compute timestamp to send for a record's timestamp ==="""
+def compTS(ts: float) -> str:
+    # Adjust returned timestamp value for time base and historic timestamp
+    ts += _tsDiff - args.historic
+    return str(int(ts)) if ts.is_integer() else '{:.3f}'.format(ts)
+
+""" === Scale a record's timestamp for time-compressed replay ===
+    Gaps between records shrink by the --speed factor, so that emitted timestamps
+    still match the wall clock. Speed 0 means 'as fast as possible': the record is
+    due now, its timestamp is the time passed since replay start, but at least its
+    recorded time with gaps shrunk by SPEED0_FACTOR. So an aircraft's consecutive
+    positions keep advancing timestamps even if sent microseconds apart.
+"""
+SPEED0_FACTOR = 100.0
+
+def scaleTS(ts: float) -> float:
+    if args.speed > 0:
+        return _ts0 + (ts - _ts0) / args.speed
+    return _ts0 + max(time.monotonic() - _monoStart, (ts - _ts0) / SPEED0_FACTOR)
+
+""" === Wait until the given monotonic deadline ==="""
+def waitUntil(due: float):
+    while 1:
+        delay = due - time.monotonic()
+        if delay <= 0:
+            return
+        if args.verbose and delay > 1.0:
+            print ("Waiting for {:.1f} seconds...".format(delay), end='\r')
+        time.sleep(delay)
+
+""" === Schedule records ===
+    Groups records whose deadlines fall into the same tick into one batch,
+    waits for the batch's deadline and then yields (deadline, batch).
+    Timestamps of the yielded records are scaled already if replaying with --speed.
+    Weather records carry no timestamp of their own (only the one of the traffic
+    record before, or 0.0 at the start of a file), so they have no deadline:
+    they join the current batch, or the next one if there is none yet.
+"""
+def scheduleRecords(records):
+    batch = []
+    batchDue = 0.0
+    weather = []
+    for rec in records:
+        if rec[1] is None:
+            (batch if batch else weather).append(rec)
+            continue
+        # First traffic record defines the time base
+        if _tsDiff is None:
+            initTimeBase(rec[0])
+        if args.speed != 1.0:
+            rec = (scaleTS(rec[0]),) + rec[1:]
+
+        due = rec[0] + _monoDiff if args.speed > 0 else time.monotonic()
+        # records, which are overdue already, join the current batch, too, up to the maximum batch size
+        if batch and (len(batch) >= BatchSender.MAX_BATCH or
+                      (due > batchDue + args.tick and due > time.monotonic())):
+            waitUntil(batchDue)
+            yield batchDue, batch
+            batch = []
+        if not batch:
+            batchDue = due
+            batch, weather = weather, []
+        batch.append(rec)
+
+    # last batch
+    if batch:
+        waitUntil(batchDue)
+        yield batchDue, batch
+    elif weather:
+        yield time.monotonic(), weather
+
+""" === Send lateness of a record ==="""
+def compLateness(ts: float, sentAt: float) -> float:
+    # records intentionally due before replay start (buffering period) only count from the start
+    return sentAt - max(ts + _monoDiff, _monoStart)
+
+""" === Replay telemetry ===
+    Cheap counters updated per record and per sent batch:
+    records, datagrams, bytes, records per aircraft, and a histogram
+    of the lateness of sending a record compared to its schedule.
+    Reported periodically as one line (--stats) and as JSON at exit (--statsFile).
+"""
+class Telemetry:
+    LATE_BOUNDS = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0]     # upper bucket bounds in seconds
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.numRecords = 0
+        self.numWeather = 0
+        self.numDatagrams = 0
+        self.numBytes = 0
+        self.perAc = {}                             # hexId -> number of records
+        self.lateHist = [0] * (len(self.LATE_BOUNDS) + 1)
+        self.lateSum = 0.0
+        self.lateMax = 0.0
+        # values at last periodic report
+        self.lastTime = self.start
+        self.lastCounts = (0, 0, 0)
+        self.intervalAc = set()
+
+    def record(self, hexId: int, late: float):
+        self.numRecords += 1
+        self.perAc[hexId] = self.perAc.get(hexId, 0) + 1
+        self.intervalAc.add(hexId)
+        self.lateHist[bisect.bisect_left(self.LATE_BOUNDS, late)] += 1
+        self.lateSum += late
+        if late > self.lateMax:
+            self.lateMax = late
+
+    def sent(self, datagrams: list):
+        self.numDatagrams += len(datagrams)
+        self.numBytes += sum(map(len, datagrams))
+
+    # lateness below which the given fraction of records were sent (upper bucket bound)
+    def latePercentile(self, fraction: float) -> float:
+        limit = fraction * self.numRecords
+        n = 0
+        for bound, cnt in zip(self.LATE_BOUNDS + [math.inf], self.lateHist):
+            n += cnt
+            if n >= limit:
+                return bound if bound < math.inf else self.lateMax
+        return 0.0
+
+    # one line of rates since the last report
+    def report(self) -> str:
+        now = time.monotonic()
+        dt = (now - self.lastTime) or 1e-9
+        counts = (self.numRecords, self.numDatagrams, self.numBytes)
+        rec, dg, by = [(c - l) / dt for c, l in zip(counts, self.lastCounts)]
+        numAc = len(self.intervalAc)
+        ln = ("{:.0f}s: {:.0f} records/s, {:.0f} datagrams/s, {:.1f} kB/s, {} aircraft at {:.2f} records/s each, "
+              "lateness p50 <{:.3f}s, p99 <{:.3f}s, max {:.3f}s").format(
+              now - self.start, rec, dg, by / 1024, numAc, rec / numAc if numAc else 0.0,
+              self.latePercentile(0.5), self.latePercentile(0.99), self.lateMax)
+        self.lastTime = now
+        self.lastCounts = counts
+        self.intervalAc = set()
+        return ln
+
+    def summary(self) -> dict:
+        elapsed = (time.monotonic() - self.start) or 1e-9
+        return {
+            'elapsed_s': elapsed,
+            'records': self.numRecords,
+            'weatherRecords': self.numWeather,
+            'datagrams': self.numDatagrams,
+            'bytes': self.numBytes,
+            'records_per_s': self.numRecords / elapsed,
+            'datagrams_per_s': self.numDatagrams / elapsed,
+            'bytes_per_s': self.numBytes / elapsed,
+            'lateness': {
+                'avg_s': self.lateSum / self.numRecords if self.numRecords else 0.0,
+                'max_s': self.lateMax,
+                'p50_s': self.latePercentile(0.5),
+                'p90_s': self.latePercentile(0.9),
+                'p99_s': self.latePercentile(0.99),
+                'histogram': [{'upTo_s': b, 'records': c}
+                              for b, c in zip(self.LATE_BOUNDS + [None], self.lateHist)],
+            },
+            'aircraft': {
+                str(hexId): {'hex': '{:06X}'.format(hexId), 'records': n, 'records_per_s': n / elapsed}
+                for hexId, n in self.perAc.items()
+            },
+        }
+
+""" === Batched UDP sending ===
+    All traffic datagrams due in the same scheduler tick are sent with a single
+    sendmmsg() system call on Linux. Python's socket.sendmsg() cannot help here
+    as it gathers all buffers into _one_ datagram, so sendmmsg() is called via ctypes.
+    Elsewhere (or with --noBatch) falls back to one sendto() per datagram.
+    The message structs are public, udp_listen.py uses them for recvmmsg().
+"""
+class IOVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+class MsgHdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p), ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.POINTER(IOVec)), ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+class MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', MsgHdr), ('msg_len', ctypes.c_uint)]
+
+class BatchSender:
+    MAX_BATCH = 1024                        # UIO_MAXIOV: max messages per sendmmsg call
+
+    def __init__(self, sock: socket.socket, host: str, port: int, batch: bool):
+        self.sock = sock
+        self.addr = (socket.gethostbyname(host), port)
+        self.numSyscalls = 0
+        self.numDatagrams = 0
+        self._sendmmsg = None
+        if batch and sys.platform.startswith('linux'):
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            self._sendmmsg = getattr(libc, 'sendmmsg', None)
+        if self._sendmmsg:
+            self._sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(MMsgHdr), ctypes.c_uint, ctypes.c_int]
+            self._sendmmsg.restype = ctypes.c_int
+            # target address as struct sockaddr_in, same for all messages
+            self._sockaddr = ctypes.create_string_buffer(
+                struct.pack('=H', socket.AF_INET) + struct.pack('!H', port) +
+                socket.inet_aton(self.addr[0]) + bytes(8), 16)
+            # message headers and i/o vectors are allocated once and reused
+            self._iov = (IOVec * self.MAX_BATCH)()
+            self._msgs = (MMsgHdr * self.MAX_BATCH)()
+            for i in range(self.MAX_BATCH):
+                hdr = self._msgs[i].msg_hdr
+                hdr.msg_name = ctypes.addressof(self._sockaddr)
+                hdr.msg_namelen = 16
+                hdr.msg_iov = ctypes.pointer(self._iov[i])
+                hdr.msg_iovlen = 1
+
+    @property
+    def syscallsSaved(self) -> int:
+        return self.numDatagrams - self.numSyscalls
+
+    def send(self, datagrams: list):
+        self.numDatagrams += len(datagrams)
+        if not self._sendmmsg:
+            for d in datagrams:
+                self.sock.sendto(d, self.addr)
+            self.numSyscalls += len(datagrams)
+            return
+
+        for start in range(0, len(datagrams), self.MAX_BATCH):
+            chunk = datagrams[start:start+self.MAX_BATCH]
+            for i, d in enumerate(chunk):
+                # c_char_p refers to the bytes object's buffer, no copy; 'chunk' keeps it alive
+                self._iov[i].iov_base = ctypes.cast(ctypes.c_char_p(d), ctypes.c_void_p)
+                self._iov[i].iov_len = len(d)
+            sent = 0
+            while sent < len(chunk):
+                n = self._sendmmsg(self.sock.fileno(), ctypes.byref(self._msgs[sent]), len(chunk)-sent, 0)
+                self.numSyscalls += 1
+                if n < 0:
+                    err = ctypes.get_errno()
+                    raise OSError(err, os.strerror(err))
+                sent += n
 
 """ === Handle traffic data ==="""
-def sendTrafficData(ln: str, doSend: int) -> int:
-    # split into its fields
-    fields = ln.split(',')
-
-    # should have found 15 fields!
-    if len(fields) != 15:
-        print ("Found {} fields, expected 15, in line {}".format(len(fields), ln))
-        return 0
-
+def sendTrafficData(ts: float, hexId: int, head: str, doSend: int, sentAt: float, datagrams: list) -> int:
     # Test if a selected aircraft
-    if not _ac or int(fields[1]) in _ac:
-        # Update and wait for timestamp
-        fields[14] = compWaitTS(fields[14])
+    if not _ac or hexId in _ac:
+        late = compLateness(ts, sentAt)
+        _stats.record(hexId, late)
 
-        # Send the data
+        # Queue the data for sending
         if doSend:
-            datagram = ','.join(fields)
-            sock.sendto(datagram.encode('ascii'), (args.host, args.port))
+            datagram = head + ',' + compTS(ts)
+            datagrams.append(datagram.encode('ascii'))
             if args.verbose:
-                print (datagram)
+                print ("{}  (late {:.3f}s)".format(datagram, late))
     return 1
 
 """ === Handle weather data ==="""
 def sendWeatherData(ln: str) -> int:
+    _stats.numWeather += 1
     sock.sendto(ln.encode('ascii'), (args.host, args.weatherPort))
     if args.verbose:
         print (ln)
     return 1
 
 """ === MAIN === """
-
-# --- Handling command line argumens ---
-parser = argparse.ArgumentParser(description='SendTraffic 1.0.1: Sends air traffic tracking data from a file out on a UDP port for LiveTraffic to receive it on the RealTraffic channel. '
-    'In LiveTraffic, activate the "RealTraffic" channel to receive the data and have it displayed as moving planes. '
-    'From LiveTraffic, you can also export tracking data in a matching format using the Debug options "Export Tracking Data" and/or "Export User Aircraft". '
-    'The latter allows you to fly yourself and have your aircraft\'s movements written as tracking data. '
-    'Data is written to \'Output/LTExportFD - <timestamp>.csv\'.',fromfile_prefix_chars='@')
-parser.add_argument('inFile', help='Tracking data file: records in CSV format holding air traffic data in RealTraffic\'s AITraffic format and weather data.\n<stdin> by default', nargs='?', type=argparse.FileType('r'), default=sys.stdin)
-parser.add_argument('-a', '--aircraft', metavar='HEX_LIST', help='List of aircraft to read and send, others skipped. Add one or several transponder hex id codes, separate by comma.')
-parser.add_argument('-d', '--aircraftDecimal', metavar='NUM_LIST', help='Same as -a, but specify decimal values (as used in the CSV file).')
-parser.add_argument('-b', '--bufPeriod', metavar='NUM', help='Buffering period: Number of seconds the first record is pushed into the past so that LiveTraffic\'s buffer fills more quickly. '
-    'Recommended to be slightly less than _half of_ LiveTraffic\'s buffering period. (More than half of buf period triggers historic data processing.)', type=int, default=0)
-parser.add_argument('--historic', metavar='NUM', help='Send historic data, ie. reduce included timestamp by this many seconds', type=int, default=0)
-parser.add_argument('-l', '--loop', help='Endless loop: restart from the beginning when reaching end of file. Will work best if data contains loop with last position(s) being roughly equal to first position(s).', action='store_true')
-parser.add_argument('--host', metavar='NAME_OR_IP', help='UDP target host or ip to send the data to, defaults to \'localhost\'', default='localhost')
-parser.add_argument('--port', metavar='NUM', help='UDP port to send traffic data to, defaults to 49003', type=int, default=49003)
-parser.add_argument('--weatherPort', metavar='NUM', help='UDP port to send weather data to, defaults to 49004', type=int, default=49004)
-parser.add_argument('-v', '--verbose', help='Verbose output: Informs of each sent record', action='store_true')
-
-args = parser.parse_args()
-
-# --- list of selected aircraft ---
-_ac=[]
-
-# convert hex ids to decimal numbers and add them to _ac
-if args.aircraft is not None:
-    _ac += [int(h,16) for h in args.aircraft.split(',')]
-
-# add the decimal-defined a/c, too
-if args.aircraftDecimal is not None:
-    _ac += [int(n,0) for n in args.aircraftDecimal.split(',')]
-
-# print list
-if _ac and args.verbose:
-    print ("Selected aircraft: {}".format(_ac))
-
-# --- open the UDP socket ---
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-
-# Outer loop helps with endless looping
-_sendLn = 1
-while 1:
-    _tsDiff = 0
-    # --- open and loop the input file ---
-    for line in args.inFile:
-        # remove any whitespace at both ends
-        line = line.strip()
-
-        # Can be traffic or weather data
-        if line.startswith('AITFC'):
-            sendTrafficData(line, _sendLn)
-            _sendLn = 1                 # send all following lines
-        else:
-            sendWeatherData(line)
-
-    # Endless loop?
-    if (not args.loop): break           # no, end replay
-    _sendLn = 0                         # don't send first position again
-    args.bufPeriod = 0                  # no buffering as we keep sending continuously
-    args.inFile.seek(0, os.SEEK_SET)    # restart file from beginning
-
-# --- Cleanup ---
-args.inFile.close;
-sock.close;
+def main():
+    global args, _ac, sock, _tsDiff, _stats
+
+    # --- Handling command line argumens ---
+    parser = argparse.ArgumentParser(description='SendTraffic 1.1.0: Sends air traffic tracking data from a file out on a UDP port for LiveTraffic to receive it on the RealTraffic channel. '
+        'In LiveTraffic, activate the "RealTraffic" channel to receive the data and have it displayed as moving planes. '
+        'From LiveTraffic, you can also export tracking data in a matching format using the Debug options "Export Tracking Data" and/or "Export User Aircraft". '
+        'The latter allows you to fly yourself and have your aircraft\'s movements written as tracking data. '
+        'Data is written to \'Output/LTExportFD - <timestamp>.csv\'.',fromfile_prefix_chars='@')
+    parser.add_argument('inFile', help='Tracking data file(s): records in CSV format holding air traffic data in RealTraffic\'s AITraffic format and weather data, '
+        'or a binary file compiled with --compile, each optionally gzip/xz/bzip2/zstd-compressed. Several files are merged by timestamp and replayed on one common time base.\n<stdin> by default', nargs='*', default=['-'])
+    parser.add_argument('--offset', metavar='SEC', help='Time offset added to all timestamps of an input file. Specify once per input file, in the order of the files.', type=float, action='append', default=[])
+    parser.add_argument('-a', '--aircraft', metavar='HEX_LIST', help='List of aircraft to read and send, others skipped. Add one or several transponder hex id codes, separate by comma.')
+    parser.add_argument('-d', '--aircraftDecimal', metavar='NUM_LIST', help='Same as -a, but specify decimal values (as used in the CSV file).')
+    parser.add_argument('-b', '--bufPeriod', metavar='NUM', help='Buffering period: Number of seconds the first record is pushed into the past so that LiveTraffic\'s buffer fills more quickly. '
+        'Recommended to be slightly less than _half of_ LiveTraffic\'s buffering period. (More than half of buf period triggers historic data processing.)', type=int, default=0)
+    parser.add_argument('--historic', metavar='NUM', help='Send historic data, ie. reduce included timestamp by this many seconds', type=int, default=0)
+    parser.add_argument('-l', '--loop', help='Endless loop: restart from the beginning when reaching end of file. Will work best if data contains loop with last position(s) being roughly equal to first position(s).', action='store_true')
+    parser.add_argument('--loopMem', metavar='MB', help='With --loop, records of the first pass are cached for the following passes. '
+        'Beyond this many MB of cached data the cache moves into a temporary file. Unlimited by default', type=float, default=0)
+    parser.add_argument('--host', metavar='NAME_OR_IP', help='UDP target host or ip to send the data to, defaults to \'localhost\'', default='localhost')
+    parser.add_argument('--port', metavar='NUM', help='UDP port to send traffic data to, defaults to 49003', type=int, default=49003)
+    parser.add_argument('--weatherPort', metavar='NUM', help='UDP port to send weather data to, defaults to 49004', type=int, default=49004)
+    parser.add_argument('--start', metavar='TS', help='Start replay at this timestamp: either absolute, or relative to the first record with a \'+\' prefix in seconds or H:MM[:SS], e.g. +3:00. '
+        'CSV files are indexed on first use (sidecar file <inFile>.idx) so that replay starts without reading up to that point.')
+    parser.add_argument('--end', metavar='TS', help='End replay after this timestamp, same format as --start')
+    parser.add_argument('-s', '--speed', metavar='FACTOR', help='Replay speed: time-compressed replay with gaps between records divided by FACTOR, emitted timestamps are adjusted accordingly. '
+        '0 means: as fast as possible, to measure the maximum rate LiveTraffic can ingest; timestamps then follow the wall clock, '
+        'but never fall below the recorded ones with gaps divided by {:.0f}. Defaults to 1 (real time)'.format(SPEED0_FACTOR), type=float, default=1.0)
+    parser.add_argument('--tick', metavar='SEC', help='Scheduler tick: records due within this many seconds are sent together as one batch, defaults to 0.01', type=float, default=0.01)
+    parser.add_argument('--noBatch', help='Send each datagram with an individual system call instead of batching all datagrams due in the same tick with sendmmsg (Linux only)', action='store_true')
+    parser.add_argument('--stats', metavar='SEC', help='Print a line of replay telemetry (rates, lateness) every SEC seconds', type=float, default=0)
+    parser.add_argument('--statsFile', metavar='FILE', help='Write replay telemetry including a lateness histogram and per-aircraft rates as JSON to FILE at exit')
+    parser.add_argument('--compile', metavar='OUT_FILE', help='Compile the CSV input into a compact binary replay file OUT_FILE instead of sending. '
+        'Pass the binary file as inFile later to replay it without any text parsing.')
+    parser.add_argument('-v', '--verbose', help='Verbose output: Informs of each sent record', action='store_true')
+
+    args = parser.parse_args()
+    if args.inFile.count('-') > 1:
+        parser.error('<stdin> can only be read once')
+    if len(args.offset) > len(args.inFile):
+        parser.error('More --offset values than input files')
+    if args.speed < 0:
+        parser.error('--speed must not be negative')
+
+    # --- replay window: relative times refer to the earliest first record of all files ---
+    def firstTs():
+        if '-' in args.inFile:
+            parser.error('Relative --start/--end cannot be used with <stdin>')
+        offsets = args.offset + [0.0] * (len(args.inFile) - len(args.offset))
+        return min(firstTimestamp(p) + o for p, o in zip(args.inFile, offsets))
+    try:
+        args.start = parseTime(args.start, firstTs) if args.start else None
+        args.end = parseTime(args.end, firstTs) if args.end else None
+    except ValueError:
+        parser.error('Invalid --start/--end value')
+
+    # --- compile only? ---
+    if args.compile:
+        if len(args.inFile) != 1:
+            parser.error('--compile requires exactly one input file')
+        compileFile(args.inFile[0], args.compile)
+        return
+
+    # --- list of selected aircraft ---
+    _ac=[]
+
+    # convert hex ids to decimal numbers and add them to _ac
+    if args.aircraft is not None:
+        _ac += [int(h,16) for h in args.aircraft.split(',')]
+
+    # add the decimal-defined a/c, too
+    if args.aircraftDecimal is not None:
+        _ac += [int(n,0) for n in args.aircraftDecimal.split(',')]
+
+    # print list
+    if _ac and args.verbose:
+        print ("Selected aircraft: {}".format(_ac))
+
+    # --- open the UDP socket ---
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender = BatchSender(sock, args.host, args.port, not args.noBatch)
+
+    # Outer loop helps with endless looping
+    _stats = Telemetry()
+    nextReport = _stats.start + args.stats if args.stats else math.inf
+    _sendLn = 1
+    cache = ReplayCache(int(args.loopMem * 1024 * 1024)) if args.loop else None
+    try:
+        while 1:
+            _tsDiff = None
+            # --- open the input file(s), or use the cache when looping ---
+            fromCache = cache and cache.complete
+            if fromCache:
+                records = cache.replay()
+            else:
+                records = mergeRecords(args.inFile, args.offset, args.start, args.end)
+                if cache:
+                    records = cache.record(records)
+
+            # --- loop the records batch-wise as they become due ---
+            for due, batch in scheduleRecords(records):
+                sentAt = time.monotonic()
+                datagrams = []
+                for ts, hexId, head in batch:
+                    # Can be traffic or weather data
+                    if hexId is not None:
+                        sendTrafficData(ts, hexId, head, _sendLn, sentAt, datagrams)
+                        _sendLn = 1             # send all following lines
+                    else:
+                        sendWeatherData(head)
+                # send all traffic data of this tick at once
+                if datagrams:
+                    sender.send(datagrams)
+                    _stats.sent(datagrams)
+                # periodic telemetry
+                if sentAt >= nextReport:
+                    print (_stats.report())
+                    nextReport = sentAt + args.stats
+
+            # Endless loop?
+            if (not args.loop): break           # no, end replay
+            if args.verbose and not fromCache:
+                print (cache.info())
+            _sendLn = 0                         # don't send first position again
+            args.bufPeriod = 0                  # no buffering as we keep sending continuously
+    except KeyboardInterrupt:
+        pass
+
+    # --- Cleanup ---
+    sock.close()
+    summary = _stats.summary()
+    if args.verbose and _stats.numRecords:
+        late = summary['lateness']
+        print ("Sent {} records, lateness: avg {:.3f}s, p99 <{:.3f}s, max {:.3f}s".format(
+            _stats.numRecords, late['avg_s'], late['p99_s'], late['max_s']))
+        print ("Sent {} datagrams in {} system calls, saved {} calls".format(sender.numDatagrams, sender.numSyscalls, sender.syscallsSaved))
+    if args.verbose or args.speed == 0:
+        print ("Replayed {} datagrams in {:.3f}s: {:.0f} datagrams/s".format(
+            summary['datagrams'], summary['elapsed_s'], summary['datagrams_per_s']))
+    if args.statsFile:
+        summary['syscalls'] = sender.numSyscalls
+        summary['syscallsSaved'] = sender.syscallsSaved
+        with open(args.statsFile, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/python3
+
+"""
+Rewrites an ADS-B Exchange historical data set into geographic tiles.
+
+LiveTraffic's "ADS-B Exchange Historic" channel reads every minute file
+in full and then discards everything outside its bounding box.
+Each tile written here holds only the aircraft in and around a lat/lon
+grid cell, in the very same file layout and naming:
+    <outDir>/<tile>/yyyy-mm-dd/yyyy-mm-dd-hhmmZ.json
+so that a tile directory can be used as 'Custom Data/ADSB' directly.
+
+For usage info call
+    python3 TileADSBExHist.py -h
+
+
+MIT License
+
+Copyright (c) 2021 B.Hoppe
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os
+import io
+import json
+import math
+import multiprocessing
+import argparse                     # handling command line arguments
+from pathlib import Path
+
+from SendTraffic import openInput
+from ConvADSBExHist import iterJsonArray, listInputs, KM_PER_DEG_LAT, RE_HIST_FILE
+
+# First and last line of a file, the first line must end with ADSBEX_HIST_LN1_END, the last start with ADSBEX_HIST_LAST_LN
+_HIST_HEAD = '{"src":1,"feeds":[{"id":1,"name":"From Consolidator","polarPlot":false}],"srcFeed":1,"showSil":true,"showFlg":true,"showPic":true,"flgH":20,"flgW":85,"acList":[\n'
+_HIST_TAIL = '],"totalAc":{}}}\n'
+
+""" === Tile grid ===
+    Tiles are named after their south-west corner, like N50E005 or S35W075.
+    An aircraft is put into all tiles, which it is within 'margin' of,
+    so that a session anywhere in a tile sees all aircraft up to 'margin' around it.
+"""
+def tileName(latIdx: int, lonIdx: int, size: int) -> str:
+    lat = latIdx * size
+    lon = lonIdx * size
+    return '{}{:02d}{}{:03d}'.format('N' if lat >= 0 else 'S', abs(lat),
+                                         'E' if lon >= 0 else 'W', abs(lon))
+
+def tilesFor(lat: float, lon: float, size: int, margin_km: float) -> list:
+    dLat = margin_km / KM_PER_DEG_LAT
+    dLon = margin_km / (KM_PER_DEG_LAT * max(math.cos(math.radians(lat)), 0.01))
+    numLon = 360 // size
+    latIdx = range(math.floor(max(lat - dLat, -90.0) / size),
+                   math.floor(min(lat + dLat, 90.0 - 1e-9) / size) + 1)
+    lonIdx = {(i + numLon // 2) % numLon - numLon // 2         # wrap around the antimeridian
+              for i in range(math.floor((lon - dLon) / size), math.floor((lon + dLon) / size) + 1)}
+    return [tileName(a, o, size) for a in latIdx for o in sorted(lonIdx)]
+
+""" === Split one historic minute file into tiles ===
+    The aircraft lines are copied as they are (pretty-printed input is compacted),
+    one aircraft per line, as LiveTraffic expects them.
+"""
+def writeTile(path: Path, lines: list):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmpPath = path.with_name(path.name + '.tmp')
+    with open(tmpPath, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(_HIST_HEAD)
+        f.write(',\n'.join(lines))
+        if lines:
+            f.write('\n')
+        f.write(_HIST_TAIL.format(len(lines)))
+    os.replace(tmpPath, path)
+
+def tileFile(task: tuple) -> tuple:
+    path, outDir, size, margin = task
+    name = Path(path).name
+    m = RE_HIST_FILE.search(name)
+    dateDir = '{}-{}-{}'.format(*m.groups()[:3])
+    outName = m.group(0) + '.json'              # drop any compression suffix
+
+    tiles = {}                                  # tile name -> list of aircraft lines
+    numAc = 0
+    with io.TextIOWrapper(openInput(path), encoding='utf-8') as f:
+        for ac, txt in iterJsonArray(f, 'acList', raw=True):
+            # position as LiveTraffic's FetchAllData takes it: Lat/Long or first trail point
+            lat, lon = ac.get('Lat'), ac.get('Long')
+            if lat is None or lon is None:
+                cos = ac.get('Cos')
+                if not cos or len(cos) < 2:
+                    continue
+                lat, lon = cos[0], cos[1]
+            if '\n' in txt:
+                txt = json.dumps(ac, separators=(',', ':'), ensure_ascii=False)
+            numAc += 1
+            for t in tilesFor(lat, lon, size, margin):
+                tiles.setdefault(t, []).append(txt)
+
+    for t, lines in tiles.items():
+        writeTile(Path(outDir) / t / dateDir / outName, lines)
+    return path, dateDir, outName, numAc, len(tiles)
+
+""" === MAIN === """
+def main():
+    # --- Handling command line argumens ---
+    parser = argparse.ArgumentParser(description='TileADSBExHist 1.0.0: Rewrites ADS-B Exchange historic data files into geographic tiles of the same format and naming. '
+        'Point LiveTraffic\'s \'Custom Data/ADSB\' to the tile directory containing your position (e.g. by a symbolic link), '
+        'so that it reads only the data around you.',fromfile_prefix_chars='@')
+    parser.add_argument('inFile', help='ADS-B Exchange historic files (yyyy-mm-dd-hhmmZ.json), optionally compressed, or directories thereof', nargs='+')
+    parser.add_argument('-o', '--outDir', metavar='DIR', help='Output directory, one subdirectory per tile, defaults to \'tiles\'', default='tiles')
+    parser.add_argument('--tileSize', metavar='DEG', help='Size of a tile in full degrees latitude and longitude, must divide 180, defaults to 5', type=int, default=5)
+    parser.add_argument('--margin', metavar='KM', help='Aircraft up to this distance outside a tile are included in the tile, '
+        'should be at least LiveTraffic\'s search distance, defaults to 100', type=float, default=100.0)
+    parser.add_argument('-j', '--jobs', metavar='NUM', help='Number of worker processes, defaults to one per CPU', type=int)
+    parser.add_argument('-v', '--verbose', help='Verbose output: Informs about each processed file', action='store_true')
+
+    args = parser.parse_args()
+    if args.tileSize <= 0 or 180 % args.tileSize:
+        parser.error('--tileSize must divide 180')
+
+    # only historic files with proper names
+    paths = [p for p in listInputs(args.inFile) if RE_HIST_FILE.search(Path(p).name)]
+    if not paths:
+        parser.error('No historic files (yyyy-mm-dd-hhmmZ.json) found')
+
+    # --- split all files into tiles ---
+    minutes = set()                             # (date dir, file name) of all processed minutes
+    numAc = numTiled = 0
+    tasks = [(p, args.outDir, args.tileSize, args.margin) for p in paths]
+    with multiprocessing.Pool(args.jobs) as pool:
+        for n, (path, dateDir, outName, nAc, nTiles) in enumerate(pool.imap_unordered(tileFile, tasks), 1):
+            minutes.add((dateDir, outName))
+            numAc += nAc
+            if args.verbose:
+                print ("{}: {} aircraft into {} tiles".format(path, nAc, nTiles))
+            else:
+                print ("\r{}/{} files tiled".format(n, len(paths)), end='')
+    if not args.verbose:
+        print ("")
+
+    # --- LiveTraffic expects a file for every minute: fill gaps in tiles with empty files ---
+    numEmpty = 0
+    for tile in Path(args.outDir).iterdir():
+        if not tile.is_dir():
+            continue
+        for dateDir, outName in minutes:
+            f = tile / dateDir / outName
+            if not f.exists():
+                writeTile(f, [])
+                numEmpty += 1
+        numTiled += 1
+    print ("Tiled {} aircraft lines of {} files into {} tiles, added {} empty tile files".format(numAc, len(paths), numTiled, numEmpty))
+
+if __name__ == '__main__':
+    main()
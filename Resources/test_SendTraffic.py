@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+
+"""
+Regression tests for SendTraffic.py
+
+    python3 -m unittest test_SendTraffic
+
+
+MIT License
+
+Copyright (c) 2021 B.Hoppe
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import io
+import os
+import sys
+import time
+import tempfile
+import argparse
+import unittest
+from unittest import mock
+
+import SendTraffic
+
+WEATHER = b'QNH=1013.2\n'
+def aitfc(hexId: int, ts: float) -> bytes:
+    return 'AITFC,{},51.5,7.2,3000,0,1,90,250,DLH1,A320,D-AIAB,EDDF,EDDL,{}\n'.format(hexId, ts).encode('ascii')
+
+""" === Replay scheduling === """
+class ScheduleTest(unittest.TestCase):
+    def setUp(self):
+        SendTraffic.args = argparse.Namespace(bufPeriod=0, historic=0, speed=1.0, tick=0.01, verbose=False)
+        SendTraffic._tsDiff = None
+        self.waits = []
+        patcher = mock.patch.object(SendTraffic, 'waitUntil', self.waits.append)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def schedule(self, csv: bytes) -> list:
+        return list(SendTraffic.scheduleRecords(SendTraffic.readCsv(io.BytesIO(csv))))
+
+    # the time base comes from the first traffic record, not from a leading weather line
+    def testWeatherFirst(self):
+        batches = self.schedule(WEATHER + aitfc(1, 1600000000) + WEATHER + aitfc(1, 1600000001))
+        now = time.monotonic()
+        self.assertTrue(all(w < now + 5 for w in self.waits), self.waits)
+        self.assertEqual([len(b) for _, b in batches], [3, 1])
+        self.assertIsNone(batches[0][1][0][1])
+        self.assertEqual(batches[0][1][1][0], 1600000000)
+
+    def testWeatherOnly(self):
+        batches = self.schedule(WEATHER + WEATHER)
+        self.assertEqual([len(b) for _, b in batches], [2])
+        self.assertEqual(self.waits, [])
+
+    # as fast as possible: an aircraft's positions keep advancing, compressed timestamps
+    def testSpeed0Spacing(self):
+        SendTraffic.args.speed = 0.0
+        batches = self.schedule(b''.join(aitfc(1, 1600000000 + 10 * i) for i in range(5)))
+        ts = [rec[0] for _, b in batches for rec in b]
+        self.assertEqual(len(ts), 5)
+        for a, b in zip(ts, ts[1:]):
+            self.assertGreaterEqual(b - a, 10 / SendTraffic.SPEED0_FACTOR - 0.001)
+        self.assertTrue(all(w <= time.monotonic() for w in self.waits), self.waits)
+
+""" === Reading input files === """
+class ReadTest(unittest.TestCase):
+    def setUp(self):
+        SendTraffic.args = argparse.Namespace(verbose=False)
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, 'in.csv')
+        with open(self.path, 'wb') as f:
+            f.write(b''.join(aitfc(1, 1600000000 + 60 * i) for i in range(5)))
+
+    def testStartIndexed(self):
+        recs = list(SendTraffic.readRecords(self.path, 1600000120))
+        self.assertEqual([r[0] for r in recs], [1600000120, 1600000180, 1600000240])
+        self.assertTrue(os.path.exists(self.path + '.idx'))
+
+    # 'SendTraffic.py - < file.csv': stdin is seekable, but no '-.idx' must be written
+    def testStartStdin(self):
+        cwd = os.getcwd()
+        os.chdir(self.dir.name)
+        self.addCleanup(os.chdir, cwd)
+        with open(self.path, 'rb') as f, mock.patch.object(sys, 'stdin', mock.Mock(buffer=f)):
+            recs = list(SendTraffic.readRecords('-', 1600000120))
+        self.assertEqual([r[0] for r in recs], [1600000120, 1600000180, 1600000240])
+        self.assertEqual(os.listdir(self.dir.name), ['in.csv'])
+
+if __name__ == '__main__':
+    unittest.main()